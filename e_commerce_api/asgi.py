@@ -12,5 +12,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'e_commerce_api.settings')
+os.environ.setdefault('DJANGO_ASGI', '1')  # Routes catalog reads to the async views, see settings.py
 
 application = get_asgi_application()
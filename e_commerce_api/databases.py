@@ -0,0 +1,98 @@
+"""
+Database profiles for settings.DATABASES.
+
+Pick one with DJANGO_DB_PROFILE:
+
+* ``sqlite`` (default): db.sqlite3 in WAL mode, tuned for a single server with
+  concurrent readers and writers.
+* ``sqlite-baseline``: Django's stock SQLite settings, kept for benchmarking.
+* ``postgres``: PostgreSQL from DJANGO_DB_NAME, DJANGO_DB_USER, DJANGO_DB_PASSWORD,
+  DJANGO_DB_HOST and DJANGO_DB_PORT. DJANGO_DB_POOL picks the pooling: ``psycopg``
+  (the default; an in-process psycopg pool, needs psycopg[pool]), ``pgbouncer`` (a
+  server-side pooler at DJANGO_DB_HOST, running in transaction mode) or ``none``.
+  Set DJANGO_DB_REPLICA_HOST to add a ``replica`` alias for catalog reads, see
+  products/routers.py.
+"""
+
+import os
+
+REPLICA_ALIAS = 'replica'
+
+# Applied to every new SQLite connection
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',  # Readers no longer wait for writers, and the reverse
+    'synchronous': 'NORMAL',  # Safe with WAL; fsync happens at checkpoints instead of every commit
+    'mmap_size': 256 * 1024 * 1024,  # Read pages through the OS page cache instead of copying them
+    'busy_timeout': 5000,  # Milliseconds a writer waits for the lock before "database is locked"
+}
+
+# Seconds a WSGI worker thread keeps its connection between requests
+PERSISTENT_CONN_MAX_AGE = 60
+
+
+def sqlite_database(name, tuned=True, asgi=False):
+    if not tuned:
+        return {'ENGINE': 'django.db.backends.sqlite3', 'NAME': name}
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {pragma}={value}' for pragma, value in SQLITE_PRAGMAS.items()),
+            # Take the write lock when the transaction starts, so busy_timeout applies instead
+            # of a read transaction failing outright when it later tries to write
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # ASGI runs each request's sync code on a fresh thread, so per-thread
+        # connections would pile up there; opening a SQLite file is cheap anyway
+        'CONN_MAX_AGE': 0 if asgi else PERSISTENT_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+    }
+
+
+def postgres_database(env, pool='psycopg', host=None):
+    database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': env.get('DJANGO_DB_NAME', 'e_commerce'),
+        'USER': env.get('DJANGO_DB_USER', ''),
+        'PASSWORD': env.get('DJANGO_DB_PASSWORD', ''),
+        'HOST': host or env.get('DJANGO_DB_HOST', ''),
+        'PORT': env.get('DJANGO_DB_PORT', ''),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    }
+    if pool == 'psycopg':
+        # The pool hands connections back after each request; Django requires CONN_MAX_AGE=0 with it
+        database['OPTIONS']['pool'] = {
+            'min_size': int(env.get('DJANGO_DB_POOL_MIN', 2)),
+            'max_size': int(env.get('DJANGO_DB_POOL_MAX', 20)),
+            'timeout': 10,
+        }
+        database['CONN_MAX_AGE'] = 0
+    elif pool == 'pgbouncer':
+        # Transaction pooling can hand each transaction a different server connection,
+        # which named server-side cursors do not survive
+        database['DISABLE_SERVER_SIDE_CURSORS'] = True
+        database['CONN_MAX_AGE'] = PERSISTENT_CONN_MAX_AGE
+    elif pool == 'none':
+        database['CONN_MAX_AGE'] = PERSISTENT_CONN_MAX_AGE
+    else:
+        raise ValueError(f'Unknown DJANGO_DB_POOL: {pool}')
+    return database
+
+
+def database_settings(profile, sqlite_name, asgi=False, env=os.environ):
+    """DATABASES for a profile name"""
+    if profile == 'sqlite':
+        return {'default': sqlite_database(sqlite_name, asgi=asgi)}
+    if profile == 'sqlite-baseline':
+        return {'default': sqlite_database(sqlite_name, tuned=False)}
+    if profile == 'postgres':
+        pool = env.get('DJANGO_DB_POOL', 'psycopg')
+        databases = {'default': postgres_database(env, pool)}
+        if env.get('DJANGO_DB_REPLICA_HOST'):
+            databases[REPLICA_ALIAS] = {
+                **postgres_database(env, pool, host=env['DJANGO_DB_REPLICA_HOST']),
+                'TEST': {'MIRROR': 'default'},
+            }
+        return databases
+    raise ValueError(f'Unknown DJANGO_DB_PROFILE: {profile}')
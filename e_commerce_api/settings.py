@@ -1,6 +1,8 @@
 from pathlib import Path
 import os
 
+from .databases import database_settings
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -34,19 +36,36 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Request profiling: Server-Timing headers, Prometheus metrics at /metrics and sampled
+# cProfile captures of slow requests (see products/profiling.py)
+PROFILING_ENABLED = os.environ.get('DJANGO_PROFILING') == '1'
+PROFILING_SAMPLE_RATE = float(os.environ.get('DJANGO_PROFILING_SAMPLE_RATE', 0.01))
+PROFILING_SLOW_REQUEST_MS = 500
+PROFILING_PROFILE_DIR = BASE_DIR / 'profiles'
+if PROFILING_ENABLED:
+    # First, so its timings include the rest of the middleware
+    MIDDLEWARE.insert(0, 'products.profiling.ProfilingMiddleware')
+
 ROOT_URLCONF = 'e_commerce_api.urls'
 
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],  # Ensure this is where your templates are stored
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'products.fragments.fragment_cache',
+            ],
+            # Parse each template once per process; runserver still reloads edited templates
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
             ],
         },
     },
@@ -54,17 +73,105 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'e_commerce_api.wsgi.application'
 
-# Database settings (default is SQLite, which is good for development)
-DATABASES = {
+# Set by e_commerce_api/asgi.py. Under ASGI the catalog reads are routed to the async
+# views in products/async_views.py.
+ASGI_DEPLOYMENT = os.environ.get('DJANGO_ASGI') == '1'
+
+# Database settings, picked by DJANGO_DB_PROFILE (see e_commerce_api/databases.py).
+# The default is db.sqlite3 in WAL mode; 'postgres' reads the DJANGO_DB_* variables.
+DATABASE_PROFILE = os.environ.get('DJANGO_DB_PROFILE', 'sqlite')
+DATABASES = database_settings(DATABASE_PROFILE, BASE_DIR / 'db.sqlite3', asgi=ASGI_DEPLOYMENT)
+
+# Sends product list and detail GETs to DATABASES['replica'] when it is configured
+DATABASE_ROUTERS = ['products.routers.ReplicaRouter']
+
+# Caches. The 'products' cache holds product catalog reads: detail payloads, list pages
+# and their ETag validators (see products/cache.py); 'template_fragments' holds {% cache %}
+# fragments and the dashboard versions (see products/fragments.py). Writes invalidate
+# them on commit in the process that made the write only, so with more than one worker
+# they have to be shared: DJANGO_CACHE_REDIS_URL (e.g. 'redis://127.0.0.1:6379') keeps
+# every cache below in Redis. Without it each process has its own LocMem caches, and
+# the catalog and fragment timeouts drop to LOCAL_CACHE_TIMEOUT: that is how long
+# another worker can answer with a stale body, or a 304 for an ETag that has changed.
+CACHE_REDIS_URL = os.environ.get('DJANGO_CACHE_REDIS_URL')
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',  # Path to SQLite file
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'products': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'products',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # {% cache %} fragments: product cards and dashboard sections (see products/fragments.py)
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'template_fragments',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+if CACHE_REDIS_URL:
+    CACHES = {
+        alias: {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_REDIS_URL, 'KEY_PREFIX': alias}
+        for alias in CACHES
     }
+LOCAL_CACHE_TIMEOUT = 10
+SHARED_CACHE_TIMEOUT = 300  # Invalidation is signal-driven, so with a shared cache this only bounds memory
+TEMPLATE_FRAGMENT_TIMEOUT = SHARED_CACHE_TIMEOUT if CACHE_REDIS_URL else LOCAL_CACHE_TIMEOUT
+PRODUCT_CACHE_ALIAS = 'products'
+PRODUCT_CACHE_TIMEOUT = SHARED_CACHE_TIMEOUT if CACHE_REDIS_URL else LOCAL_CACHE_TIMEOUT
+
+# API throttling: token buckets per client and per endpoint scope, kept in a memory-mapped
+# file every worker process on the host shares (see products/throttling.py)
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'products.authentication.SignedTokenAuthentication',  # Stateless, see products/authentication.py
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'products.throttling.ClientRateThrottle',
+        'products.throttling.EndpointRateThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'client': '1200/min',  # Every API request of one user or address
+        'users': '60/min:20',
+        'products': '600/min',
+        'orders': '300/min',
+        'cart': '300/min',
+        'exports': '10/hour:2',  # Each one streams a whole table
+        'tokens': '30/min:10',  # Each one hashes a password
+    },
 }
+THROTTLE_STORE_PATH = os.environ.get('DJANGO_THROTTLE_STORE', str(BASE_DIR / 'throttle.buckets'))
+THROTTLE_STORE_SLOTS = 65536  # 24 bytes each; clients beyond this share slots and get full buckets more often
+
+CART_HOLD_TTL = 600  # Seconds a cart hold keeps stock aside before sweep_holds gives it back
 
 # Custom user model (adjust based on your app)
 AUTH_USER_MODEL = 'products.CustomUser'  # Make sure CustomUser model exists in products app
 
+# has_perm() answered from cached permission bitsets, see products/permissions.py
+AUTHENTICATION_BACKENDS = ['products.permissions.PermissionBitsetBackend']
+# Revoking a permission only clears the revoking process's LocMem cache, so unshared
+# caches keep it for LOCAL_CACHE_TIMEOUT at most
+PERMISSION_CACHE_TIMEOUT = 3600 if CACHE_REDIS_URL else LOCAL_CACHE_TIMEOUT
+
+API_TOKEN_MAX_AGE = 86400  # Seconds a bearer token from api/v1/auth/token/ stays valid
+API_USER_CACHE_TTL = 60  # Seconds a token's user is served from a process's LRU; bounds how long other processes see stale users
+
+# Sessions: kept in the database table unless DJANGO_SESSION_BACKEND picks another
+# engine. cached_db reads from SESSION_CACHE_ALIAS and writes through to the table;
+# it is the default only when that cache is shared between processes, since with a
+# per-process LocMem cache one worker keeps serving a session another has ended.
+# signed_cookies keeps sessions in the client's cookie, so logging in writes no
+# session row at all.
+SESSION_CACHE_ALIAS = 'default'
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get(
+    'DJANGO_SESSION_BACKEND',
+    'db' if CACHES[SESSION_CACHE_ALIAS]['BACKEND'].endswith('.LocMemCache') else 'cached_db',
+)
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -104,6 +211,19 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # Where user-uploaded files will be stored
 
+# Production assets: collectstatic writes content-hashed, precompressed copies to
+# STATIC_ROOT and StaticFilesMiddleware serves them and the media files in-process
+# (see products/staticfiles.py). On by default when DEBUG is off.
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+SERVE_STATIC = os.environ.get('DJANGO_SERVE_STATIC', '0' if DEBUG else '1') == '1'
+if SERVE_STATIC:
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'products.staticfiles.CompressedManifestStaticFilesStorage'},
+    }
+    # Right after SecurityMiddleware, so assets still get its headers but skip everything else
+    MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1, 'products.staticfiles.StaticFilesMiddleware')
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
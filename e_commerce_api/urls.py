@@ -2,7 +2,10 @@
 from django.contrib import admin
 from django.urls import path,include
 
+from products.profiling import metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
      path('products/', include('products.urls')), 
+     path('metrics', metrics, name='metrics'),
  ]
@@ -24,11 +24,17 @@ class CategoryAdmin(admin.ModelAdmin):
 
 # Custom admin for Product
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'category', 'price', 'stock_quantity')
+    list_display = ('name', 'category', 'price', 'stock_quantity', 'held_quantity')
     search_fields = ('name', 'category__name')
     list_filter = ('category',)
     ordering = ('-price',)
 
+# Custom admin for Order
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'product', 'quantity', 'total_price', 'status', 'order_date')
+    list_filter = ('status',)
+    list_select_related = ('user', 'product')
+
 # Custom admin for CustomUser
 class CustomUserAdmin(UserAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff')
@@ -38,7 +44,7 @@ class CustomUserAdmin(UserAdmin):
 # Register models with the admin site
 admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(Product, ProductAdmin)
-admin.site.register(Category, 
-admin.site.register(Order))
+admin.site.register(Category, CategoryAdmin)
+admin.site.register(Order, OrderAdmin)
 
 
@@ -0,0 +1,241 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, When
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import DailySales, Order, OrderStatusCount, Product, RollupDelta
+from .signals import orders_created
+
+# Sales and inventory analytics for the admin dashboard.
+#
+# Order writes never touch DailySales or OrderStatusCount, so checkouts of one product
+# do not queue up on its day's row. The Order signal receivers below instead append
+# what each write adds to and takes from the rollups to the RollupDelta queue: one
+# INSERT, with the state a save replaces taken from Order.from_db. refresh() (the
+# refresh_analytics command, run every minute or so) folds the queue in with one
+# GROUP BY per batch; refresh(full=True) rebuilds the rollups from Order, the catch-up
+# path for writes that skip signals (bulk_create, queryset updates). Reads only touch
+# the rollups, so they cost the same whatever the order history size.
+
+LOW_STOCK_THRESHOLD = getattr(settings, 'LOW_STOCK_THRESHOLD', 5)
+LOW_STOCK_LIMIT = 20
+SUMMARY_DAYS = 30
+TOP_PRODUCTS = 10
+REFRESH_BATCH_SIZE = 5000
+# (day, product) buckets matched per statement; SQLite rejects OR chains much over 1000 deep
+MATCH_CHUNK_SIZE = 200
+
+# A save touching none of these leaves the rollups alone
+TRACKED_FIELDS = {'product', 'product_id', 'quantity', 'total_price', 'status', 'order_date'}
+
+STATE_FIELDS = Order.ROLLUP_FIELDS
+
+
+def order_state(order_date, product_id, status, quantity, total_price):
+    """What one order contributes to the rollups"""
+    return timezone.localdate(order_date), product_id, status, quantity, Decimal(total_price)
+
+
+def tracks(update_fields):
+    return update_fields is None or bool(TRACKED_FIELDS & set(update_fields))
+
+
+def queue_changes(removed=(), added=()):
+    """Queue taking the removed order states off the rollups and adding the added ones"""
+    RollupDelta.objects.bulk_create([
+        RollupDelta(
+            day=day, product_id=product_id, status=status,
+            orders=sign, quantity=sign * quantity, revenue=sign * total_price,
+        )
+        for sign, states in ((-1, removed), (1, added))
+        for day, product_id, status, quantity, total_price in states
+    ])
+
+
+def add_deltas(model, rows):
+    """Add {field: delta} to each row matching its Q, all in one UPDATE"""
+    fields = {field for _, deltas in rows for field in deltas}
+    model.objects.filter(reduce(or_, (match for match, _ in rows))).update(**{
+        field: Case(
+            *(When(match, then=F(field) + deltas[field]) for match, deltas in rows if deltas.get(field)),
+            default=F(field),
+        )
+        for field in fields
+    })
+
+
+def apply_deltas(sales, statuses):
+    """Add {(day, product_id): {'orders', 'quantity', 'revenue'}} and {status: count} deltas to the rollups
+
+    Missing rows are inserted empty (ignoring rows created concurrently) and every
+    delta is then applied by one UPDATE per table and MATCH_CHUNK_SIZE buckets, so the
+    query count does not grow with the number of orders.
+    """
+    sales = [(key, deltas) for key, deltas in sales.items() if any(deltas.values())]
+    statuses = {status: delta for status, delta in statuses.items() if delta}
+    for start in range(0, len(sales), MATCH_CHUNK_SIZE):
+        apply_sales(dict(sales[start:start + MATCH_CHUNK_SIZE]))
+    if statuses:
+        OrderStatusCount.objects.bulk_create(
+            [OrderStatusCount(status=status) for status in statuses], ignore_conflicts=True,
+        )
+        add_deltas(OrderStatusCount, [(Q(status=status), {'count': delta}) for status, delta in statuses.items()])
+
+
+def apply_sales(sales):
+    """apply_deltas() for one chunk of DailySales deltas"""
+    rows = [(Q(day=day, product_id=product_id), deltas) for (day, product_id), deltas in sales.items()]
+    existing = set(DailySales.objects.filter(reduce(or_, (match for match, _ in rows))).values_list('day', 'product_id'))
+    # Buckets only losing orders are not created: a missing one has nothing to subtract
+    # from, and recreating it would break deleting a product along with its orders
+    missing = {key for key, deltas in sales.items() if deltas['orders'] >= 0} - existing
+    if missing:
+        categories = dict(
+            Product.objects.filter(pk__in={product_id for _, product_id in missing}).values_list('pk', 'category_id')
+        )
+        DailySales.objects.bulk_create(
+            [
+                DailySales(day=day, product_id=product_id, category_id=categories[product_id])
+                for day, product_id in missing if product_id in categories
+            ],
+            ignore_conflicts=True,
+        )
+    add_deltas(DailySales, rows)
+
+
+# ================== Change queue ==================
+
+@receiver(pre_save, sender=Order)
+def remember_counted_state(sender, instance, update_fields=None, **kwargs):
+    # Order.from_db keeps the loaded state; only orders loaded with deferred fields are read again
+    if instance._state.adding or not tracks(update_fields) or '_loaded_rollup_state' in instance.__dict__:
+        return
+    instance._loaded_rollup_state = Order.objects.filter(pk=instance.pk).values_list(*STATE_FIELDS).first()
+
+@receiver(post_save, sender=Order)
+def queue_saved_order(sender, instance, created, update_fields=None, **kwargs):
+    if not tracks(update_fields):
+        return
+    loaded = None if created else instance.__dict__.get('_loaded_rollup_state')
+    values = tuple(getattr(instance, field) for field in STATE_FIELDS)
+    instance._loaded_rollup_state = values
+    previous, state = order_state(*loaded) if loaded else None, order_state(*values)
+    if state != previous:
+        queue_changes(removed=[previous] if previous else [], added=[state])
+
+@receiver(post_delete, sender=Order)
+def queue_deleted_order(sender, instance, **kwargs):
+    queue_changes(removed=[order_state(*(getattr(instance, field) for field in STATE_FIELDS))])
+
+@receiver(orders_created)
+def queue_created_orders(sender, orders, **kwargs):
+    queue_changes(added=[order_state(*(getattr(order, field) for field in STATE_FIELDS)) for order in orders])
+
+
+# ================== Refresh ==================
+
+def fold_queue(batch_size=REFRESH_BATCH_SIZE):
+    """Apply queued deltas to the rollups, batch_size at a time; returns how many were folded in"""
+    folded = 0
+    while True:
+        with transaction.atomic():
+            # Skipping locked rows keeps concurrent refreshes from folding a delta twice
+            ids = list(
+                RollupDelta.objects.select_for_update(skip_locked=True).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            batch = RollupDelta.objects.filter(pk__in=ids)
+            sales = {
+                (row['day'], row['product_id']): {'orders': row['orders'], 'quantity': row['quantity'], 'revenue': row['revenue']}
+                for row in batch.values('day', 'product_id').annotate(
+                    orders=Sum('orders'), quantity=Sum('quantity'), revenue=Sum('revenue'),
+                ).order_by()
+            }
+            statuses = dict(batch.values_list('status').annotate(count=Sum('orders')).order_by())
+            apply_deltas(sales, statuses)
+            batch.delete()
+        folded += len(ids)
+    return folded
+
+
+def rebuild():
+    """Recompute every rollup from Order and drop the queue; returns the number of DailySales buckets"""
+    with transaction.atomic():
+        RollupDelta.objects.all().delete()
+        DailySales.objects.all().delete()
+        rows = (
+            Order.objects.annotate(day=TruncDate('order_date'))
+            .values('day', 'product_id', 'product__category_id')
+            .annotate(orders=Count('pk'), quantity=Sum('quantity'), revenue=Sum('total_price'))
+            .order_by()
+        )
+        sales = DailySales.objects.bulk_create(
+            [
+                DailySales(
+                    day=row['day'], product_id=row['product_id'], category_id=row['product__category_id'],
+                    orders=row['orders'], quantity=row['quantity'], revenue=row['revenue'],
+                )
+                for row in rows
+            ],
+            batch_size=REFRESH_BATCH_SIZE,
+        )
+        OrderStatusCount.objects.all().delete()
+        OrderStatusCount.objects.bulk_create(
+            OrderStatusCount(status=status, count=count)
+            for status, count in Order.objects.values_list('status').annotate(count=Count('pk')).order_by()
+        )
+    return len(sales)
+
+
+def refresh(full=False):
+    """Bring the rollups up to date: fold in the queued deltas, or with full=True rebuild them from Order
+
+    Returns the number of deltas folded in, or the number of DailySales buckets rebuilt.
+    """
+    return rebuild() if full else fold_queue()
+
+
+# ================== Reads ==================
+
+def summary(days=SUMMARY_DAYS):
+    """Dashboard numbers for the last `days` days, read from the rollups only"""
+    today = timezone.localdate()
+    since = today - timedelta(days=days - 1)
+    # A closed range lets SQLite pick the day index over scanning the whole table
+    sales = DailySales.objects.filter(day__range=(since, today))
+    totals = {'total_orders': Sum('orders'), 'total_quantity': Sum('quantity'), 'total_revenue': Sum('revenue')}
+    # Names are joined on for the top rows only
+    top_products = list(sales.values('product').annotate(**totals).order_by('-total_revenue', 'product')[:TOP_PRODUCTS])
+    names = dict(Product.objects.filter(pk__in=[row['product'] for row in top_products]).values_list('pk', 'name'))
+    for row in top_products:
+        row['product__name'] = names.get(row['product'], '')
+    return {
+        'since': since,
+        'totals': {key: value or 0 for key, value in sales.aggregate(**totals).items()},
+        'by_day': list(sales.values('day').annotate(**totals).order_by('day')),
+        'by_category': list(
+            sales.values('category', 'category__name').annotate(**totals).order_by('-total_revenue', 'category')
+        ),
+        'top_products': top_products,
+        'statuses': dict(OrderStatusCount.objects.filter(count__gt=0).values_list('status', 'count')),
+        'low_stock': list(low_stock()),
+    }
+
+
+def low_stock(threshold=LOW_STOCK_THRESHOLD, limit=LOW_STOCK_LIMIT):
+    """Products closest to running out, read off product_stock_idx"""
+    return (
+        Product.objects.filter(stock_quantity__lte=threshold)
+        .order_by('stock_quantity', 'id')
+        .values('id', 'name', 'stock_quantity')[:limit]
+    )
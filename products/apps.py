@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'products'
+
+    def ready(self):
+        # Register the signal receivers that keep the search index, catalog listings, product cache,
+        # analytics rollups, image variants, cached template fragments, order status outbox,
+        # permission bitsets and cached users in sync
+        from . import search, listings, cache, analytics, images, fragments, transitions, permissions, authentication  # noqa: F401
@@ -0,0 +1,188 @@
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage, Paginator
+from django.http import HttpResponse
+from django.shortcuts import render
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, Throttled, ValidationError
+
+from . import cache as product_cache
+from . import profiling
+from . import views
+from .conditional import LIST_STATE, detail_state, list_state, make_validators, set_validator_headers
+from .models import Product, ProductListing
+from .renderers import FastJSONRenderer
+from .routers import read_from_replica
+from .serializers import ValuesListSerializer
+
+# Async versions of the catalog read paths, routed in place of the sync views when
+# the project is served over ASGI (see e_commerce_api/asgi.py).
+#
+# The API views answer JSON GETs of the product list and detail with the async ORM,
+# sharing cache entries and producing the same bytes and ETags as the DRF views.
+# Everything else (writes, cursor pagination, the browsable API, invalid filters or
+# pages) is handed to the DRF view, which Django runs in a worker thread.
+#
+# The product cache is process-local (LocMemCache), so it is read inline.
+
+
+def wants_json(request):
+    format = request.GET.get('format')
+    if format is not None:
+        return format == 'json'
+    accept = request.headers.get('Accept', '*/*')
+    return 'text/html' not in accept and ('application/json' in accept or '*/*' in accept)
+
+
+async def delegate(view_class, request, **kwargs):
+    return await sync_to_async(view_class.as_view())(request, **kwargs)
+
+
+async def authenticated_view(view_class, request, **kwargs):
+    """view_class set up as DRF's dispatch() does, with request.user already authenticated
+
+    The throttles then key users as the sync views do. Authenticators may query the
+    database, so they run in a worker thread.
+    """
+    view = view_class(args=(), kwargs=kwargs, format_kwarg=None)
+    view.request = view.initialize_request(request)
+    await sync_to_async(view.perform_authentication)(view.request)
+    return view
+
+
+async def counted_paginator(queryset, per_page):
+    """A Paginator whose count was read with the async ORM, so paging it never queries synchronously"""
+    paginator = Paginator(queryset, per_page)
+    paginator.count = await queryset.acount()
+    return paginator
+
+
+def json_response(data, view):
+    # The headers DRF's finalize_response would add
+    with profiling.timing('serialize'):
+        content = FastJSONRenderer().render(data)
+    response = HttpResponse(content, content_type='application/json')
+    response['Allow'] = ', '.join(view.allowed_methods)
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+def throttled_response(view):
+    """DRF's 429 when one of view's throttles refuses the request, else None"""
+    try:
+        view.check_throttles(view.request)
+    except Throttled as exc:
+        response = json_response({'detail': exc.detail}, view)
+        response.status_code = exc.status_code
+        response['Retry-After'] = '%d' % exc.wait
+        return response
+    return None
+
+
+async def paginated_data(view, queryset):
+    """ProductList.list() data for the requested page, or None when the page is invalid"""
+    request = view.request
+    fast = ValuesListSerializer(view.get_serializer_class(), {'request': request})
+    pagination = view.pagination_class()
+    paginator = await counted_paginator(fast.values(queryset), pagination.get_page_size(request))
+    try:
+        page = paginator.page(pagination.get_page_number(request, paginator))
+    except InvalidPage:
+        return None
+    rows = [row async for row in page.object_list]
+    pagination.page, pagination.request = page, request
+    return pagination.get_paginated_response(fast.to_representation(rows)).data
+
+
+@csrf_exempt  # Like every DRF view; the delegated DRF view enforces CSRF for session users
+async def product_list_api(request):
+    if request.method != 'GET' or 'cursor' in request.GET or not wants_json(request):
+        return await delegate(views.ProductList, request)
+    with read_from_replica():
+        return await cached_product_list(request)
+
+
+async def cached_product_list(request):
+    try:
+        view = await authenticated_view(views.ProductList, request)
+    except APIException:
+        return await delegate(views.ProductList, request)  # The DRF 401
+    try:
+        # django-filter validates a category id against the database
+        queryset = await sync_to_async(view.filter_queryset)(view.get_queryset())
+    except ValidationError:
+        return await delegate(views.ProductList, request)
+    # Only checked once nothing is left to hand to the DRF view, which checks again
+    throttled = throttled_response(view)
+    if throttled is not None:
+        return throttled
+
+    key = product_cache.list_key(view.request)
+    state = product_cache.get_payload(key + ':validators')
+    if state is None:
+        state = list_state(await queryset.aaggregate(**LIST_STATE))
+        product_cache.set_payload(key + ':validators', state)
+    validators = make_validators('json', state)
+    response = get_conditional_response(request, etag=validators[0], last_modified=validators[1])
+    if response is None:
+        data = product_cache.get_payload(key)
+        if data is None:
+            data = await paginated_data(view, queryset)
+            if data is None:
+                return await delegate(views.ProductList, request)
+            product_cache.set_payload(key, data)
+        response = json_response(data, view)
+    set_validator_headers(response, validators)
+    return response
+
+
+@csrf_exempt
+async def product_detail_api(request, pk):
+    if request.method != 'GET' or not wants_json(request):
+        return await delegate(views.ProductDetail, request, pk=pk)
+    with read_from_replica():
+        return await cached_product_detail(request, pk)
+
+
+async def cached_product_detail(request, pk):
+    try:
+        view = await authenticated_view(views.ProductDetail, request, pk=pk)
+    except APIException:
+        return await delegate(views.ProductDetail, request, pk=pk)  # The DRF 401
+    # Before any query; a missing product is then charged again by the DRF view's 404
+    throttled = throttled_response(view)
+    if throttled is not None:
+        return throttled
+
+    state = product_cache.get_payload(product_cache.validators_key(pk))
+    if state is None:
+        state = detail_state(pk, await Product.objects.filter(pk=pk).values_list('updated_date', flat=True).afirst())
+        if state is None:
+            return await delegate(views.ProductDetail, request, pk=pk)  # The DRF 404
+        product_cache.set_payload(product_cache.validators_key(pk), state)
+    validators = make_validators('json', state)
+    response = get_conditional_response(request, etag=validators[0], last_modified=validators[1])
+    if response is None:
+        data = product_cache.get_detail(view.request, pk)
+        if data is None:
+            fast = ValuesListSerializer(view.get_serializer_class(), {'request': view.request})
+            row = await fast.values(Product.objects.filter(pk=pk)).afirst()
+            if row is None:
+                return await delegate(views.ProductDetail, request, pk=pk)
+            data = fast.to_representation([row])[0]
+            product_cache.set_detail(view.request, pk, data)
+        response = json_response(data, view)
+    set_validator_headers(response, validators)
+    return response
+
+
+async def product_list(request):
+    paginator = await counted_paginator(ProductListing.objects.order_by('-created_date', '-id'), views.PRODUCT_LIST_PAGE_SIZE)
+    products = paginator.get_page(request.GET.get('page'))
+    products.object_list = [product async for product in products.object_list]
+    return render(request, 'product-list.html', {'products': products})
+
+
+async def product_detail(request, pk):
+    product = await product_cache.aget_product(pk)
+    return render(request, 'product-detail.html', {'product': product})
@@ -0,0 +1,143 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.crypto import constant_time_compare
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication
+
+from .models import CustomUser
+
+# Stateless API authentication.
+#
+# A token is a signed [user id, auth hash, expiry] triple sent as
+# "Authorization: Bearer <token>". The auth hash is the start of the user's session
+# auth hash, so changing the password revokes every token issued before. Nothing is
+# stored server side; each process keeps an LRU of tokens it has verified and one of
+# users it has loaded, so a repeat client costs no signature check and no query.
+#
+# Cached users live for USER_CACHE_TTL seconds. Saving a user drops them from this
+# process's LRU at once; other processes see the change when their entry expires.
+# Only bearer tokens read the LRU: sessions load their user from the database, so
+# a logout, deactivation or password change ends them in every process at once.
+
+TOKEN_SALT = 'products.authentication.token'
+TOKEN_MAX_AGE = getattr(settings, 'API_TOKEN_MAX_AGE', 86400)
+TOKEN_CACHE_SIZE = getattr(settings, 'API_TOKEN_CACHE_SIZE', 4096)
+USER_CACHE_SIZE = getattr(settings, 'API_USER_CACHE_SIZE', 4096)
+USER_CACHE_TTL = getattr(settings, 'API_USER_CACHE_TTL', 60)
+
+
+class ExpiringLRU:
+    """A bounded, thread-safe mapping whose entries expire ttl seconds after being set"""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# Verified tokens hold no user state, so they can live as long as the token itself
+_tokens = ExpiringLRU(TOKEN_CACHE_SIZE, TOKEN_MAX_AGE)
+_users = ExpiringLRU(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+def token_hash(user):
+    return user.get_session_auth_hash()[:20]
+
+
+def cached_user(user_id):
+    """(user, token hash) for user_id, from the LRU or the database; (None, None) if there is no such user
+
+    The user is a copy, so what a request memoizes on it stays with that request.
+    """
+    entry = _users.get(user_id)
+    if entry is None:
+        try:
+            user = CustomUser.objects.get(pk=user_id)
+        except CustomUser.DoesNotExist:
+            return None, None
+        entry = (user, token_hash(user))
+        _users.set(user_id, entry)
+    user, auth_hash = entry
+    return copy.copy(user), auth_hash
+
+
+def issue_token(user, max_age=None):
+    """A token authenticating user for max_age seconds (API_TOKEN_MAX_AGE by default)"""
+    expires = int(time.time()) + (TOKEN_MAX_AGE if max_age is None else max_age)
+    return signing.dumps([user.pk, token_hash(user), expires], salt=TOKEN_SALT)
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """DRF authentication from "Authorization: Bearer <token>" headers made by issue_token()"""
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        keyword, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+        if keyword != self.keyword:
+            return None  # Left to the session and basic authentication
+        token = token.strip()
+        claims = _tokens.get(token)
+        if claims is None:
+            try:
+                claims = signing.loads(token, salt=TOKEN_SALT)
+                user_id, auth_hash, expires = claims
+            except (signing.BadSignature, TypeError, ValueError):
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            _tokens.set(token, claims)
+        user_id, auth_hash, expires = claims
+        if expires < time.time():
+            _tokens.discard(token)
+            raise exceptions.AuthenticationFailed('Token has expired.')
+        user, current_hash = cached_user(user_id)
+        if user is None or not user.is_active or not constant_time_compare(auth_hash, current_hash):
+            raise exceptions.AuthenticationFailed('Invalid token.')
+        return user, token
+
+    def authenticate_header(self, request):
+        return f'{self.keyword} realm="api"'
+
+
+# ================== Signal receivers ==================
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def forget_user(sender, instance, **kwargs):
+    # Again on commit, in case a request cached the row as it was before
+    _users.discard(instance.pk)
+    transaction.on_commit(lambda: _users.discard(instance.pk))
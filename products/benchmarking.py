@@ -0,0 +1,117 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from .models import Category, Product, Order
+from .listings import rebuild_listings
+from .search import rebuild_index
+
+# Helpers shared by the bench_* management commands
+
+BENCH_PREFIX = 'bench-'
+
+WORDS = [
+    'laptop', 'phone', 'tablet', 'monitor', 'keyboard', 'mouse', 'charger', 'cable', 'speaker',
+    'headset', 'camera', 'router', 'printer', 'drive', 'memory', 'pro', 'max', 'mini', 'ultra',
+    'wireless', 'gaming', 'office', 'portable', 'smart', 'carbon', 'silver', 'black', 'classic',
+]
+
+
+def seed_catalog(products, orders=0, categories=50, users=100, batch_size=10000, seed=42, log=None):
+    """Bulk insert a synthetic catalog of bench- prefixed categories, users, products and orders
+
+    Roughly one product in five is out of stock. Returns the seeded categories.
+    """
+    rng = random.Random(seed)
+    category_objs = [
+        Category.objects.get_or_create(name=f'{BENCH_PREFIX}category-{i}')[0] for i in range(categories)
+    ]
+    User = get_user_model()
+    user_objs = [User.objects.get_or_create(username=f'{BENCH_PREFIX}user-{i}')[0] for i in range(users)]
+
+    now = timezone.now()
+    created = 0
+    while created < products:
+        batch = []
+        for i in range(created, min(created + batch_size, products)):
+            batch.append(Product(
+                name=' '.join(rng.sample(WORDS, 3)) + f' {i}',
+                description=' '.join(rng.choices(WORDS, k=12)),
+                price=f'{rng.uniform(1, 2000):.2f}',
+                category=rng.choice(category_objs),
+                stock_quantity=0 if rng.random() < 0.2 else rng.randint(1, 500),
+            ))
+        Product.objects.bulk_create(batch)
+        created += len(batch)
+        if log:
+            log(f'seeded {created} products')
+
+    prices = dict(Product.objects.filter(category__name__startswith=BENCH_PREFIX).values_list('id', 'price'))
+    product_ids = list(prices)
+    created = 0
+    while orders and created < orders:
+        batch = []
+        for _ in range(min(batch_size, orders - created)):
+            product_id = rng.choice(product_ids)
+            quantity = rng.randint(1, 5)
+            batch.append(Order(
+                user=rng.choice(user_objs),
+                product_id=product_id,
+                quantity=quantity,
+                unit_price=prices[product_id],
+                total_price=prices[product_id] * quantity,
+                status=rng.choice(Order.STATUS_CHOICES)[0],
+            ))
+        Order.objects.bulk_create(batch)
+        created += len(batch)
+        if log:
+            log(f'seeded {created} orders')
+
+    # bulk_create stamps every row with the same auto_now_add value, so spread them out
+    # over the last year to give date ordering and cursors something to work with
+    spread_dates(Product.objects.filter(category__name__startswith=BENCH_PREFIX), 'created_date', now, rng)
+    spread_dates(Order.objects.filter(user__username__startswith=BENCH_PREFIX), 'order_date', now, rng)
+    # bulk_create skips the signals that maintain the search index and the listings
+    rebuild_index()
+    rebuild_listings()
+    return category_objs
+
+
+def spread_dates(queryset, field, now, rng, batch_size=2000):
+    model = queryset.model
+    last_pk = 0
+    while True:
+        ids = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        model.objects.bulk_update(
+            [model(pk=pk, **{field: now - timedelta(seconds=rng.randint(0, 365 * 86400))}) for pk in ids],
+            [field],
+        )
+        last_pk = ids[-1]
+
+
+def clear_catalog():
+    """Delete everything seed_catalog created"""
+    Category.objects.filter(name__startswith=BENCH_PREFIX).delete()
+    get_user_model().objects.filter(username__startswith=BENCH_PREFIX).delete()
+
+
+def time_call(func, repeat):
+    """Call func repeat times and return the latencies in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
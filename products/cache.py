@@ -0,0 +1,205 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.http import Http404
+
+from .models import Category, Product
+from .signals import stock_changed, products_bulk_saved
+
+# Read-through cache for product catalog reads.
+#
+# Detail payloads are keyed by product id and deleted when that product changes.
+# List pages are keyed by their normalized query string plus a version number:
+# lists filtered on one category use that category's version, everything else uses
+# the catalog-wide version. Changing a product bumps both, so stale pages are never
+# read again and simply age out of the cache.
+#
+# Invalidation only reaches the cache this process writes to. Workers that each keep
+# a LocMem cache serve each other's stale entries until PRODUCT_CACHE_TIMEOUT, which
+# settings keeps short unless the caches are shared (DJANGO_CACHE_REDIS_URL).
+
+CACHE_ALIAS = getattr(settings, 'PRODUCT_CACHE_ALIAS', 'default')
+CACHE_TIMEOUT = getattr(settings, 'PRODUCT_CACHE_TIMEOUT', 300)
+
+CATALOG_VERSION_KEY = 'products:version'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def stats():
+    """Hit, miss and eviction counts for this process
+
+    Evictions are entries dropped by invalidation: deleted detail payloads and
+    list versions that were bumped.
+    """
+    with _stats_lock:
+        return {name: _stats[name] for name in ('hits', 'misses', 'evictions')}
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def get_payload(key):
+    value = get_cache().get(key)
+    _count('misses' if value is None else 'hits')
+    return value
+
+
+def set_payload(key, value):
+    get_cache().set(key, value, CACHE_TIMEOUT)
+
+
+# ================== Keys and versions ==================
+
+def category_version_key(category_id):
+    return f'products:category:{category_id}:version'
+
+
+def _versions(keys):
+    cache = get_cache()
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Start from the clock rather than 1 so a version that was evicted can
+            # never come back with a number that old list keys still use
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return versions
+
+
+def _bump(keys):
+    cache = get_cache()
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+    _count('evictions', len(keys))
+
+
+def detail_key(pk):
+    return f'products:detail:{pk}'
+
+
+def get_detail(request, pk):
+    # Serialized image URLs are absolute, so payloads are stored per host under one key
+    # that invalidation can delete by product id
+    payloads = get_cache().get(detail_key(pk)) or {}
+    data = payloads.get(request.build_absolute_uri('/'))
+    _count('misses' if data is None else 'hits')
+    return data
+
+
+def set_detail(request, pk, data):
+    payloads = get_cache().get(detail_key(pk)) or {}
+    payloads[request.build_absolute_uri('/')] = data
+    set_payload(detail_key(pk), payloads)
+
+
+def list_key(request):
+    """Key for a ProductList page, independent of parameter order and output format"""
+    params = sorted(
+        (name, value) for name, values in request.query_params.lists() for value in values if name != 'format'
+    )
+    category = request.query_params.getlist('category')
+    if len(category) == 1 and category[0].isdigit():
+        version_key = category_version_key(category[0])
+    else:
+        version_key = CATALOG_VERSION_KEY
+    version = _versions([version_key])[version_key]
+    digest = hashlib.md5(f'{request.build_absolute_uri("/")}?{urlencode(params)}'.encode()).hexdigest()
+    return f'products:list:{version_key}:{version}:{digest}'
+
+
+def validators_key(pk):
+    return f'products:validators:{pk}'
+
+
+def product_key(pk):
+    return f'products:object:{pk}'
+
+
+def get_product(pk):
+    """Product instance with its category, for template views; raises Http404 if missing"""
+    key = product_key(pk)
+    product = get_payload(key)
+    if product is None:
+        try:
+            product = Product.objects.select_related('category').get(pk=pk)
+        except Product.DoesNotExist:
+            raise Http404('No Product matches the given query.')
+        set_payload(key, product)
+    return product
+
+
+async def aget_product(pk):
+    """get_product for async views
+
+    The product cache is process-local (LocMemCache), so it is read inline; only a
+    miss goes to the database, through the async ORM.
+    """
+    key = product_key(pk)
+    product = get_payload(key)
+    if product is None:
+        try:
+            product = await Product.objects.select_related('category').aget(pk=pk)
+        except Product.DoesNotExist:
+            raise Http404('No Product matches the given query.')
+        set_payload(key, product)
+    return product
+
+
+# ================== Invalidation ==================
+
+def invalidate_products(product_ids, category_ids):
+    """Drop cached payloads for these products and every list page that could include them"""
+    def invalidate():
+        keys = [key(pk) for pk in product_ids for key in (detail_key, validators_key, product_key)]
+        get_cache().delete_many(keys)
+        _count('evictions', len(keys))
+        _bump([CATALOG_VERSION_KEY] + [category_version_key(pk) for pk in sorted({*category_ids} - {None})])
+
+    transaction.on_commit(invalidate)
+
+
+# ================== Signal receivers ==================
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    # Moving a product out of a category must also invalidate that category's lists;
+    # _loaded_category_id is set by Product.from_db
+    previous = instance.__dict__.get('_loaded_category_id')
+    instance._loaded_category_id = instance.category_id
+    invalidate_products([instance.pk], [instance.category_id, previous])
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category(sender, instance, **kwargs):
+    # Category names feed search results, so every list is affected, but no detail payload is
+    transaction.on_commit(lambda: _bump([CATALOG_VERSION_KEY, category_version_key(instance.pk)]))
+
+@receiver(stock_changed)
+@receiver(products_bulk_saved)
+def invalidate_bulk(sender, product_ids, category_ids, **kwargs):
+    invalidate_products(product_ids, category_ids)
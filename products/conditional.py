@@ -0,0 +1,114 @@
+import hashlib
+
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+# Conditional request support for the API views.
+#
+# Validators come from each row's updated_date (plus the row count for lists), read
+# with a single narrow query, so a 304 or 412 never serializes the resource.
+
+# Aggregates behind a list's validators; the count catches deletes, which would not
+# move the newest updated_date
+LIST_STATE = {'count': Count('pk'), 'last_modified': Max('updated_date')}
+
+
+def list_state(aggregate):
+    """(version, last_modified) from the LIST_STATE aggregate of a queryset"""
+    last_modified = aggregate['last_modified']
+    return f'{aggregate["count"]}:{last_modified.isoformat() if last_modified else ""}', last_modified
+
+
+def detail_state(pk, updated_date):
+    return None if updated_date is None else (f'{pk}:{updated_date.isoformat()}', updated_date)
+
+
+def make_validators(format, state):
+    """(ETag, Last-Modified timestamp) for a resource state rendered in the given format"""
+    version, last_modified = state
+    # The representation differs per renderer, so a strong ETag has to as well
+    etag = quote_etag(hashlib.md5(f'{format}:{version}'.encode()).hexdigest())
+    return etag, int(last_modified.timestamp()) if last_modified else None
+
+
+def set_validator_headers(response, validators):
+    etag, last_modified = validators
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+
+
+class ConditionalMixin:
+    """ETag/Last-Modified for GET and HEAD, If-Match/If-Unmodified-Since for PUT, PATCH and DELETE
+
+    Subclasses implement get_validator_state() returning (version, last_modified) for
+    the resource, or None when it does not exist.
+    """
+
+    def get_validator_state(self, for_update=False):
+        raise NotImplementedError
+
+    def get_validators(self, request, state):
+        return make_validators(request.accepted_renderer.format, state)
+
+    def set_validator_headers(self, request, response, state):
+        set_validator_headers(response, self.get_validators(request, state))
+
+    def conditional_read(self, handler, request, *args, **kwargs):
+        state = self.get_validator_state()
+        if state is None:
+            return handler(request, *args, **kwargs)
+        etag, last_modified = self.get_validators(request, state)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            self.set_validator_headers(request, response, state)
+        return response
+
+    def conditional_write(self, handler, request, *args, **kwargs):
+        # The row stays locked (on databases that support it) between the precondition
+        # check and the write, so two clients holding the same ETag cannot both succeed
+        with transaction.atomic():
+            state = self.get_validator_state(for_update=True)
+            if state is not None:
+                response = self.check_write_preconditions(request, state)
+                if response is not None:
+                    return response
+            response = handler(request, *args, **kwargs)
+            if response.status_code == 200:
+                new_state = self.get_validator_state(for_update=True)
+                if new_state is not None:
+                    self.set_validator_headers(request, response, new_state)
+        return response
+
+    def check_write_preconditions(self, request, state):
+        etag, last_modified = self.get_validators(request, state)
+        return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+    def get(self, request, *args, **kwargs):
+        return self.conditional_read(super().get, request, *args, **kwargs)
+
+
+class ConditionalDetailMixin(ConditionalMixin):
+    def get_validator_state(self, for_update=False):
+        queryset = self.get_queryset().filter(pk=self.kwargs['pk'])
+        if for_update:
+            queryset = queryset.select_for_update(of=('self',))
+        return detail_state(self.kwargs['pk'], queryset.values_list('updated_date', flat=True).first())
+
+    def put(self, request, *args, **kwargs):
+        return self.conditional_write(super().put, request, *args, **kwargs)
+
+    def patch(self, request, *args, **kwargs):
+        return self.conditional_write(super().patch, request, *args, **kwargs)
+
+    def delete(self, request, *args, **kwargs):
+        return self.conditional_write(super().delete, request, *args, **kwargs)
+
+
+class ConditionalListMixin(ConditionalMixin):
+    def get_validator_state(self, for_update=False):
+        return list_state(self.filter_queryset(self.get_queryset()).aggregate(**LIST_STATE))
@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from .models import CustomUser ,Order
+from .transitions import check_transition
 
 class CustomUserCreationForm(UserCreationForm):
     class Meta:
@@ -11,3 +12,9 @@ class OrderForm(forms.ModelForm):
     class Meta:
         model = Order
         fields = ['product', 'quantity', 'status'] 
+
+    def clean_status(self):
+        status = self.cleaned_data['status']
+        if self.instance.pk is not None:
+            check_transition(self.instance.status, status)
+        return status
@@ -0,0 +1,82 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.middleware.csrf import get_token
+
+from .models import Order
+from .signals import orders_created
+
+# Template fragment caching.
+#
+# Product cards are cached with {% cache %} keyed on the product id and its
+# updated_date, which every save and stock update bumps, so a changed product simply
+# renders under a new key. The dashboard's "Your Recent Orders" section is keyed on
+# the user, a per-user orders version bumped whenever one of their orders is saved or
+# deleted, the page number and the user's CSRF secret (its forms embed a CSRF token).
+# Product details shown inside that section can lag by up to FRAGMENT_TIMEOUT.
+
+FRAGMENT_TIMEOUT = getattr(settings, 'TEMPLATE_FRAGMENT_TIMEOUT', 300)
+
+
+def get_cache():
+    # The alias {% cache %} itself uses
+    try:
+        return caches['template_fragments']
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def fragment_cache(request):
+    """Context processor giving templates the {% cache %} timeout"""
+    return {'fragment_timeout': FRAGMENT_TIMEOUT}
+
+
+def orders_version_key(user_id):
+    return f'fragments:orders:{user_id}:version'
+
+
+def orders_version(user_id):
+    cache = get_cache()
+    key = orders_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # From the clock, so an evicted version never returns to a number old fragments used
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def orders_fragment_key(request, page_number):
+    """vary_on value for the user's orders section"""
+    get_token(request)  # Makes sure the request has a CSRF secret to key on
+    secret = hashlib.sha256(request.META['CSRF_COOKIE'].encode()).hexdigest()[:16]
+    return f'{request.user.pk}:{orders_version(request.user.pk)}:{page_number}:{secret}'
+
+
+def bump_orders_versions(user_ids):
+    def bump():
+        cache = get_cache()
+        for user_id in user_ids:
+            try:
+                cache.incr(orders_version_key(user_id))
+            except ValueError:
+                pass  # No version yet, so nothing was cached under one
+    transaction.on_commit(bump)
+
+
+# ================== Signal receivers ==================
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalidate_user_orders(sender, instance, **kwargs):
+    bump_orders_versions([instance.user_id])
+
+@receiver(orders_created)
+def invalidate_created_orders(sender, orders, **kwargs):
+    bump_orders_versions({order.user_id for order in orders})
@@ -0,0 +1,158 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, F, When
+from django.utils import timezone
+
+from .models import Order, Product, StockHold
+from .signals import orders_created, stock_changed
+
+# Cart holds.
+#
+# Adding to a cart moves the quantity from Product.stock_quantity to held_quantity in
+# one conditional UPDATE and records a StockHold that expires after HOLD_TTL. So
+# stock_quantity always reads as available-minus-held: the in_stock filter, its
+# partial index and the product caches keep working unchanged, and buyers are turned
+# away when they add to cart rather than at checkout. Checkout turns a user's live
+# holds into Order rows and drops held_quantity in the same transaction, with no
+# stock check left to fail. Expired holds go back to stock in batches through
+# sweep_expired_holds (the sweep_holds command); a product that looks sold out also
+# sweeps its own expired holds before turning a buyer away.
+
+HOLD_TTL = getattr(settings, 'CART_HOLD_TTL', 600)
+SWEEP_BATCH_SIZE = 500
+
+
+def _categories(product_ids):
+    return list(set(Product.objects.filter(pk__in=product_ids).values_list('category_id', flat=True)))
+
+
+def _release(quantities):
+    """Move {product_id: quantity} from held_quantity back to stock_quantity"""
+    Product.objects.filter(pk__in=quantities).update(
+        stock_quantity=Case(*(When(pk=pk, then=F('stock_quantity') + quantity) for pk, quantity in quantities.items())),
+        held_quantity=Case(*(When(pk=pk, then=F('held_quantity') - quantity) for pk, quantity in quantities.items())),
+        updated_date=timezone.now(),
+    )
+    stock_changed.send(sender=Product, product_ids=list(quantities), category_ids=_categories(quantities))
+
+
+def _hold(user, product_id, quantity, ttl):
+    with transaction.atomic():
+        now = timezone.now()
+        updated = Product.objects.filter(pk=product_id, stock_quantity__gte=quantity).update(
+            stock_quantity=F('stock_quantity') - quantity,
+            held_quantity=F('held_quantity') + quantity,
+            updated_date=now,
+        )
+        if not updated:
+            return None
+        hold = StockHold.objects.create(
+            user=user, product_id=product_id, quantity=quantity, expires_at=now + timedelta(seconds=ttl),
+        )
+        stock_changed.send(sender=Product, product_ids=[product_id], category_ids=_categories([product_id]))
+        return hold
+
+
+def place_hold(user, product_id, quantity, ttl=None):
+    """Set quantity of a product aside for user's cart for ttl seconds (HOLD_TTL by default)
+
+    Raises django.core.exceptions.ValidationError when the quantity is not positive
+    or the product does not have enough stock left.
+    """
+    if quantity <= 0:
+        raise ValidationError('Quantity must be a positive integer.')
+    ttl = HOLD_TTL if ttl is None else ttl
+    hold = _hold(user, product_id, quantity, ttl)
+    if hold is None and sweep_expired_holds(product_ids=[product_id]):
+        # Expired holds on this product just went back to stock
+        hold = _hold(user, product_id, quantity, ttl)
+    if hold is None:
+        if not Product.objects.filter(pk=product_id).exists():
+            raise ValidationError('Product does not exist.')
+        raise ValidationError('Not enough stock available.')
+    return hold
+
+
+def release_holds(user, hold_ids=None):
+    """Give user's holds (all of them, or those in hold_ids) back to stock; returns how many"""
+    with transaction.atomic():
+        holds = StockHold.objects.select_for_update().filter(user=user)
+        if hold_ids is not None:
+            holds = holds.filter(pk__in=hold_ids)
+        rows = list(holds.values_list('pk', 'product_id', 'quantity'))
+        if rows:
+            StockHold.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+            released = Counter()
+            for _, product_id, quantity in rows:
+                released[product_id] += quantity
+            _release(released)
+        return len(rows)
+
+
+def sweep_expired_holds(product_ids=None, batch_size=SWEEP_BATCH_SIZE, now=None):
+    """Give expired holds back to stock, batch_size at a time; returns how many were swept"""
+    expired = StockHold.objects.filter(expires_at__lte=now or timezone.now())
+    if product_ids is not None:
+        expired = expired.filter(product_id__in=product_ids)
+    # Checked outside a transaction, so the common nothing-to-do case takes no write lock
+    if not expired.exists():
+        return 0
+
+    swept = 0
+    while True:
+        with transaction.atomic():
+            # Holds being checked out right now are locked; skip them rather than wait
+            rows = list(
+                expired.select_for_update(skip_locked=True)
+                .order_by('expires_at')
+                .values_list('pk', 'product_id', 'quantity')[:batch_size]
+            )
+            if not rows:
+                break
+            StockHold.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+            released = Counter()
+            for _, product_id, quantity in rows:
+                released[product_id] += quantity
+            _release(released)
+        swept += len(rows)
+        if len(rows) < batch_size:
+            break
+    return swept
+
+
+def checkout(user, hold_ids=None):
+    """Turn user's live holds (all of them, or those in hold_ids) into orders in one transaction
+
+    Stock was taken when the holds were placed, so this cannot run out of stock.
+    Raises django.core.exceptions.ValidationError when there is nothing to check out
+    or one of hold_ids has expired or does not belong to the user.
+    """
+    with transaction.atomic():
+        holds = StockHold.objects.select_for_update(of=('self',)).filter(user=user, expires_at__gt=timezone.now())
+        if hold_ids is not None:
+            holds = holds.filter(pk__in=hold_ids)
+        rows = list(holds.order_by('pk').values_list('pk', 'product_id', 'quantity', 'product__price'))
+        if hold_ids is not None and len(rows) != len(set(hold_ids)):
+            raise ValidationError('Some items in the cart have expired, please add them again.')
+        if not rows:
+            raise ValidationError('The cart is empty.')
+
+        StockHold.objects.filter(pk__in=[pk for pk, _, _, _ in rows]).delete()
+        orders = Order.objects.bulk_create([
+            # bulk_create skips Order.save(), so the prices are filled in here
+            Order(user=user, product_id=product_id, quantity=quantity, unit_price=price, total_price=price * quantity)
+            for _, product_id, quantity, price in rows
+        ])
+        sold = Counter()
+        for _, product_id, quantity, _ in rows:
+            sold[product_id] += quantity
+        # Available stock is unchanged, so updated_date and the product caches are left alone
+        Product.objects.filter(pk__in=sold).update(
+            held_quantity=Case(*(When(pk=pk, then=F('held_quantity') - quantity) for pk, quantity in sold.items())),
+        )
+        orders_created.send(sender=Order, orders=orders)
+        return orders
@@ -0,0 +1,173 @@
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Product
+from .signals import products_bulk_saved
+
+# Resized product image variants.
+#
+# When a product is saved with a new image, its variants are rendered in a background
+# thread after the transaction commits: every width in VARIANT_WIDTHS, as WebP and JPEG.
+# Variants are named after the SHA-256 of the original's bytes, so a name always holds
+# the same image and can be served with a far-future immutable Cache-Control. The hash
+# is stored on Product.image_hash once every variant exists; until then the original is
+# served. The backfill_image_variants command does the same for existing images with a
+# process pool.
+
+VARIANT_WIDTHS = tuple(sorted(getattr(settings, 'PRODUCT_IMAGE_WIDTHS', (100, 200, 400, 800))))
+VARIANT_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+VARIANT_QUALITY = 80
+VARIANT_DIR = 'product_images/variants'
+
+# Tests set this to False to render variants inline
+RENDER_IN_BACKGROUND = getattr(settings, 'PRODUCT_IMAGE_VARIANTS_IN_BACKGROUND', True)
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def variant_name(digest, width, format='jpeg'):
+    # Sharded by the first two hex digits to keep directories small
+    return f'{VARIANT_DIR}/{digest[:2]}/{digest}-{width}w.{format}'
+
+
+def variant_width(size):
+    """The smallest variant at least `size` pixels wide, or the widest one"""
+    for width in VARIANT_WIDTHS:
+        if width >= size:
+            return width
+    return VARIANT_WIDTHS[-1]
+
+
+def variant_url(digest, size, format='jpeg'):
+    return default_storage.url(variant_name(digest, variant_width(size), format))
+
+
+def render_variants(data):
+    """Resize one original image to every variant; returns {(width, format): bytes}
+
+    Plain bytes in and out, so it runs in a process pool worker without Django.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA'):
+            original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+        variants = {}
+        for width in VARIANT_WIDTHS:
+            # Never upscale: a small original is stored as-is under the larger widths
+            height = round(original.height * min(width, original.width) / original.width)
+            resized = original.resize((min(width, original.width), max(height, 1)), Image.Resampling.LANCZOS)
+            for format, pil_format in VARIANT_FORMATS.items():
+                image = resized.convert('RGB') if pil_format == 'JPEG' else resized
+                buffer = io.BytesIO()
+                image.save(buffer, pil_format, quality=VARIANT_QUALITY, optimize=pil_format == 'JPEG')
+                variants[width, format] = buffer.getvalue()
+    return variants
+
+
+def missing_variants(digest):
+    return [
+        (width, format) for width in VARIANT_WIDTHS for format in VARIANT_FORMATS
+        if not default_storage.exists(variant_name(digest, width, format))
+    ]
+
+
+def store_variants(product_id, image_name, digest, variants):
+    """Save rendered variants and point the product at them
+
+    The product is only updated while it still has the image the variants were made
+    from, so a render that finishes after the image was replaced changes nothing.
+    """
+    for (width, format), data in variants.items():
+        name = variant_name(digest, width, format)
+        if not default_storage.exists(name):
+            default_storage.save(name, ContentFile(data))
+    rows = list(Product.objects.filter(pk=product_id, image=image_name).values_list('pk', 'category_id'))
+    if rows:
+        Product.objects.filter(pk=product_id, image=image_name).update(image_hash=digest, updated_date=timezone.now())
+        products_bulk_saved.send(sender=Product, product_ids=[product_id], category_ids=[rows[0][1]])
+    return bool(rows)
+
+
+def read_image(name):
+    with default_storage.open(name, 'rb') as file:
+        return file.read()
+
+
+def generate_variants(product_id):
+    """Render and store the variants of a product's current image"""
+    image_name = Product.objects.filter(pk=product_id).values_list('image', flat=True).first()
+    if not image_name:
+        return False
+    data = read_image(image_name)
+    digest = content_hash(data)
+    # The same image uploaded again reuses the variants already on disk
+    variants = render_variants(data) if missing_variants(digest) else {}
+    return store_variants(product_id, image_name, digest, variants)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-variants')
+        return _executor
+
+
+def generate_logged(product_id):
+    try:
+        generate_variants(product_id)
+    except Exception:
+        # Unreadable images keep serving the original; the next save or the backfill retries
+        logger.exception('Rendering image variants for product %s failed', product_id)
+    finally:
+        close_old_connections()
+
+
+def tracks_image(instance, update_fields):
+    # A deferred image field was not loaded, so it cannot have changed
+    return 'image' in instance.__dict__ and (update_fields is None or 'image' in update_fields)
+
+
+@receiver(pre_save, sender=Product)
+def forget_stale_variants(sender, instance, update_fields=None, **kwargs):
+    if not tracks_image(instance, update_fields):
+        return
+    # _loaded_image is set by Product.from_db; products built in memory have no variants yet
+    instance._image_changed = (instance.image.name or None) != getattr(instance, '_loaded_image', None)
+    if instance._image_changed:
+        instance.image_hash = ''
+
+@receiver(post_save, sender=Product)
+def schedule_variants(sender, instance, update_fields=None, **kwargs):
+    if not instance.__dict__.pop('_image_changed', False):
+        return
+    instance._loaded_image = instance.image.name or None
+    if update_fields is not None and 'image_hash' not in update_fields:
+        Product.objects.filter(pk=instance.pk).update(image_hash='')
+    if not instance.image:
+        return
+    product_id = instance.pk
+    if RENDER_IN_BACKGROUND:
+        transaction.on_commit(lambda: get_executor().submit(generate_logged, product_id))
+    else:
+        transaction.on_commit(lambda: generate_variants(product_id))
@@ -0,0 +1,160 @@
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from .models import Category, Product
+from .signals import products_bulk_saved
+
+# Bulk catalog import. Feeds are read as a stream and upserted in chunks keyed on
+# Product.sku, so memory stays bounded by the chunk size whatever the feed size.
+#
+# Each row needs sku, name, price, stock_quantity and category (the category name);
+# description is optional. Unknown categories are created. A feed's stock_quantity is
+# the stock on hand; units held by carts (see products/holds.py) are taken off it, so
+# Product.stock_quantity stays what is available.
+
+DEFAULT_CHUNK_SIZE = 5000
+
+MAX_REPORTED_ERRORS = 100
+
+UPDATE_FIELDS = ['name', 'description', 'price', 'category', 'stock_quantity', 'updated_date']
+
+PRICE_QUANTUM = Decimal('0.01')
+MAX_PRICE = Decimal('99999999.99')
+
+
+def read_feed(lines, format):
+    """Yield one dict per row of a CSV or NDJSON feed
+
+    lines is any iterable of text or UTF-8 bytes lines: an open file, stdin or a request.
+    """
+    lines = (line.decode('utf-8') if isinstance(line, bytes) else line for line in lines)
+    if format == 'csv':
+        yield from csv.DictReader(lines)
+    elif format == 'ndjson':
+        for line in lines:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None  # Rejected by clean_row like any other bad row
+    else:
+        raise ValueError(f'Unsupported feed format: {format}')
+
+
+def clean_row(row):
+    """Fast-path validation of one feed row; returns (values, None) or (None, error)"""
+    if not isinstance(row, dict):
+        return None, 'Malformed row.'
+    try:
+        sku = str(row['sku']).strip()
+        name = str(row['name']).strip()
+        category = str(row['category']).strip()
+        price = Decimal(str(row['price'])).quantize(PRICE_QUANTUM)
+        stock_quantity = int(row['stock_quantity'])
+    except KeyError as e:
+        return None, f'Missing field {e.args[0]}.'
+    except (InvalidOperation, ValueError, TypeError):
+        return None, 'Invalid price or stock_quantity.'
+    if not sku or len(sku) > 64:
+        return None, 'sku must be 1 to 64 characters.'
+    if not name or len(name) > 255:
+        return None, 'name must be 1 to 255 characters.'
+    if not category or len(category) > 255:
+        return None, 'category must be 1 to 255 characters.'
+    if not Decimal(0) <= price <= MAX_PRICE:
+        return None, 'Invalid price.'
+    if stock_quantity < 0:
+        return None, 'stock_quantity must not be negative.'
+    return {
+        'sku': sku,
+        'name': name,
+        'description': str(row.get('description') or ''),
+        'price': price,
+        'stock_quantity': stock_quantity,
+        'category': category,
+    }, None
+
+
+class ProductImporter:
+    """Upsert products from an iterable of feed rows in chunks
+
+    The Category name -> id map is loaded once and kept in memory; new names are
+    created in bulk as they appear.
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, on_chunk=None):
+        self.chunk_size = chunk_size
+        self.on_chunk = on_chunk
+        self.categories = dict(Category.objects.values_list('name', 'id'))
+        self.rows = self.created = self.updated = self.rejected = 0
+        self.errors = []
+
+    def run(self, rows):
+        chunk = {}
+        for number, row in enumerate(rows, start=1):
+            self.rows += 1
+            values, error = clean_row(row)
+            if error:
+                self.reject(number, error)
+                continue
+            # A sku repeated within a chunk keeps its last row, like a sequential import would
+            chunk[values['sku']] = values
+            if len(chunk) >= self.chunk_size:
+                self.write(chunk)
+                chunk = {}
+        if chunk:
+            self.write(chunk)
+        return self.summary()
+
+    def reject(self, number, error):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': number, 'error': error})
+
+    def resolve_categories(self, names):
+        missing = set(names) - self.categories.keys()
+        if missing:
+            Category.objects.bulk_create([Category(name=name) for name in missing], ignore_conflicts=True)
+            self.categories.update(Category.objects.filter(name__in=missing).values_list('name', 'id'))
+
+    def write(self, chunk):
+        with transaction.atomic():
+            self.resolve_categories({values['category'] for values in chunk.values()})
+            existing = dict(Product.objects.filter(sku__in=chunk.keys()).values_list('sku', 'category_id'))
+            products = Product.objects.bulk_create(
+                [
+                    Product(category_id=self.categories[values.pop('category')], **values)
+                    for values in chunk.values()
+                ],
+                update_conflicts=True,
+                unique_fields=['sku'],
+                update_fields=UPDATE_FIELDS,
+            )
+            # Released holds add their units back, so they must not be counted twice
+            Product.objects.filter(pk__in=[product.pk for product in products], held_quantity__gt=0).update(
+                stock_quantity=Greatest(F('stock_quantity') - F('held_quantity'), Value(0)),
+            )
+            self.created += len(chunk) - len(existing)
+            self.updated += len(existing)
+            products_bulk_saved.send(
+                sender=Product,
+                product_ids=[product.pk for product in products],
+                # Products that moved category leave stale lists behind in the old one too
+                category_ids=list({product.category_id for product in products} | set(existing.values())),
+            )
+        if self.on_chunk:
+            self.on_chunk(self)
+
+    def summary(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'rejected': self.rejected,
+            'errors': self.errors,
+        }
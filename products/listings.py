@@ -0,0 +1,160 @@
+from django.db import connection, transaction
+from django.db.models import BooleanField, ExpressionWrapper, OuterRef, Q, Subquery
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Category, Product, ProductListing
+from .signals import products_bulk_saved, stock_changed
+
+# Catalog read model.
+#
+# ProductListing keeps one row per product with what catalog browsing reads: the
+# fields ProductSerializer returns, the category name, an in-stock flag, the image
+# URL worked out once and the created_date/id sort keys, in one table indexed for
+# the list filters. The product list API and pages page through it without joining
+# Category or building Product instances.
+#
+# Rows are rewritten in the same transaction as every write to their product, from
+# the signals the search index and product cache use: saves and bulk writes copy
+# the product over with one INSERT ... SELECT ... ON CONFLICT per batch (the image
+# URL comes from the saved instance, or from one follow-up query for bulk writes),
+# stock changes copy stock_quantity and updated_date with one UPDATE, and renaming
+# a category renames it on its listings. The rebuild_listings command recreates the
+# whole table, e.g. after writes that sent no signal.
+
+BATCH_SIZE = 2000
+
+COLUMNS = [
+    'id', 'sku', 'name', 'description', 'price', 'category_id', 'category__name',
+    'stock_quantity', 'image', 'image_hash', 'created_date', 'updated_date',
+]
+
+
+def image_url(name, storage=Product._meta.get_field('image').storage):
+    return storage.url(name) if name else ''
+
+
+def make_listing(row):
+    """ProductListing for a Product .values(*COLUMNS) row"""
+    image = row['image'] or ''
+    return ProductListing(
+        id=row['id'], sku=row['sku'], name=row['name'], description=row['description'], price=row['price'],
+        category_id=row['category_id'], category_name=row['category__name'],
+        stock_quantity=row['stock_quantity'], in_stock=row['stock_quantity'] > 0,
+        image=image, image_url=image_url(image), image_hash=row['image_hash'],
+        created_date=row['created_date'], updated_date=row['updated_date'],
+    )
+
+
+def upsert_listings(ids, image_urls):
+    """Copy products ids over to their listings with one INSERT ... SELECT ... ON CONFLICT
+
+    Ids in image_urls take that URL; the others keep theirs while their image is
+    unchanged and are left with an empty one otherwise.
+    """
+    listing = ProductListing._meta.db_table
+    placeholders = ', '.join(['%s'] * len(ids))
+    known = [pk for pk in ids if pk in image_urls]
+    url_sql, url_params = "''", []
+    if known:
+        url_sql = 'CASE p.id ' + ' '.join(['WHEN %s THEN %s'] * len(known)) + " ELSE '' END"
+        url_params = [value for pk in known for value in (pk, image_urls[pk])]
+    updates = ', '.join(
+        f'{column} = excluded.{column}' for column in (
+            'sku', 'name', 'description', 'price', 'category_id', 'category_name', 'stock_quantity',
+            'in_stock', 'image', 'image_hash', 'created_date', 'updated_date',
+        )
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {listing} (id, sku, name, description, price, category_id, category_name, '
+            f'stock_quantity, in_stock, image, image_url, image_hash, created_date, updated_date) '
+            f'SELECT p.id, p.sku, p.name, p.description, p.price, p.category_id, c.name, '
+            f"p.stock_quantity, p.stock_quantity > 0, COALESCE(p.image, ''), {url_sql}, p.image_hash, "
+            f'p.created_date, p.updated_date FROM products_product p '
+            f'JOIN products_category c ON c.id = p.category_id WHERE p.id IN ({placeholders}) '
+            f'ON CONFLICT (id) DO UPDATE SET {updates}, image_url = CASE '
+            f"WHEN excluded.image = {listing}.image AND excluded.image_url = '' THEN {listing}.image_url "
+            f'ELSE excluded.image_url END',
+            url_params + list(ids),
+        )
+
+
+def sync_listings(product_ids, image_urls=None):
+    """Rewrite the listings of product_ids from Product
+
+    image_urls maps ids to the URL of the image they were just saved with; any
+    other listing whose image changed gets its URL in one more query.
+    """
+    image_urls = image_urls or {}
+    product_ids = sorted(set(product_ids))
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        ids = product_ids[start:start + BATCH_SIZE]
+        upsert_listings(ids, image_urls)
+        unknown = [pk for pk in ids if pk not in image_urls]
+        if not unknown:
+            continue
+        stale = ProductListing.objects.filter(pk__in=unknown, image_url='').exclude(image='')
+        listings = [
+            ProductListing(pk=pk, image_url=image_url(image))
+            for pk, image in stale.values_list('pk', 'image')
+        ]
+        if listings:
+            ProductListing.objects.bulk_update(listings, ['image_url'])
+
+
+def sync_stock(product_ids):
+    """Copy stock_quantity and updated_date over from Product with one UPDATE"""
+    product = Product.objects.filter(pk=OuterRef('pk'))
+    ProductListing.objects.filter(pk__in=list(product_ids)).update(
+        stock_quantity=Subquery(product.values('stock_quantity')[:1]),
+        # SET expressions see the row as it was, so the flag is read from Product too
+        in_stock=Subquery(product.annotate(
+            available=ExpressionWrapper(Q(stock_quantity__gt=0), output_field=BooleanField()),
+        ).values('available')[:1]),
+        updated_date=Subquery(product.values('updated_date')[:1]),
+    )
+
+
+def rebuild_listings(batch_size=BATCH_SIZE):
+    """Recreate every listing from Product in one transaction; returns how many there are"""
+    count = 0
+    with transaction.atomic():
+        ProductListing.objects.all().delete()
+        last_pk = 0
+        while True:
+            rows = list(Product.objects.filter(pk__gt=last_pk).order_by('pk').values(*COLUMNS)[:batch_size])
+            if not rows:
+                break
+            ProductListing.objects.bulk_create([make_listing(row) for row in rows])
+            count += len(rows)
+            last_pk = rows[-1]['id']
+    return count
+
+
+# ================== Signal receivers ==================
+
+@receiver(post_save, sender=Product)
+def sync_saved_product(sender, instance, update_fields=None, **kwargs):
+    image_urls = {}
+    if update_fields is None or 'image' in update_fields:
+        # The image was just written, so its URL needs no second look
+        image_urls[instance.pk] = image_url(instance.image.name)
+    sync_listings([instance.pk], image_urls)
+
+@receiver(post_delete, sender=Product)
+def remove_deleted_product(sender, instance, **kwargs):
+    ProductListing.objects.filter(pk=instance.pk).delete()
+
+@receiver(post_save, sender=Category)
+def rename_category(sender, instance, created, **kwargs):
+    if not created:
+        ProductListing.objects.filter(category=instance).update(category_name=instance.name)
+
+@receiver(products_bulk_saved)
+def sync_bulk_saved_products(sender, product_ids, **kwargs):
+    sync_listings(product_ids)
+
+@receiver(stock_changed)
+def sync_changed_stock(sender, product_ids, **kwargs):
+    sync_stock(product_ids)
@@ -0,0 +1,66 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+
+from products.images import content_hash, missing_variants, read_image, render_variants, store_variants
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Render the resized variants of existing product images, in a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Render processes')
+        parser.add_argument('--batch-size', type=int, default=200, help='Images read into memory at a time')
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Also check products that already have variants, e.g. after PRODUCT_IMAGE_WIDTHS changed',
+        )
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            products = products.filter(image_hash='')
+        start = time.perf_counter()
+        counts = {'rendered': 0, 'reused': 0, 'failed': 0}
+
+        # Workers may be spawned rather than forked, so they set Django up themselves
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            last_pk = 0
+            while True:
+                rows = list(products.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'image')[:options['batch_size']])
+                if not rows:
+                    break
+                last_pk = rows[-1][0]
+
+                jobs = {}
+                for pk, name in rows:
+                    try:
+                        data = read_image(name)
+                    except OSError as e:
+                        self.stderr.write(f'product {pk}: {e}')
+                        counts['failed'] += 1
+                        continue
+                    digest = content_hash(data)
+                    if missing_variants(digest):
+                        jobs[pool.submit(render_variants, data)] = (pk, name, digest)
+                    else:
+                        store_variants(pk, name, digest, {})
+                        counts['reused'] += 1
+
+                for job in as_completed(jobs):
+                    pk, name, digest = jobs[job]
+                    try:
+                        store_variants(pk, name, digest, job.result())
+                        counts['rendered'] += 1
+                    except Exception as e:  # Pillow raises several types for unreadable images
+                        self.stderr.write(f'product {pk}: {e}')
+                        counts['failed'] += 1
+                self.stdout.write(f'{sum(counts.values())} images  {time.perf_counter() - start:.1f} s')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {counts['rendered']}, reused {counts['reused']}, failed {counts['failed']}"
+        ))
@@ -0,0 +1,370 @@
+import itertools
+import json
+import os
+import platform
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable
+from urllib.parse import urlencode
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from rest_framework.settings import api_settings
+
+from products import cache as product_cache
+from products.authentication import issue_token
+from products import fragments
+from products.benchmarking import BENCH_PREFIX, clear_catalog, percentile, seed_catalog
+from products.holds import place_hold
+from products.management.commands.bench_product_filters import filter_combinations
+from products.models import Category, Order, Product
+from products.stock import place_order, place_orders
+
+API = '/products/api/v1'
+PASSWORD = 'bench-pass-123'
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, 'benchmarks', 'api_baseline.json')
+
+
+@dataclass
+class Scenario:
+    """One route exercised repeatedly by the same client"""
+    name: str
+    method: str
+    path: object  # A string, or a callable taking the prepared target
+    client: str = 'anon'  # anon, user, admin, token (the user's bearer token) or session (logged in and out by prepare)
+    data: object = None  # A dict, or a callable taking a unique number and the prepared target
+    content_type: str = None
+    prepare: Callable = None  # Runs untimed before each request; returns the target
+    repeat: int = None  # In place of --repeat for the expensive routes
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        'Request every route in products/urls.py against the configured database and report '
+        'throughput, p50/p95/p99 latency and query counts as JSON, optionally against a baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10_000)
+        parser.add_argument('--orders', type=int, default=20_000)
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse rows from an earlier run')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the seeded rows afterwards')
+        parser.add_argument('--repeat', type=int, default=30, help='Timed requests per route')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per route first')
+        parser.add_argument('--only', help='Run the routes whose name contains this text')
+        parser.add_argument('--cold', action='store_true', help='Clear the product and fragment caches before each request')
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+        parser.add_argument('--baseline', nargs='?', const=DEFAULT_BASELINE, help='Fail when routes regress against this report')
+        parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE, help='Store this run as the baseline')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p95 growth over the baseline (0.25 = 25%%)')
+        parser.add_argument('--slack-ms', type=float, default=2.0, help='Allowed absolute p95 growth, for sub-millisecond routes')
+
+    def handle(self, *args, **options):
+        if not options['skip_seed']:
+            seed_catalog(options['products'], options['orders'], log=self.stderr.write)
+        fixtures = self.fixtures()
+        clients = self.clients(fixtures)
+        scenarios = [
+            scenario for scenario in self.scenarios(fixtures, clients)
+            if not options['only'] or options['only'] in scenario.name
+        ]
+
+        # Throttling would turn most of a run into 429s
+        rates = {scope: None for scope in api_settings.DEFAULT_THROTTLE_RATES}
+        results = {}
+        with override_settings(
+            REST_FRAMEWORK={**getattr(settings, 'REST_FRAMEWORK', {}), 'DEFAULT_THROTTLE_RATES': rates},
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],  # The test client's host
+        ):
+            for scenario in scenarios:
+                results[scenario.name] = self.run(scenario, clients, options)
+                self.stderr.write(self.format_result(scenario.name, results[scenario.name]))
+
+        report = {'environment': self.environment(), 'routes': results}
+        content = json.dumps(report, indent=2, sort_keys=True) + '\n'
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(content)
+        else:
+            self.stdout.write(content, ending='')
+        if options['save_baseline']:
+            self.save_baseline(options['save_baseline'], report, merge=bool(options['only']))
+
+        if options['cleanup']:
+            clear_catalog()
+
+        failures = [f'{name}: HTTP {result["errors"]}' for name, result in results.items() if result['errors']]
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)['routes']
+            failures += self.regressions(results, baseline, options['tolerance'], options['slack_ms'])
+        if failures:
+            for failure in failures:
+                self.stderr.write(self.style.ERROR(failure))
+            raise CommandError(f'{len(failures)} routes failed or regressed')
+
+    # ================== Fixtures ==================
+
+    def fixtures(self):
+        User = get_user_model()
+        user, _ = User.objects.get_or_create(username=f'{BENCH_PREFIX}api-user')
+        admin, _ = User.objects.update_or_create(
+            username=f'{BENCH_PREFIX}api-admin', defaults={'is_staff': True, 'is_superuser': True, 'role': 'admin'},
+        )
+        for account in (user, admin):
+            account.set_password(PASSWORD)
+            account.save()
+        category, _ = Category.objects.get_or_create(name=f'{BENCH_PREFIX}api-category')
+        # Enough stock that every order route can keep succeeding
+        product, _ = Product.objects.update_or_create(
+            name=f'{BENCH_PREFIX}api-product',
+            defaults={'description': 'API benchmark product', 'price': '9.99', 'category': category, 'stock_quantity': 10 ** 9},
+        )
+        order = place_order(user, product, 1)
+        return {
+            'user': user, 'admin': admin, 'category': category, 'product': product, 'order': order,
+            'product_ids': list(Product.objects.order_by('-created_date', '-id').values_list('id', flat=True)[:200]),
+            'order_ids': list(Order.objects.order_by('-order_date', '-id').values_list('id', flat=True)[:200]),
+            'run': time.time_ns(),  # Keeps the usernames and SKUs of this run apart from earlier ones
+            'unique': itertools.count(),
+        }
+
+    def clients(self, fixtures):
+        user, admin = Client(), Client()
+        user.force_login(fixtures['user'])
+        admin.force_login(fixtures['admin'])
+        token = Client(headers={'Authorization': f"Bearer {issue_token(fixtures['user'])}"})
+        return {'anon': Client(), 'user': user, 'admin': admin, 'token': token, 'session': Client()}
+
+    # ================== Routes ==================
+
+    def scenarios(self, fixtures, clients):
+        user, product, category = fixtures['user'], fixtures['product'], fixtures['category']
+        product_ids, order_ids = itertools.cycle(fixtures['product_ids']), itertools.cycle(fixtures['order_ids'])
+
+        def unique():
+            return f"{fixtures['run']}-{next(fixtures['unique'])}"
+
+        def new_user(_):
+            return get_user_model().objects.create(username=f'{BENCH_PREFIX}api-{unique()}')
+
+        def new_product(_):
+            return Product.objects.create(
+                name=f'{BENCH_PREFIX}api-{unique()}', description='To be deleted', price='1.00', category=category, stock_quantity=1,
+            )
+
+        def new_order(_):
+            return place_order(user, product, 1)
+
+        def new_orders(count):
+            def prepare(_):
+                results = place_orders(user, [(product.pk, 1)] * count)
+                return [result['order'] for result in results]
+            return prepare
+
+        def new_hold(_):
+            return place_hold(user, product.pk, 1)
+
+        def feed(size):
+            rows = ['sku,name,price,stock_quantity,category']
+            rows += [f'{BENCH_PREFIX}api-{i},Imported product {i},{i}.99,{i},{category.name}' for i in range(size)]
+            return '\n'.join(rows) + '\n'
+
+        def log_in(_):
+            clients['session'].logout()
+
+        def log_out(_):
+            clients['session'].force_login(user)
+
+        scenarios = [
+            # ================== API - users ==================
+            Scenario('api auth token', 'POST', f'{API}/auth/token/', repeat=5, data={'username': user.username, 'password': PASSWORD}),
+            Scenario('api users list', 'GET', f'{API}/users/?format=json'),
+            Scenario('api user detail', 'GET', f'{API}/users/{user.pk}/?format=json'),
+            Scenario('api user create', 'POST', f'{API}/users/create/', repeat=5, data=lambda i, _: {
+                'username': f'{BENCH_PREFIX}api-{unique()}', 'email': 'bench@example.com', 'password': PASSWORD,
+            }),
+            Scenario('api user update', 'PATCH', f'{API}/users/update/{user.pk}/', content_type='application/json',
+                     data=lambda i, _: {'email': f'bench-{i}@example.com'}),
+            Scenario('api user delete', 'DELETE', lambda target: f'{API}/users/delete/{target.pk}/', prepare=new_user),
+        ]
+        # ================== API - products ==================
+        for label, params in filter_combinations(category.pk).items():
+            query = urlencode({**params, 'format': 'json'})
+            scenarios.append(Scenario(f'api products list {label}', 'GET', f'{API}/products/?{query}'))
+        scenarios += [
+            Scenario('api products list page 2', 'GET', f'{API}/products/?format=json&page=2'),
+            Scenario('api products list cursor', 'GET', f'{API}/products/?format=json&cursor='),
+            Scenario('api product detail', 'GET', lambda pk: f'{API}/products/{pk}/?format=json', prepare=lambda _: next(product_ids)),
+            Scenario('api product create', 'POST', f'{API}/products/create/', client='admin', content_type='application/json', data=lambda i, _: {
+                'name': f'{BENCH_PREFIX}api-{unique()}', 'description': 'Created', 'price': '5.00',
+                'category': category.pk, 'stock_quantity': 5,
+            }),
+            Scenario('api product update', 'PATCH', f'{API}/products/update/{product.pk}/', client='admin', content_type='application/json',
+                     data=lambda i, _: {'price': f'{9 + i % 2}.99'}),
+            Scenario('api product delete', 'DELETE', lambda target: f'{API}/products/delete/{target.pk}/', client='admin',
+                     prepare=new_product),
+            Scenario('api product import 500 rows', 'POST', f'{API}/products/import/', client='admin', repeat=5,
+                     content_type='text/csv', data=lambda i, _: feed(500)),
+            Scenario('api product export', 'GET', f'{API}/products/export/?format=json', repeat=3),
+            # ================== API - orders ==================
+            Scenario('api orders list', 'GET', f'{API}/orders/?format=json'),
+            Scenario('api orders list page 2', 'GET', f'{API}/orders/?format=json&page=2'),
+            Scenario('api orders list cursor', 'GET', f'{API}/orders/?format=json&cursor='),
+            Scenario('api orders list as user', 'GET', f'{API}/orders/?format=json', client='user'),
+            Scenario('api orders list with token', 'GET', f'{API}/orders/?format=json', client='token'),
+            Scenario('api order detail', 'GET', lambda pk: f'{API}/orders/{pk}/?format=json', prepare=lambda _: next(order_ids)),
+            Scenario('api order create', 'POST', f'{API}/orders/create/', content_type='application/json',
+                     data={'user': user.pk, 'product': product.pk, 'quantity': 1}),
+            Scenario('api order bulk 10 lines', 'POST', f'{API}/orders/bulk/', client='user', content_type='application/json',
+                     data=lambda i, _: {'lines': [{'product': product.pk, 'quantity': 1}] * 10}),
+            Scenario('api order update', 'PATCH', f"{API}/orders/update/{fixtures['order'].pk}/", client='user', content_type='application/json',
+                     data=lambda i, _: {'quantity': 1 + i % 2}),
+            Scenario('api order delete', 'DELETE', lambda target: f'{API}/orders/delete/{target.pk}/', client='user', prepare=new_order),
+            Scenario('api order transition 100 orders', 'POST', f'{API}/orders/transition/', client='admin',
+                     content_type='application/json', prepare=new_orders(100),
+                     data=lambda i, orders: {'orders': orders, 'status': 'Cancelled'}),
+            Scenario('api order export', 'GET', f'{API}/orders/export/?format=json', repeat=3),
+            # ================== API - cart and analytics ==================
+            Scenario('api cart hold', 'POST', f'{API}/cart/holds/', client='user', data={'product': product.pk, 'quantity': 1}),
+            Scenario('api cart holds list', 'GET', f'{API}/cart/holds/?format=json', client='user'),
+            Scenario('api cart hold release', 'DELETE', lambda hold: f'{API}/cart/holds/{hold.pk}/', client='user', prepare=new_hold),
+            Scenario('api cart checkout', 'POST', f'{API}/cart/checkout/', client='user', content_type='application/json',
+                     prepare=new_hold, data=lambda i, hold: {'holds': [hold.pk]}),
+            Scenario('api analytics', 'GET', f'{API}/analytics/?format=json', client='admin'),
+            # ================== Frontend ==================
+            Scenario('page home', 'GET', '/products/'),
+            Scenario('page products', 'GET', '/products/products/?page=2'),
+            Scenario('page product detail', 'GET', lambda pk: f'/products/product/{pk}/', prepare=lambda _: next(product_ids)),
+            Scenario('page signup', 'GET', '/products/signup/'),
+            Scenario('page login', 'GET', '/products/login/'),
+            Scenario('page login submit', 'POST', '/products/login/', client='session', prepare=log_in, repeat=5,
+                     data={'username': user.username, 'password': PASSWORD}),
+            Scenario('page logout', 'GET', '/products/logout/', client='session', prepare=log_out),
+            Scenario('page password reset', 'GET', '/products/password-reset/'),
+            Scenario('page make order', 'POST', '/products/order/create/', client='user',
+                     data={'product_id': product.pk, 'quantity': 1}),
+            Scenario('page edit order', 'GET', f"/products/order/edit/{fixtures['order'].pk}/", client='user'),
+            Scenario('page edit order submit', 'POST', f"/products/order/edit/{fixtures['order'].pk}/", client='user',
+                     data=lambda i, _: {'product': product.pk, 'quantity': 1 + i % 2, 'status': 'Pending'}),
+            Scenario('page delete order', 'GET', f"/products/order/delete/{fixtures['order'].pk}/", client='user'),
+            Scenario('page delete order submit', 'POST', lambda order: f'/products/order/delete/{order.pk}/', client='user',
+                     prepare=new_order),
+            Scenario('page user dashboard', 'GET', '/products/dashboard/', client='user'),
+            Scenario('page admin dashboard', 'GET', '/products/admin/dashboard/', client='admin'),
+        ]
+        return scenarios
+
+    # ================== Measurement ==================
+
+    def run(self, scenario, clients, options):
+        client = clients[scenario.client]
+        repeat = scenario.repeat or options['repeat']
+        samples, queries, statuses = [], [], Counter()
+        for i in range(-options['warmup'], repeat):
+            target = scenario.prepare(i) if scenario.prepare else None
+            path = scenario.path(target) if callable(scenario.path) else scenario.path
+            kwargs = {}
+            data = scenario.data(i, target) if callable(scenario.data) else scenario.data
+            if data is not None:
+                kwargs['data'] = data
+            if scenario.content_type:
+                kwargs['content_type'] = scenario.content_type
+            if options['cold']:
+                product_cache.get_cache().clear()
+                fragments.get_cache().clear()
+
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                start = time.perf_counter()
+                response = client.generic(scenario.method, path, **self.encode(scenario, kwargs))
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = time.perf_counter() - start
+            if i >= 0:  # Warmup requests are not recorded
+                samples.append(elapsed * 1000)
+                queries.append(counter.count)
+                statuses[response.status_code] += 1
+
+        return {
+            'requests': repeat,
+            'throughput_rps': round(repeat / (sum(samples) / 1000), 1),
+            'p50_ms': round(percentile(samples, 50), 3),
+            'p95_ms': round(percentile(samples, 95), 3),
+            'p99_ms': round(percentile(samples, 99), 3),
+            'queries': percentile(queries, 50),
+            'queries_max': max(queries),
+            'statuses': {str(status): count for status, count in sorted(statuses.items())},
+            'errors': sum(count for status, count in statuses.items() if status >= 400),
+            'cold': options['cold'],
+        }
+
+    def encode(self, scenario, kwargs):
+        # Client.generic() takes a ready body, the way Client.post() would have built it
+        data = kwargs.pop('data', None)
+        if data is None:
+            return kwargs
+        content_type = kwargs.pop('content_type', None)
+        if content_type == 'application/json':
+            return {'data': json.dumps(data), 'content_type': content_type}
+        if content_type:
+            return {'data': data, 'content_type': content_type}
+        return {'data': urlencode(data, doseq=True), 'content_type': 'application/x-www-form-urlencoded'}
+
+    def format_result(self, name, result):
+        return (
+            f"{name:<40} {result['throughput_rps']:8.1f} req/s   p50 {result['p50_ms']:8.2f}   "
+            f"p95 {result['p95_ms']:8.2f}   p99 {result['p99_ms']:8.2f} ms   {result['queries']:3d} queries"
+            + (f"   {result['errors']} errors" if result['errors'] else '')
+        )
+
+    def environment(self):
+        return {
+            'database': connection.vendor,
+            'products': Product.objects.count(),
+            'orders': Order.objects.count(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'cpus': os.cpu_count(),
+        }
+
+    def save_baseline(self, path, report, merge):
+        # An --only run replaces just its routes, e.g. to record the list routes with --cold
+        if merge and os.path.exists(path):
+            with open(path) as file:
+                routes = json.load(file)['routes']
+            report = {**report, 'routes': {**routes, **report['routes']}}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(json.dumps(report, indent=2, sort_keys=True) + '\n')
+
+    def regressions(self, results, baseline, tolerance, slack_ms):
+        failures = []
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            if before.get('cold', False) != result['cold']:
+                temperature = 'with' if before.get('cold') else 'without'
+                self.stderr.write(f'{name}: not compared, the baseline was recorded {temperature} --cold')
+                continue
+            limit = before['p95_ms'] * (1 + tolerance) + slack_ms
+            if result['p95_ms'] > limit:
+                failures.append(f"{name}: p95 {result['p95_ms']:.2f} ms, baseline {before['p95_ms']:.2f} ms")
+            if result['queries'] > before['queries']:
+                failures.append(f"{name}: {result['queries']} queries, baseline {before['queries']}")
+        return failures
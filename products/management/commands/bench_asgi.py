@@ -0,0 +1,156 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from importlib.util import find_spec
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from products.benchmarking import clear_catalog, percentile, seed_catalog
+from products.models import Product
+
+HOST = '127.0.0.1'
+
+
+def server_command(kind, port, workers, threads):
+    if kind == 'asgi':
+        return [
+            sys.executable, '-m', 'uvicorn', 'e_commerce_api.asgi:application', '--host', HOST, '--port', str(port),
+            '--workers', str(workers), '--log-level', 'warning', '--no-access-log',
+        ]
+    return [
+        sys.executable, '-m', 'gunicorn', 'e_commerce_api.wsgi:application', '--bind', f'{HOST}:{port}',
+        '--workers', str(workers), '--threads', str(threads), '--worker-class', 'gthread', '--log-level', 'warning',
+    ]
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f'Server exited with status {process.returncode}')
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f'Server did not start listening on port {port}')
+
+
+async def read_response(reader):
+    """Read one HTTP/1.1 response; returns (status, keep_alive)"""
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip().lower()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while size := int((await reader.readline()).strip(), 16):
+            await reader.readexactly(size + 2)
+        await reader.readline()
+    return status, headers.get('connection') != 'close'
+
+
+async def run_load(port, paths, connections, duration, timeout):
+    """Keep `connections` keep-alive connections busy for `duration` seconds"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration
+    latencies, statuses, errors = [], Counter(), Counter()
+
+    async def connection(offset):
+        writer = None
+        sent = offset
+        while loop.time() < deadline:
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.wait_for(asyncio.open_connection(HOST, port), timeout)
+                path = paths[sent % len(paths)]
+                sent += 1
+                start = time.perf_counter()
+                writer.write(f'GET {path} HTTP/1.1\r\nHost: {HOST}\r\nAccept: application/json\r\n\r\n'.encode())
+                status, keep_alive = await asyncio.wait_for(read_response(reader), timeout)
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses[status] += 1
+                if not keep_alive:
+                    writer.close()
+                    writer = None
+            except (OSError, ValueError, IndexError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                errors[type(e).__name__] += 1
+                if writer is not None:
+                    writer.close()
+                writer = None
+                await asyncio.sleep(0.05)
+        if writer is not None:
+            writer.close()
+
+    start = loop.time()
+    await asyncio.gather(*(connection(i) for i in range(connections)))
+    return latencies, statuses, errors, loop.time() - start
+
+
+class Command(BaseCommand):
+    help = 'Load test the catalog reads under uvicorn (ASGI, async views) and gunicorn (WSGI, sync views)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=1000)
+        parser.add_argument('--duration', type=float, default=15, help='Seconds of measured load per server')
+        parser.add_argument('--warmup', type=float, default=3)
+        parser.add_argument('--workers', type=int, default=1, help='Server processes for both servers')
+        parser.add_argument('--threads', type=int, default=32, help='Threads per gunicorn worker')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds before a request counts as failed')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--only', choices=['asgi', 'wsgi'])
+        parser.add_argument('--products', type=int, default=10_000)
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse rows from an earlier run')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the seeded rows afterwards')
+
+    def handle(self, *args, **options):
+        for kind, module in (('asgi', 'uvicorn'), ('wsgi', 'gunicorn')):
+            if options['only'] in (None, kind) and find_spec(module) is None:
+                raise CommandError(f'The {kind.upper()} benchmark needs {module}: pip install {module}')
+        if not options['skip_seed']:
+            seed_catalog(options['products'], log=self.stdout.write)
+
+        pks = list(Product.objects.order_by('-created_date', '-id').values_list('pk', flat=True)[:100])
+        paths = [f'/products/api/v1/products/?format=json&page={page}' for page in range(1, 6)]
+        paths += [f'/products/api/v1/products/{pk}/?format=json' for pk in pks]
+        paths += [f'/products/products/?page={page}' for page in range(1, 6)]
+
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+        env.pop('DJANGO_ASGI', None)  # asgi.py sets it for the ASGI server only
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(settings.BASE_DIR), env.get('PYTHONPATH')]))
+
+        for kind in ('asgi', 'wsgi'):
+            if options['only'] not in (None, kind):
+                continue
+            command = server_command(kind, options['port'], options['workers'], options['threads'])
+            process = subprocess.Popen(command, env=env, cwd=settings.BASE_DIR)
+            try:
+                wait_for_port(options['port'], process)
+                asyncio.run(run_load(options['port'], paths, min(options['connections'], 50), options['warmup'], options['timeout']))
+                latencies, statuses, errors, elapsed = asyncio.run(
+                    run_load(options['port'], paths, options['connections'], options['duration'], options['timeout'])
+                )
+            finally:
+                process.terminate()
+                process.wait()
+
+            label = 'ASGI uvicorn, async views' if kind == 'asgi' else f'WSGI gunicorn gthread x{options["threads"]}'
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== {label}, {options["connections"]} connections =='))
+            if not latencies:
+                self.stdout.write(f'no successful requests, errors: {dict(errors)}')
+                continue
+            self.stdout.write(
+                f'{len(latencies) / elapsed:9.1f} req/s   p50 {percentile(latencies, 50):8.1f} ms   '
+                f'p99 {percentile(latencies, 99):8.1f} ms   max {max(latencies):8.1f} ms'
+            )
+            self.stdout.write(f'status codes {dict(statuses)}   errors {dict(errors) or 0}')
+
+        if options['cleanup']:
+            clear_catalog()
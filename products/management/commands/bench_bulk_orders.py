@@ -0,0 +1,62 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory
+
+from products.models import Category, Product
+from products.views import OrderBulkCreate, OrderList
+
+
+class Command(BaseCommand):
+    help = 'Compare cart checkout through one POST per order against the bulk order endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--carts', type=int, default=50)
+        parser.add_argument('--lines', type=int, default=20, help='Order lines per cart')
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark rows afterwards')
+
+    def handle(self, *args, **options):
+        user, _ = get_user_model().objects.get_or_create(username='bench-bulk-user')
+        category, _ = Category.objects.get_or_create(name='bench-bulk-category')
+        Product.objects.bulk_create([
+            Product(name=f'bench-bulk-{i}', description='Bulk order benchmark product', price='1.00',
+                    category=category, stock_quantity=1_000_000)
+            for i in range(options['products'])
+        ])
+        product_ids = list(category.products.values_list('pk', flat=True))
+        rng = random.Random(42)
+        carts = [
+            [{'product': pid, 'quantity': rng.randint(1, 3)} for pid in rng.sample(product_ids, options['lines'])]
+            for _ in range(options['carts'])
+        ]
+
+        factory = APIRequestFactory()
+        single_view = OrderList.as_view()
+        bulk_view = OrderBulkCreate.as_view()
+
+        def single():
+            for cart in carts:
+                for line in cart:
+                    request = factory.post('/', {'user': user.pk, **line}, format='json', HTTP_HOST='localhost')
+                    assert single_view(request).status_code == 201
+
+        def bulk():
+            for cart in carts:
+                request = factory.post('/', {'user': user.pk, 'lines': cart}, format='json', HTTP_HOST='localhost')
+                assert bulk_view(request).status_code == 201
+
+        orders = options['carts'] * options['lines']
+        for label, run in (('one POST per order', single), ('bulk endpoint', bulk)):
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f'{label:<20} {orders / elapsed:9.1f} orders/sec   {options["carts"] / elapsed:8.1f} carts/sec'
+            )
+
+        if not options['keep']:
+            category.delete()
+            user.delete()
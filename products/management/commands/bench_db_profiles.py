@@ -0,0 +1,149 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from e_commerce_api.databases import database_settings
+from products.benchmarking import BENCH_PREFIX, clear_catalog, percentile, seed_catalog
+from products.models import Product
+from products.stock import place_orders
+
+PROFILES = ['sqlite-baseline', 'sqlite', 'postgres']
+
+PAGE_SIZE = 20
+
+
+def use_database(database):
+    """Point the default alias at `database` for connections opened from now on"""
+    connections[DEFAULT_DB_ALIAS].close()
+    del connections[DEFAULT_DB_ALIAS]
+    connections.settings[DEFAULT_DB_ALIAS] = connections.configure_settings({DEFAULT_DB_ALIAS: database})[DEFAULT_DB_ALIAS]
+
+
+def copy_sqlite(source, target):
+    """Snapshot the source database into a rollback-journal file the profile can switch to WAL itself"""
+    src, dst = sqlite3.connect(source), sqlite3.connect(target)
+    try:
+        src.backup(dst)
+        dst.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        src.close()
+        dst.close()
+
+
+def read_catalog(rng, categories, product_ids):
+    """A product list page with its count, then a product detail, like ProductList and ProductDetail"""
+    products = Product.objects.filter(category_id=rng.choice(categories))
+    count = products.count()
+    offset = rng.randrange(max(count - PAGE_SIZE, 0) + 1)
+    list(products.order_by('-created_date', '-id').values()[offset:offset + PAGE_SIZE])
+    Product.objects.filter(pk=rng.choice(product_ids)).values().first()
+
+
+class Command(BaseCommand):
+    help = 'Compare concurrent catalog read and order write throughput across the DJANGO_DB_PROFILE database profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profiles', nargs='+', choices=PROFILES, default=PROFILES[:2],
+            help='postgres uses the DJANGO_DB_* variables and writes real orders into that database',
+        )
+        parser.add_argument('--readers', type=int, default=8, help='Threads reading catalog pages')
+        parser.add_argument('--writers', type=int, default=4, help='Threads placing orders')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds of load per profile')
+        parser.add_argument('--products', type=int, default=20_000)
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse rows from an earlier run')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the seeded rows afterwards')
+
+    def handle(self, *args, **options):
+        source = settings.DATABASES[DEFAULT_DB_ALIAS]
+        if 'sqlite' not in source['ENGINE'] and any(p.startswith('sqlite') for p in options['profiles']):
+            raise CommandError('The sqlite profiles copy the default database, which must be SQLite')
+        if not options['skip_seed']:
+            seed_catalog(options['products'], log=self.stdout.write)
+        original = connections.settings[DEFAULT_DB_ALIAS]
+
+        with tempfile.TemporaryDirectory() as scratch:
+            try:
+                for profile in options['profiles']:
+                    database = database_settings(profile, os.path.join(scratch, f'{profile}.sqlite3'))['default']
+                    if profile.startswith('sqlite'):
+                        copy_sqlite(source['NAME'], database['NAME'])
+                    use_database(database)
+                    self.report(profile, self.run_load(options))
+            finally:
+                use_database(original)
+
+        if options['cleanup']:
+            clear_catalog()
+
+    def run_load(self, options):
+        categories = list(
+            Product.objects.filter(category__name__startswith=BENCH_PREFIX).values_list('category_id', flat=True).distinct()
+        )
+        product_ids = list(
+            Product.objects.filter(category__name__startswith=BENCH_PREFIX, stock_quantity__gt=0).values_list('pk', flat=True)
+        )
+        users = list(get_user_model().objects.filter(username__startswith=BENCH_PREFIX))
+        if not product_ids:
+            raise CommandError('No in-stock bench- products; run without --skip-seed')
+
+        results = {'read': [], 'write': []}
+        errors = Counter()
+        lock = threading.Lock()
+        start = threading.Barrier(options['readers'] + options['writers'] + 1)
+        deadline = []
+
+        def worker(kind, seed):
+            rng = random.Random(seed)
+            latencies = []
+            failures = Counter()
+            start.wait()
+            while time.monotonic() < deadline[0]:
+                began = time.perf_counter()
+                try:
+                    if kind == 'read':
+                        read_catalog(rng, categories, product_ids)
+                    else:
+                        place_orders(rng.choice(users), [(rng.choice(product_ids), 1)])
+                    latencies.append((time.perf_counter() - began) * 1000)
+                except DatabaseError as e:
+                    failures[f'{kind}: {str(e)[:40]}'] += 1
+            connections.close_all()
+            with lock:
+                results[kind] += latencies
+                errors.update(failures)
+
+        threads = [
+            threading.Thread(target=worker, args=(kind, i))
+            for i, kind in enumerate(['read'] * options['readers'] + ['write'] * options['writers'])
+        ]
+        for thread in threads:
+            thread.start()
+        deadline.append(time.monotonic() + options['duration'])
+        start.wait()
+        for thread in threads:
+            thread.join()
+        return results, errors, options['duration']
+
+    def report(self, profile, load):
+        results, errors, elapsed = load
+        self.stdout.write(self.style.MIGRATE_HEADING(f'== {profile} =='))
+        for kind in ('read', 'write'):
+            latencies = results[kind]
+            if not latencies:
+                self.stdout.write(f'{kind:5}  no successful operations')
+                continue
+            self.stdout.write(
+                f'{kind:5} {len(latencies) / elapsed:9.1f} ops/s   p50 {percentile(latencies, 50):8.1f} ms   '
+                f'p99 {percentile(latencies, 99):8.1f} ms'
+            )
+        self.stdout.write(f'errors {dict(errors) or 0}')
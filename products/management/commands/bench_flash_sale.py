@@ -0,0 +1,153 @@
+import random
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+
+from products.benchmarking import BENCH_PREFIX, percentile
+from products.holds import checkout, place_hold, sweep_expired_holds
+from products.models import Category, Order, Product
+from products.stock import place_order
+
+BUYER_PREFIX = f'{BENCH_PREFIX}flash-buyer-'
+
+
+class Command(BaseCommand):
+    help = 'Simulate a flash sale: many buyers after a little stock, ordering directly or through cart holds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=10_000)
+        parser.add_argument('--stock', type=int, default=100)
+        parser.add_argument('--threads', type=int, default=32, help='Buyers served at once, like server workers')
+        parser.add_argument('--think-ms', type=float, default=100, help='Longest pause between cart and checkout')
+        parser.add_argument('--abandon', type=float, default=0.3, help='Share of buyers who never check out')
+        parser.add_argument('--ttl', type=float, default=3, help='Cart hold lifetime in seconds')
+        parser.add_argument('--mode', choices=['direct', 'holds', 'both'], default='both')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark rows afterwards')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        existing = User.objects.filter(username__startswith=BUYER_PREFIX).count()
+        User.objects.bulk_create([
+            User(username=f'{BUYER_PREFIX}{i}') for i in range(existing, options['buyers'])
+        ])
+        buyers = list(User.objects.filter(username__startswith=BUYER_PREFIX).order_by('pk')[:options['buyers']])
+        category, _ = Category.objects.get_or_create(name=f'{BENCH_PREFIX}flash-category')
+
+        failed = False
+        modes = ['direct', 'holds'] if options['mode'] == 'both' else [options['mode']]
+        for mode in modes:
+            product = Product.objects.create(
+                name=f'{BENCH_PREFIX}flash-product', description='Flash sale benchmark product',
+                price='1.00', category=category, stock_quantity=options['stock'],
+            )
+            failed |= self.run(mode, product, buyers, options)
+            if not options['keep']:
+                product.delete()
+
+        if not options['keep']:
+            category.delete()
+            User.objects.filter(username__startswith=BUYER_PREFIX).delete()
+        if failed:
+            raise SystemExit(1)
+
+    def run(self, mode, product, buyers, options):
+        rng = random.Random(options['seed'])
+        # Decided up front so both modes see the same buyers
+        plans = [(buyer, rng.random() < options['abandon'], rng.uniform(0, options['think_ms']) / 1000) for buyer in buyers]
+        counts = dict.fromkeys(['ordered', 'saw sold out', 'turned away at cart', 'abandoned', 'failed checkout', 'db errors'], 0)
+        checkout_ms = []
+        last_sale = [0.0]
+        lock = threading.Lock()
+        pending = iter(plans)
+        began = time.perf_counter()
+
+        def buy(own_product, user, abandons, think):
+            if not Product.objects.filter(pk=product.pk, stock_quantity__gt=0).exists():
+                return 'saw sold out'
+            hold = None
+            if mode == 'holds':
+                try:
+                    hold = place_hold(user, product.pk, 1, ttl=options['ttl'])
+                except ValidationError:
+                    return 'turned away at cart'
+            time.sleep(think)
+            if abandons:
+                return 'abandoned'
+            start = time.perf_counter()
+            try:
+                if hold is not None:
+                    checkout(user, [hold.pk])
+                else:
+                    place_order(user, own_product, 1)
+            except ValidationError:
+                return 'failed checkout'
+            finally:
+                with lock:
+                    checkout_ms.append((time.perf_counter() - start) * 1000)
+            last_sale[0] = time.perf_counter() - began
+            return 'ordered'
+
+        def worker():
+            # Each thread works on its own copy of the row, like separate requests would
+            own_product = Product.objects.get(pk=product.pk)
+            while True:
+                with lock:
+                    plan = next(pending, None)
+                if plan is None:
+                    break
+                try:
+                    outcome = buy(own_product, *plan)
+                except OperationalError:
+                    outcome = 'db errors'
+                with lock:
+                    counts[outcome] += 1
+            connection.close()
+
+        done = threading.Event()
+
+        def sweeper():
+            # Stands in for sweep_holds running from cron
+            while not done.wait(options['ttl'] / 2):
+                try:
+                    sweep_expired_holds()
+                except OperationalError:
+                    pass
+            connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        if mode == 'holds':
+            threads.append(threading.Thread(target=sweeper))
+        for thread in threads:
+            thread.start()
+        for thread in threads[:options['threads']]:
+            thread.join()
+        elapsed = time.perf_counter() - began
+        done.set()
+        for thread in threads[options['threads']:]:
+            thread.join()
+
+        # Holds abandoned at the very end are still out; let them expire and come back
+        time.sleep(options['ttl'])
+        sweep_expired_holds()
+        product.refresh_from_db()
+        ordered = sum(Order.objects.filter(product=product).values_list('quantity', flat=True))
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"== {mode}: {len(plans)} buyers, {options['stock']} units =="))
+        for name, count in counts.items():
+            self.stdout.write(f'{name + ":":<22}{count}')
+        self.stdout.write(f'{"checkout p50/p99:":<22}{percentile(checkout_ms, 50):.1f} / {percentile(checkout_ms, 99):.1f} ms'
+                          if checkout_ms else f'{"checkout p50/p99:":<22}-')
+        self.stdout.write(f'{"last sale after:":<22}{last_sale[0]:.2f} s')
+        self.stdout.write(f'{"elapsed:":<22}{elapsed:.2f} s')
+        self.stdout.write(f'{"stock left / held:":<22}{product.stock_quantity} / {product.held_quantity}')
+
+        if ordered > options['stock'] or product.stock_quantity + product.held_quantity + ordered != options['stock']:
+            self.stderr.write(self.style.ERROR('Stock does not add up'))
+            return True
+        self.stdout.write(self.style.SUCCESS('No oversell'))
+        return False
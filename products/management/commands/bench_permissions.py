@@ -0,0 +1,85 @@
+import copy
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group, Permission
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from products import permissions
+from products.benchmarking import BENCH_PREFIX, percentile
+from products.views import ProductDetail
+
+USER_PREFIX = f'{BENCH_PREFIX}perm-user-'
+
+# What one product update request asks: the DRF permission class, then two template checks
+CHECKS = ['products.change_product', 'products.can_manage_inventory', 'products.can_manage_orders']
+
+
+class Command(BaseCommand):
+    help = "Time a request's permission checks with ModelBackend and with the cached bitsets"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--users', type=int, default=100, help='Distinct users the requests are spread over')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark users and group afterwards')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        group, _ = Group.objects.get_or_create(name=f'{BENCH_PREFIX}perm-clerks')
+        group.permissions.set(Permission.objects.filter(content_type__app_label='products', codename__contains='product'))
+        existing = User.objects.filter(username__startswith=USER_PREFIX).count()
+        User.objects.bulk_create([User(username=f'{USER_PREFIX}{i}') for i in range(existing, options['users'])])
+        users = list(User.objects.filter(username__startswith=USER_PREFIX).order_by('pk')[:options['users']])
+        for user in users:
+            user.groups.add(group)
+            user.user_permissions.set(Permission.objects.filter(codename='can_manage_inventory'))
+
+        view = ProductDetail()
+        self.factory = RequestFactory()
+        model_backend, bitset_backend = ModelBackend(), permissions.PermissionBitsetBackend()
+
+        def model_backend_checks(request):
+            # DjangoModelPermissions would ask the backend for the view's permission
+            for perm in CHECKS:
+                model_backend.has_perm(request.user, perm)
+
+        def bitset_checks(request):
+            permissions.ProductPermissions().has_permission(request, view)
+            for perm in CHECKS[1:]:
+                bitset_backend.has_perm(request.user, perm)
+
+        self.report('ModelBackend', model_backend_checks, users, options['requests'])
+        permissions.get_cache().delete_many([permissions.user_key(user.pk) for user in users])
+        self.report('Bitset, cold cache', bitset_checks, users, len(users))
+        self.report('Bitset, warm cache', bitset_checks, users, options['requests'])
+
+        if not options['keep']:
+            User.objects.filter(username__startswith=USER_PREFIX).delete()
+            group.delete()
+
+    def report(self, name, check, users, requests):
+        # A fresh user object per request, as session authentication loads one
+        batch = []
+        for i in range(requests):
+            request = Request(self.factory.patch('/'))
+            request.user = copy.copy(users[i % len(users)])
+            batch.append(request)
+        samples = []
+        queries = [0]
+
+        def count(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+        with connection.execute_wrapper(count):
+            for request in batch:
+                began = time.perf_counter()
+                check(request)
+                samples.append((time.perf_counter() - began) * 1e6)
+        self.stdout.write(
+            f'{name:<20} mean {sum(samples) / len(samples):8.1f} us   p50 {percentile(samples, 50):8.1f} us   '
+            f'p99 {percentile(samples, 99):8.1f} us   {queries[0] / requests:.2f} queries per request'
+        )
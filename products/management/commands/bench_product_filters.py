@@ -0,0 +1,100 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from products.benchmarking import clear_catalog, percentile, seed_catalog, time_call
+from products.models import Category, Product, ProductListing, Order
+from products.views import ProductList, ProductPagination
+
+# ProductList reads ProductListing; the Product indexes still serve search and the detail views
+INDEXED_MODELS = (Product, ProductListing, Order)
+
+
+def filter_combinations(category_id):
+    """Every ProductList query shape, keyed by a readable label"""
+    return {
+        'all': {},
+        'category': {'category': category_id},
+        'price': {'price': '999.99'},
+        'category+price': {'category': category_id, 'price': '999.99'},
+        'in_stock': {'in_stock': 'true'},
+        'category+in_stock': {'category': category_id, 'in_stock': 'true'},
+        'category+price+in_stock': {'category': category_id, 'price': '999.99', 'in_stock': 'true'},
+        'search': {'q': 'wireless'},
+        'category+search': {'category': category_id, 'q': 'wireless'},
+    }
+
+
+def product_list_queryset(params):
+    """Build the queryset ProductList would run for these query parameters"""
+    request = Request(APIRequestFactory().get('/', params))
+    view = ProductList(request=request, args=(), kwargs={}, format_kwarg=None)
+    return view.filter_queryset(view.get_queryset())
+
+
+class Command(BaseCommand):
+    help = 'Seed a large catalog and report EXPLAIN plans and p50/p99 latency for each ProductList filter'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1_000_000)
+        parser.add_argument('--orders', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse rows from an earlier run')
+        parser.add_argument('--compare', action='store_true', help='Also run with the Product, ProductListing and Order indexes dropped')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the seeded rows afterwards')
+
+    def handle(self, *args, **options):
+        if not options['skip_seed']:
+            seed_catalog(options['products'], options['orders'], log=self.stdout.write)
+        category_id = Category.objects.filter(name__startswith='bench-').values_list('id', flat=True).first()
+
+        self.analyze()
+
+        if options['compare']:
+            self.drop_indexes()
+            try:
+                self.report('without indexes', category_id, options['repeat'])
+            finally:
+                self.create_indexes()
+        self.report('with indexes', category_id, options['repeat'])
+
+        if options['cleanup']:
+            clear_catalog()
+
+    def report(self, label, category_id, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'== {label} =='))
+        page_size = ProductPagination.page_size
+        for name, params in filter_combinations(category_id).items():
+            queryset = product_list_queryset(params)
+
+            def run():
+                # Same two queries the paginated list view issues
+                queryset.count()
+                list(queryset[:page_size])
+
+            samples = time_call(run, repeat)
+            self.stdout.write(
+                f'{name:<26} p50 {percentile(samples, 50):8.2f} ms   p99 {percentile(samples, 99):8.2f} ms'
+            )
+            for line in queryset[:page_size].explain().splitlines():
+                self.stdout.write(f'    {line}')
+
+    def analyze(self):
+        # Without fresh statistics SQLite may scan the partial index for unrelated filters
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def drop_indexes(self):
+        with connection.schema_editor() as editor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    editor.remove_index(model, index)
+        self.analyze()
+
+    def create_indexes(self):
+        with connection.schema_editor() as editor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    editor.add_index(model, index)
+        self.analyze()
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from rest_framework.filters import SearchFilter
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from products.benchmarking import clear_catalog, percentile, seed_catalog, time_call
+from products.models import Product
+from products.search import search_products
+from products.views import ProductPagination
+
+TERMS = ['wireless', 'gaming laptop', 'lap', 'pro max silver', 'nothing-matches']
+
+
+class LegacySearchView:
+    # What ProductList used before the full-text index
+    search_fields = ['name']
+
+
+def legacy_search(text):
+    request = Request(APIRequestFactory().get('/', {'search': text}))
+    return SearchFilter().filter_queryset(request, Product.objects.all(), LegacySearchView())
+
+
+def fulltext_search(text):
+    return search_products(Product.objects.all(), text)
+
+
+class Command(BaseCommand):
+    help = 'Compare the FTS5 product search with the old SearchFilter over name on a large catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse rows from an earlier run')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the seeded rows afterwards')
+
+    def handle(self, *args, **options):
+        if not options['skip_seed']:
+            seed_catalog(options['products'], log=self.stdout.write)
+
+        page_size = ProductPagination.page_size
+        for text in TERMS:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== {text!r} =='))
+            for label, build in (('SearchFilter', legacy_search), ('FTS5', fulltext_search)):
+                queryset = build(text)
+
+                def run():
+                    # Same two queries the paginated list view issues
+                    queryset.count()
+                    list(queryset[:page_size])
+
+                samples = time_call(run, options['repeat'])
+                self.stdout.write(
+                    f'{label:<14} matches {queryset.count():>8}   '
+                    f'p50 {percentile(samples, 50):8.2f} ms   p99 {percentile(samples, 99):8.2f} ms'
+                )
+
+        if options['cleanup']:
+            clear_catalog()
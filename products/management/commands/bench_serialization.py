@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from products import renderers
+from products.benchmarking import clear_catalog, percentile, seed_catalog, time_call
+from products.models import Order, Product
+from products.renderers import FastJSONRenderer
+from products.serializers import OrderSerializer, ProductSerializer, ValuesListSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare ModelSerializer + JSONRenderer against the values() fast path on list pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--orders', type=int, default=100_000)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse rows from an earlier run')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the seeded rows afterwards')
+
+    def handle(self, *args, **options):
+        if not options['skip_seed']:
+            seed_catalog(options['products'], orders=options['orders'], log=self.stdout.write)
+
+        request = APIRequestFactory().get('/', HTTP_HOST='localhost')
+        context = {'request': request}
+        page_size = options['page_size']
+        self.stdout.write(f'JSON encoder for the fast path: {"orjson" if renderers.orjson else "json"}')
+
+        for label, queryset, serializer_class in (
+            ('products', Product.objects.order_by('-created_date', '-id'), ProductSerializer),
+            ('orders', Order.objects.order_by('-order_date', '-id'), OrderSerializer),
+        ):
+            fast = ValuesListSerializer(serializer_class, context)
+
+            def model_path():
+                page = list(queryset[:page_size])
+                return JSONRenderer().render(serializer_class(page, many=True, context=context).data)
+
+            def fast_path():
+                page = list(queryset.values(*fast.columns)[:page_size])
+                return FastJSONRenderer().render(fast.to_representation(page))
+
+            if model_path() != fast_path():
+                raise CommandError(f'{label}: fast path output differs from the serializer')
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== {label}, {page_size} rows per page =='))
+            for name, run in (('ModelSerializer', model_path), ('values() fast path', fast_path)):
+                samples = time_call(run, options['repeat'])
+                p50 = percentile(samples, 50)
+                self.stdout.write(
+                    f'{name:<18} p50 {p50:8.2f} ms   p99 {percentile(samples, 99):8.2f} ms   '
+                    f'{page_size / p50 * 1000:10.0f} rows/sec'
+                )
+
+        if options['cleanup']:
+            clear_catalog()
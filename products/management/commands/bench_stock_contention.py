@@ -0,0 +1,84 @@
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+
+from products.models import Category, Product, Order
+from products.stock import place_order
+
+
+class Command(BaseCommand):
+    help = 'Place orders for one product from many threads and check that stock is never oversold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--orders-per-thread', type=int, default=100)
+        parser.add_argument('--stock', type=int, default=1000)
+        parser.add_argument('--quantity', type=int, default=1)
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark rows afterwards')
+
+    def handle(self, *args, **options):
+        user, _ = get_user_model().objects.get_or_create(username='bench-stock-user')
+        category, _ = Category.objects.get_or_create(name='bench-stock-category')
+        product = Product.objects.create(
+            name='bench-stock-product',
+            description='Stock contention benchmark product',
+            price='1.00',
+            category=category,
+            stock_quantity=options['stock'],
+        )
+
+        counts = {'placed': 0, 'rejected': 0, 'errors': 0}
+        lock = threading.Lock()
+        start = threading.Barrier(options['threads'])
+
+        def worker():
+            placed = rejected = errors = 0
+            # Each thread works on its own copy of the row, like separate requests would
+            own_product = Product.objects.get(pk=product.pk)
+            start.wait()
+            for _ in range(options['orders_per_thread']):
+                try:
+                    place_order(user, own_product, options['quantity'])
+                    placed += 1
+                except ValidationError:
+                    rejected += 1
+                except OperationalError:
+                    errors += 1
+            connection.close()
+            with lock:
+                counts['placed'] += placed
+                counts['rejected'] += rejected
+                counts['errors'] += errors
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+
+        product.refresh_from_db()
+        ordered = sum(Order.objects.filter(product=product).values_list('quantity', flat=True))
+        oversold = ordered - options['stock']
+
+        self.stdout.write(f"threads:        {options['threads']}")
+        self.stdout.write(f"attempts:       {options['threads'] * options['orders_per_thread']}")
+        self.stdout.write(f"placed:         {counts['placed']}")
+        self.stdout.write(f"rejected:       {counts['rejected']}")
+        self.stdout.write(f"db errors:      {counts['errors']}")
+        self.stdout.write(f"orders/sec:     {counts['placed'] / elapsed:.1f}")
+        self.stdout.write(f"stock left:     {product.stock_quantity}")
+        self.stdout.write(f"oversold units: {max(oversold, 0)}")
+
+        if not options['keep']:
+            product.delete()
+
+        if oversold > 0 or product.stock_quantity != options['stock'] - ordered:
+            self.stderr.write(self.style.ERROR('Stock was oversold'))
+            raise SystemExit(1)
+        self.stdout.write(self.style.SUCCESS('No oversell'))
@@ -0,0 +1,56 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+
+from products import fragments
+from products.benchmarking import clear_catalog, percentile, seed_catalog, time_call
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Time rendering a product page with cold and warm template fragment caches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10_000)
+        parser.add_argument('--page-size', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse rows from an earlier run')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the seeded rows afterwards')
+
+    def handle(self, *args, **options):
+        if not options['skip_seed']:
+            seed_catalog(options['products'], log=self.stdout.write)
+
+        request = RequestFactory().get('/', HTTP_HOST='localhost')
+        request.user = AnonymousUser()
+        page_size = options['page_size']
+        # Rows are fetched once, so only template rendering is timed
+        products = list(Product.objects.order_by('-created_date', '-id')[:page_size])
+        cache = fragments.get_cache()
+
+        for template in ('product-list.html', 'user-dashboard.html'):
+            context = {
+                'products': Paginator(products, page_size).page(1),
+                'orders': Paginator([], page_size).page(1),
+                'orders_fragment': 'bench',
+            }
+
+            def render():
+                return render_to_string(template, context, request)
+
+            def render_cold():
+                cache.clear()
+                return render()
+
+            render()  # Load and compile the templates
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== {template}, {page_size} products =='))
+            for name, run in (('cold fragment cache', render_cold), ('warm fragment cache', render)):
+                samples = time_call(run, options['repeat'])
+                self.stdout.write(
+                    f'{name:<20} p50 {percentile(samples, 50):8.2f} ms   p99 {percentile(samples, 99):8.2f} ms'
+                )
+
+        if options['cleanup']:
+            clear_catalog()
@@ -0,0 +1,61 @@
+import os
+import tempfile
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from products import throttling
+from products.benchmarking import percentile
+from products.views import ProductList
+
+
+class Command(BaseCommand):
+    help = 'Time one throttle check against the shared memory bucket store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checks', type=int, default=200_000)
+        parser.add_argument('--clients', type=int, default=10_000, help='Distinct addresses the checks are spread over')
+
+    def handle(self, *args, **options):
+        checks, clients = options['checks'], options['clients']
+        with tempfile.TemporaryDirectory() as directory:
+            store = throttling.BucketStore(os.path.join(directory, 'buckets'))
+            # What the throttles use for the rest of this run
+            throttling._store, throttling._store_pid = store, os.getpid()
+            keys = [f'products:ip:10.0.{i // 256}.{i % 256}' for i in range(clients)]
+
+            def take(i):
+                store.take(keys[i % clients], 600, 10)
+            self.report('BucketStore.take', take, checks)
+
+            factory = RequestFactory()
+            view = ProductList()
+            requests = []
+            for i in range(min(clients, 1000)):
+                request = Request(factory.get('/products/api/v1/products/', REMOTE_ADDR=f'10.1.{i // 256}.{i % 256}'))
+                request.user = AnonymousUser()
+                requests.append(request)
+            throttles = view.get_throttles()
+
+            def check(i):
+                # What APIView.check_throttles runs: the client and the endpoint bucket
+                request = requests[i % len(requests)]
+                for throttle in throttles:
+                    throttle.allow_request(request, view)
+            self.report(f'{len(throttles)} throttles per request', check, checks)
+
+    def report(self, name, func, checks):
+        samples = []
+        batch = 100
+        for start in range(0, checks, batch):
+            began = time.perf_counter()
+            for i in range(start, start + batch):
+                func(i)
+            samples.append((time.perf_counter() - began) / batch * 1e6)
+        self.stdout.write(
+            f'{name:<28} mean {sum(samples) / len(samples):6.2f} us   p50 {percentile(samples, 50):6.2f} us   '
+            f'p99 {percentile(samples, 99):6.2f} us   (per check, batches of {batch})'
+        )
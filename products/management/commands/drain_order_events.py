@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.transitions import OUTBOX_BATCH_SIZE, drain_outbox, purge_published
+
+
+class Command(BaseCommand):
+    help = 'Publish the order status events waiting in the outbox, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=OUTBOX_BATCH_SIZE, help='Events published per transaction')
+        parser.add_argument('--follow', action='store_true', help='Keep polling for new events')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls with --follow')
+        parser.add_argument('--purge-after', type=int, help='Also delete events published more than this many days ago')
+
+    def handle(self, *args, **options):
+        while True:
+            published = drain_outbox(batch_size=options['batch_size'])
+            if published or not options['follow']:
+                self.stdout.write(f'Published {published} order events')
+            if options['purge_after'] is not None:
+                purged = purge_published(options['purge_after'])
+                if purged:
+                    self.stdout.write(f'Purged {purged} published order events')
+            if not options['follow']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,53 @@
+import resource
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.importing import DEFAULT_CHUNK_SIZE, ProductImporter, read_feed
+
+
+class Command(BaseCommand):
+    help = 'Upsert products from a CSV or NDJSON catalog feed, keyed on sku'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Feed file, or '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        start = time.perf_counter()
+
+        def progress(importer):
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f'{importer.rows} rows  {importer.rows / elapsed:,.0f} rows/sec  '
+                f'max RSS {max_rss_mb():.0f} MB'
+            )
+
+        importer = ProductImporter(chunk_size=options['chunk_size'], on_chunk=progress)
+        try:
+            if path == '-':
+                summary = importer.run(read_feed(sys.stdin, format))
+            else:
+                with open(path, encoding='utf-8', newline='') as feed:
+                    summary = importer.run(read_feed(feed, format))
+        except OSError as e:
+            raise CommandError(e)
+
+        elapsed = time.perf_counter() - start
+        for error in summary['errors']:
+            self.stderr.write(f"row {error['row']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['rows']} rows in {elapsed:.1f}s ({summary['rows'] / max(elapsed, 1e-9):,.0f} rows/sec): "
+            f"{summary['created']} created, {summary['updated']} updated, {summary['rejected']} rejected. "
+            f"Max RSS {max_rss_mb():.0f} MB"
+        ))
+
+
+def max_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from products.listings import BATCH_SIZE, rebuild_listings
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the ProductListing catalog read model from the Product table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        count = rebuild_listings(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Listed {count} products'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from products.models import Product
+from products.search import fts_enabled, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product full-text search index from the Product table'
+
+    def handle(self, *args, **options):
+        if not fts_enabled():
+            self.stdout.write('Full-text index is only used on SQLite, nothing to do')
+            return
+        rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {Product.objects.count()} products'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from products.analytics import refresh
+
+
+class Command(BaseCommand):
+    help = 'Fold the order changes queued since the last refresh into the analytics rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Rebuild every rollup from the whole Order table, e.g. after writes that skipped signals',
+        )
+
+    def handle(self, *args, **options):
+        count = refresh(full=options['full'])
+        if options['full']:
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} daily sales buckets'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Folded {count} queued order changes into the rollups'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from products.holds import SWEEP_BATCH_SIZE, sweep_expired_holds
+
+
+class Command(BaseCommand):
+    help = 'Give the stock of expired cart holds back to their products'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SWEEP_BATCH_SIZE, help='Holds released per transaction')
+
+    def handle(self, *args, **options):
+        swept = sweep_expired_holds(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Swept {swept} expired holds'))
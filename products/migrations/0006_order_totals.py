@@ -0,0 +1,72 @@
+from django.db import migrations, models, transaction
+from django.db.models import F, OuterRef, Subquery
+
+BACKFILL_CHUNK_SIZE = 5000
+
+
+def backfill_order_totals(apps, schema_editor):
+    """Copy each order's current product price into unit_price and total_price
+
+    Runs in primary key ranges, each in its own transaction, so a large orders table
+    is never locked or rewritten in one go.
+    """
+    Order = apps.get_model('products', 'Order')
+    Product = apps.get_model('products', 'Product')
+    db = schema_editor.connection.alias
+    price = Subquery(Product.objects.using(db).filter(pk=OuterRef('product_id')).values('price')[:1])
+    orders = Order.objects.using(db)
+    last_pk = 0
+    while True:
+        ids = list(orders.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:BACKFILL_CHUNK_SIZE])
+        if not ids:
+            break
+        with transaction.atomic(using=db):
+            chunk = orders.filter(pk__gte=ids[0], pk__lte=ids[-1])
+            chunk.filter(unit_price__isnull=True).update(unit_price=price)
+            chunk.filter(total_price__isnull=True).update(total_price=F('quantity') * F('unit_price'))
+        last_pk = ids[-1]
+
+
+class Migration(migrations.Migration):
+    # Each backfill chunk commits on its own
+    atomic = False
+
+    dependencies = [
+        ('products', '0005_product_sku'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.RunPython(backfill_order_totals, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='order',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, max_digits=14),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'total_price'], name='order_user_revenue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_date', 'total_price'], name='order_date_revenue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['product', 'total_price'], name='order_product_revenue_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_stock_holds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(max_length=50)),
+                ('to_status', models.CharField(max_length=50)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('published_date', models.DateTimeField(blank=True, null=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='products.order')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('published_date__isnull', True)), fields=['id'], name='order_event_unpublished_idx'), models.Index(fields=['published_date'], name='order_event_published_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_listings(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductListing = apps.get_model('products', 'ProductListing')
+    storage = Product._meta.get_field('image').storage
+    rows = Product.objects.order_by('pk').values(
+        'id', 'sku', 'name', 'description', 'price', 'category_id', 'category__name',
+        'stock_quantity', 'image', 'image_hash', 'created_date', 'updated_date',
+    )
+    batch = []
+    for row in rows.iterator(chunk_size=2000):
+        image = row['image'] or ''
+        batch.append(ProductListing(
+            id=row['id'], sku=row['sku'], name=row['name'], description=row['description'], price=row['price'],
+            category_id=row['category_id'], category_name=row['category__name'],
+            stock_quantity=row['stock_quantity'], in_stock=row['stock_quantity'] > 0,
+            image=image, image_url=storage.url(image) if image else '', image_hash=row['image_hash'],
+            created_date=row['created_date'], updated_date=row['updated_date'],
+        ))
+        if len(batch) == 2000:
+            ProductListing.objects.bulk_create(batch)
+            batch = []
+    ProductListing.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_order_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductListing',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('sku', models.CharField(blank=True, max_length=64, null=True)),
+                ('name', models.CharField(max_length=255)),
+                ('description', models.TextField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('category_name', models.CharField(max_length=255)),
+                ('stock_quantity', models.PositiveIntegerField()),
+                ('in_stock', models.BooleanField()),
+                ('image', models.CharField(blank=True, default='', max_length=100)),
+                ('image_url', models.CharField(blank=True, default='', max_length=500)),
+                ('image_hash', models.CharField(blank=True, default='', max_length=64)),
+                ('created_date', models.DateTimeField()),
+                ('updated_date', models.DateTimeField()),
+                ('category', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='listings', to='products.category')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-created_date', '-id'], name='listing_created_idx'), models.Index(fields=['category', '-created_date', '-id'], name='listing_category_created_idx'), models.Index(fields=['category', 'price'], name='listing_category_price_idx'), models.Index(fields=['price'], name='listing_price_idx'), models.Index(condition=models.Q(('in_stock', True)), fields=['category', 'price'], name='listing_in_stock_idx')],
+            },
+        ),
+        migrations.RunPython(populate_listings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_product_listings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('product_id', models.BigIntegerField()),
+                ('status', models.CharField(max_length=50)),
+                ('orders', models.IntegerField()),
+                ('quantity', models.IntegerField()),
+                ('revenue', models.DecimalField(decimal_places=2, max_digits=16)),
+            ],
+        ),
+        migrations.DeleteModel(
+            name='AnalyticsWatermark',
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:12
+
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def rebuild_rollups(apps, schema_editor):
+    """Recompute DailySales and OrderStatusCount from Order, as analytics.rebuild() does
+
+    Orders placed before the rollups existed, or before 0012 dropped the watermark
+    that refresh used to catch up from, are otherwise never counted.
+    """
+    Order = apps.get_model('products', 'Order')
+    DailySales = apps.get_model('products', 'DailySales')
+    OrderStatusCount = apps.get_model('products', 'OrderStatusCount')
+    RollupDelta = apps.get_model('products', 'RollupDelta')
+    RollupDelta.objects.all().delete()
+    DailySales.objects.all().delete()
+    rows = (
+        Order.objects.annotate(day=TruncDate('order_date'))
+        .values('day', 'product_id', 'product__category_id')
+        .annotate(orders=Count('pk'), quantity=Sum('quantity'), revenue=Sum('total_price'))
+        .order_by()
+    )
+    DailySales.objects.bulk_create(
+        (
+            DailySales(
+                day=row['day'], product_id=row['product_id'], category_id=row['product__category_id'],
+                orders=row['orders'], quantity=row['quantity'], revenue=row['revenue'],
+            )
+            for row in rows.iterator(chunk_size=5000)
+        ),
+        batch_size=5000,
+    )
+    OrderStatusCount.objects.all().delete()
+    OrderStatusCount.objects.bulk_create(
+        OrderStatusCount(status=status, count=count)
+        for status, count in Order.objects.values_list('status').annotate(count=Count('pk')).order_by()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_analytics_change_queue'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_rollups, migrations.RunPython.noop),
+    ]
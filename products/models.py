@@ -1,7 +1,13 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+from .signals import stock_changed
 
 # Custom User Model
 class CustomUser(AbstractUser):
@@ -49,34 +55,66 @@ class Category(models.Model):
 
 # Product Model
 class Product(models.Model):
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)  # Catalog feed key for bulk imports
     name = models.CharField(max_length=255)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     category = models.ForeignKey(Category, related_name='products', on_delete=models.CASCADE)
-    stock_quantity = models.PositiveIntegerField()
+    stock_quantity = models.PositiveIntegerField()  # Available to buy: cart holds are already taken out
+    held_quantity = models.PositiveIntegerField(default=0, editable=False)  # Set aside by cart holds, see products/holds.py
     image = models.ImageField(upload_to='product_images/', blank=True, null=True)  # ImageField for product image
+    # Content hash naming the resized variants of image, set once they exist (see products/images.py)
+    image_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
     created_date = models.DateTimeField(auto_now_add=True)
+    updated_date = models.DateTimeField(auto_now=True)  # Also set by queryset updates; feeds ETag/Last-Modified
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'image' in field_names:
+            # Lets products/images.py tell a new upload from the image its variants were made from
+            instance._loaded_image = values[field_names.index('image')] or None
+        if 'category_id' in field_names:
+            # Lets products/cache.py invalidate the lists of the category a save moves it out of
+            instance._loaded_category_id = values[field_names.index('category_id')]
+        return instance
+
     def reduce_stock(self, quantity):
-        """Reduce stock quantity when an order is placed"""
+        """Reduce stock quantity when an order is placed
+
+        The check and the decrement happen in a single conditional UPDATE, so
+        concurrent orders can never take the stock below zero.
+        """
         if quantity <= 0:
             raise ValidationError("Quantity must be a positive integer.")
-        if self.stock_quantity >= quantity:
-            self.stock_quantity -= quantity
-            self.save()
-            return True
-        raise ValidationError("Not enough stock available.")
+        updated = Product.objects.filter(pk=self.pk, stock_quantity__gte=quantity).update(
+            stock_quantity=F('stock_quantity') - quantity, updated_date=timezone.now(),
+        )
+        if not updated:
+            raise ValidationError("Not enough stock available.")
+        self.refresh_from_db(fields=['stock_quantity'])
+        stock_changed.send(sender=Product, product_ids=[self.pk], category_ids=[self.category_id])
+        return True
 
     def get_stock_status(self):
         """Returns True if stock is available"""
         return self.stock_quantity > 0
 
-    def get_image_url(self):
-        """Returns the URL of the product image"""
-        return self.image.url if self.image else '/static/default_image.jpg'
+    def get_image_url(self, size=None, format='jpeg'):
+        """Returns the URL of the product image
+
+        With a size in CSS pixels, the smallest resized variant at least that wide
+        (as 'jpeg' or 'webp'), or the original until its variants have been rendered.
+        """
+        if not self.image:
+            return '/static/default_image.jpg'
+        if size is not None and self.image_hash:
+            from .images import variant_url
+            return variant_url(self.image_hash, size, format)
+        return self.image.url
 
     class Meta:
         permissions = [
@@ -85,6 +123,39 @@ class Product(models.Model):
             ("can_manage_product_visibility", "Can manage product visibility"),
             ("can_view_product", "Can view product"),
         ]
+        # Matched to the ProductList filters (category, price, in_stock) and the
+        # created_date/id keyset ordering
+        indexes = [
+            models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+            models.Index(fields=['price'], name='product_price_idx'),
+            models.Index(fields=['name'], name='product_name_idx'),
+            models.Index(fields=['-created_date', '-id'], name='product_created_idx'),
+            models.Index(
+                fields=['category', 'price'], condition=models.Q(stock_quantity__gt=0), name='product_in_stock_idx',
+            ),
+            # Low-stock lists read the first rows of this index
+            models.Index(fields=['stock_quantity', 'id'], name='product_stock_idx'),
+        ]
+
+
+class OrderQuerySet(models.QuerySet):
+    """Revenue aggregates over the stored order totals, computed in the database"""
+
+    def revenue(self):
+        return self.aggregate(revenue=Sum('total_price'))['revenue'] or Decimal('0.00')
+
+    def revenue_by_user(self):
+        return self.values('user').annotate(revenue=Sum('total_price')).order_by('user')
+
+    def revenue_by_day(self):
+        return self.annotate(day=TruncDate('order_date')).values('day').annotate(revenue=Sum('total_price')).order_by('day')
+
+    def revenue_by_category(self):
+        return (
+            self.values('product__category')
+            .annotate(revenue=Sum('total_price'))
+            .order_by('product__category')
+        )
 
 
 # Order Model
@@ -100,24 +171,192 @@ class Order(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
+    # Captured from the product when the order is placed, so later price changes leave it alone
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    total_price = models.DecimalField(max_digits=14, decimal_places=2)
     order_date = models.DateTimeField(auto_now_add=True)
+    updated_date = models.DateTimeField(auto_now=True)
     status = models.CharField(max_length=50, choices=STATUS_CHOICES, default='Pending')
 
+    objects = OrderQuerySet.as_manager()
+
+    # What an order contributes to the analytics rollups
+    ROLLUP_FIELDS = ('order_date', 'product_id', 'status', 'quantity', 'total_price')
+
     def __str__(self):
         return f"Order {self.id} by {self.user.username}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'status' in field_names:
+            # Lets products/transitions.py see which status a save moves the order from
+            instance._loaded_status = values[field_names.index('status')]
+        if 'product_id' in field_names:
+            # Lets save() tell an order moved to another product, which is priced afresh
+            instance._loaded_product_id = values[field_names.index('product_id')]
+        if all(name in field_names for name in cls.ROLLUP_FIELDS):
+            # Lets products/analytics.py take back what the order counted for before a save
+            instance._loaded_rollup_state = tuple(values[field_names.index(name)] for name in cls.ROLLUP_FIELDS)
+        return instance
+
+    def save(self, *args, **kwargs):
+        loaded_product_id = self.__dict__.get('_loaded_product_id')
+        if self.unit_price is None or (loaded_product_id is not None and loaded_product_id != self.product_id):
+            self.unit_price = self.product.price
+        self.total_price = self.quantity * Decimal(self.unit_price)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'quantity', 'product', 'product_id'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'unit_price', 'total_price'}
+        super().save(*args, **kwargs)
+        self._loaded_product_id = self.product_id
+
     def clean(self):
         """Ensure quantity is positive"""
         if self.quantity <= 0:
             raise ValidationError('Quantity must be a positive integer.')
 
     def order_total(self):
-        """Calculate the total cost of the order"""
-        return self.quantity * self.product.price
+        """Total cost of the order at the price it was placed at"""
+        return self.total_price
 
     class Meta:
         permissions = [
             ("can_manage_orders", "Can manage orders"),
             ("can_view_order", "Can view order"),
         ]
-        ordering = ['-order_date']
\ No newline at end of file
+        ordering = ['-order_date']
+        indexes = [
+            models.Index(fields=['user', '-order_date'], name='order_user_date_idx'),
+            models.Index(fields=['-order_date', '-id'], name='order_date_idx'),
+            # Cover the revenue aggregates so they are answered from the index alone
+            models.Index(fields=['user', 'total_price'], name='order_user_revenue_idx'),
+            models.Index(fields=['order_date', 'total_price'], name='order_date_revenue_idx'),
+            models.Index(fields=['product', 'total_price'], name='order_product_revenue_idx'),
+            models.Index(fields=['status'], name='order_status_idx'),
+            models.Index(fields=['updated_date'], name='order_updated_idx'),
+        ]
+
+
+# Outbox of order status changes, written in the same transaction as the change and
+# published in batches by the drain_order_events worker (see products/transitions.py)
+class OrderEvent(models.Model):
+    order = models.ForeignKey(Order, related_name='events', on_delete=models.CASCADE)
+    from_status = models.CharField(max_length=50)
+    to_status = models.CharField(max_length=50)
+    created_date = models.DateTimeField(auto_now_add=True)
+    published_date = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Order {self.order_id}: {self.from_status} -> {self.to_status}"
+
+    class Meta:
+        indexes = [
+            # The worker reads unpublished events oldest first; published ones stay out of the index
+            models.Index(fields=['id'], condition=models.Q(published_date__isnull=True), name='order_event_unpublished_idx'),
+            models.Index(fields=['published_date'], name='order_event_published_idx'),
+        ]
+
+
+# Stock set aside for a user's cart until expires_at (see products/holds.py)
+class StockHold(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='stock_holds', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='holds', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    created_date = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Hold of {self.quantity} x {self.product_id} for user {self.user_id}"
+
+    class Meta:
+        indexes = [
+            # The sweep reads expired holds oldest first; checkout reads a user's live ones
+            models.Index(fields=['expires_at'], name='hold_expires_idx'),
+            models.Index(fields=['user', 'expires_at'], name='hold_user_expires_idx'),
+            models.Index(fields=['product', 'expires_at'], name='hold_product_expires_idx'),
+        ]
+
+
+# ================== Catalog read model ==================
+# Maintained by products/listings.py; the product list API and pages read it instead
+# of Product joined to Category.
+
+class ProductListing(models.Model):
+    """One row per product, holding what catalog browsing reads"""
+    id = models.BigIntegerField(primary_key=True)  # The product's id
+    sku = models.CharField(max_length=64, null=True, blank=True)
+    name = models.CharField(max_length=255)
+    description = models.TextField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    category = models.ForeignKey(Category, related_name='listings', on_delete=models.CASCADE, db_index=False)
+    category_name = models.CharField(max_length=255)
+    stock_quantity = models.PositiveIntegerField()
+    in_stock = models.BooleanField()
+    image = models.CharField(max_length=100, blank=True, default='')  # The stored file name, as in Product.image
+    image_url = models.CharField(max_length=500, blank=True, default='')  # Its storage URL, worked out once
+    image_hash = models.CharField(max_length=64, blank=True, default='')
+    created_date = models.DateTimeField()
+    updated_date = models.DateTimeField()
+
+    def __str__(self):
+        return self.name
+
+    def get_image_url(self, size=None, format='jpeg'):
+        """Product.get_image_url() from the stored columns"""
+        if not self.image:
+            return '/static/default_image.jpg'
+        if size is not None and self.image_hash:
+            from .images import variant_url
+            return variant_url(self.image_hash, size, format)
+        return self.image_url
+
+    class Meta:
+        # Matched to the ProductList filters and the created_date/id keyset ordering,
+        # like the Product indexes they take over from
+        indexes = [
+            models.Index(fields=['-created_date', '-id'], name='listing_created_idx'),
+            models.Index(fields=['category', '-created_date', '-id'], name='listing_category_created_idx'),
+            models.Index(fields=['category', 'price'], name='listing_category_price_idx'),
+            models.Index(fields=['price'], name='listing_price_idx'),
+            models.Index(fields=['category', 'price'], condition=models.Q(in_stock=True), name='listing_in_stock_idx'),
+        ]
+
+
+# ================== Analytics rollups ==================
+# Maintained by products/analytics.py; the dashboard reads these instead of scanning Order.
+
+class DailySales(models.Model):
+    """Orders, units and revenue per product per day"""
+    day = models.DateField()
+    product = models.ForeignKey(Product, related_name='daily_sales', on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, related_name='daily_sales', on_delete=models.CASCADE)  # At the time of sale
+    orders = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='daily_sales_day_product_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'category'], name='daily_sales_day_category_idx'),
+        ]
+
+
+class OrderStatusCount(models.Model):
+    status = models.CharField(max_length=50, primary_key=True)
+    count = models.IntegerField(default=0)
+
+
+class RollupDelta(models.Model):
+    """What one order's state adds to the rollups (orders=1) or takes from them (orders=-1)
+
+    Queued by order writes and folded into DailySales and OrderStatusCount by refresh_analytics.
+    """
+    day = models.DateField()
+    product_id = models.BigIntegerField()  # No foreign key, so deleting a product leaves its queued deltas alone
+    status = models.CharField(max_length=50)
+    orders = models.IntegerField()
+    quantity = models.IntegerField()
+    revenue = models.DecimalField(max_digits=16, decimal_places=2)
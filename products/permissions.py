@@ -0,0 +1,231 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.permissions import BasePermission
+
+from .models import CustomUser
+
+# Compiled permission sets.
+#
+# Django's ModelBackend loads a user's permissions with two queries (their own and
+# their groups') the first time each request's user object is checked. Here a user's
+# effective permissions are compiled once into an int, bit n set for the permission
+# with pk n, and cached under the user's key together with a global generation.
+# Active superusers hold every bit. The role field is picked at signup, so it grants
+# nothing. Changing a user, their permissions or their groups deletes their entry;
+# changing what a group or permission grants bumps the generation, which retires
+# every entry at once. Permission names map to bits through a table of
+# auth_permission loaded once per process. Both only reach the cache this process
+# uses, so PERMISSION_CACHE_TIMEOUT is short unless the caches are shared.
+
+CACHE_ALIAS = getattr(settings, 'PERMISSION_CACHE_ALIAS', 'default')
+CACHE_TIMEOUT = getattr(settings, 'PERMISSION_CACHE_TIMEOUT', 3600)
+
+GENERATION_KEY = 'permissions:generation'
+ALL = -1  # Every bit set
+
+_names = None  # 'app_label.codename' -> the bits of the permissions with that name
+_unknown = set()
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def user_key(user_id):
+    return f'permissions:user:{user_id}'
+
+
+def load_names():
+    global _names
+    names = {}
+    for app_label, codename, pk in Permission.objects.values_list('content_type__app_label', 'codename', 'pk'):
+        # Codenames repeat across models of one app (can_manage_orders is on CustomUser and Order)
+        name = f'{app_label}.{codename}'
+        names[name] = names.get(name, 0) | 1 << pk
+    _unknown.clear()
+    _names = names
+    return names
+
+
+def perm_bits(perms):
+    """The bits of the named permissions ('app_label.codename') ORed together"""
+    names = _names if _names is not None else load_names()
+    bits = 0
+    for perm in perms:
+        if perm not in names and perm not in _unknown:
+            # Possibly created since the table was loaded, by another process
+            names = load_names()
+            if perm not in names:
+                _unknown.add(perm)
+        bits |= names.get(perm, 0)
+    return bits
+
+
+def compile_bits(user):
+    """user's effective permissions, read from the database"""
+    if not user.is_active:
+        return 0
+    if user.is_superuser:
+        return ALL
+    bits = 0
+    for pk in user.user_permissions.order_by().values_list('pk', flat=True).union(
+        Permission.objects.filter(group__user=user).order_by().values_list('pk', flat=True)
+    ):
+        bits |= 1 << pk
+    return bits
+
+
+def generation(cache):
+    value = cache.get(GENERATION_KEY)
+    if value is None:
+        # From the clock, so an evicted generation never returns to a number old entries used
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        value = cache.get(GENERATION_KEY)
+    return value
+
+
+def user_bits(user):
+    """user's permission bitset, compiled on the first check and then read from the cache"""
+    if not user.is_authenticated:
+        return 0
+    try:
+        return user._permission_bits
+    except AttributeError:
+        pass
+    cache = get_cache()
+    key = user_key(user.pk)
+    found = cache.get_many([GENERATION_KEY, key])
+    current = found.get(GENERATION_KEY) or generation(cache)
+    entry = found.get(key)
+    if entry is not None and entry[0] == current:
+        bits = entry[1]
+    else:
+        # Stored under the generation read before compiling, so a bump meanwhile retires it
+        bits = compile_bits(user)
+        cache.set(key, (current, bits), CACHE_TIMEOUT)
+    user._permission_bits = bits
+    return bits
+
+
+def has_perm(user, perm):
+    return bool(user_bits(user) & perm_bits([perm]))
+
+
+def has_any_perm(user, perms):
+    return bool(user_bits(user) & perm_bits(perms))
+
+
+# Invalidation happens right away and again once the transaction commits, since a
+# check running in between can cache what the database held before the commit
+
+def forget_users(user_ids):
+    def forget():
+        get_cache().delete_many([user_key(user_id) for user_id in user_ids])
+    forget()
+    transaction.on_commit(forget)
+
+
+def bump_generation():
+    def bump():
+        try:
+            get_cache().incr(GENERATION_KEY)
+        except ValueError:
+            pass  # No generation yet, so nothing was cached under one
+    bump()
+    transaction.on_commit(bump)
+
+
+class PermissionBitsetBackend(ModelBackend):
+    """ModelBackend answering has_perm() from the cached bitset"""
+
+    def has_perm(self, user_obj, perm, obj=None):
+        return obj is None and has_perm(user_obj, perm)
+
+
+# ================== DRF permission classes ==================
+
+class BitsetPermissions(BasePermission):
+    """Requires any one of perms_map[request.method]; methods not listed are open"""
+    perms_map = {}
+
+    def has_permission(self, request, view):
+        perms = self.perms_map.get(request.method)
+        return perms is None or has_any_perm(request.user, perms)
+
+
+class ProductPermissions(BitsetPermissions):
+    """The catalog is public; changing it takes a product permission"""
+    perms_map = {
+        'POST': ['products.add_product', 'products.can_manage_products', 'products.can_manage_everything'],
+        'PUT': [
+            'products.change_product', 'products.can_manage_products', 'products.can_manage_inventory',
+            'products.can_update_product_quantity', 'products.can_manage_everything',
+        ],
+        'DELETE': ['products.delete_product', 'products.can_manage_products', 'products.can_manage_everything'],
+    }
+    perms_map['PATCH'] = perms_map['PUT']
+
+
+class OrderPermissions(BitsetPermissions):
+    """Orders are changed or deleted by their owner or by someone with an order permission"""
+    perms_map = {
+        'PUT': ['products.change_order', 'products.can_manage_orders', 'products.can_manage_everything'],
+        'PATCH': ['products.change_order', 'products.can_manage_orders', 'products.can_manage_everything'],
+        'DELETE': ['products.delete_order', 'products.can_manage_orders', 'products.can_manage_everything'],
+    }
+
+    def has_permission(self, request, view):
+        # Owners are let through here and matched against the order below
+        return request.method not in self.perms_map or request.user.is_authenticated
+
+    def has_object_permission(self, request, view, obj):
+        return obj.user_id == request.user.pk or super().has_permission(request, view)
+
+
+class OrderAdminPermissions(BitsetPermissions):
+    """Bulk order changes, for staff with an order permission"""
+    perms_map = {
+        'POST': ['products.can_manage_orders', 'products.change_order', 'products.can_manage_everything'],
+    }
+
+
+# ================== Signal receivers ==================
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_user(sender, instance, **kwargs):
+    # is_active and is_superuser decide the bitset
+    forget_users([instance.pk])
+
+@receiver(m2m_changed, sender=CustomUser.user_permissions.through)
+@receiver(m2m_changed, sender=CustomUser.groups.through)
+def invalidate_user_grants(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        forget_users([instance.pk])
+    elif pk_set is not None:
+        forget_users(pk_set)  # Added to or removed from these users through the permission or group
+    else:
+        bump_generation()  # Cleared from every user holding it
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver(post_delete, sender=Group)
+def invalidate_group(sender, action='post_delete', **kwargs):
+    if action.startswith('post_'):
+        bump_generation()
+
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def invalidate_permission(sender, created=False, **kwargs):
+    global _names
+    _names = None
+    if not created:
+        bump_generation()
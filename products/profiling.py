@@ -0,0 +1,263 @@
+import cProfile
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+
+# Opt-in request profiling (settings.PROFILING_ENABLED, or DJANGO_PROFILING=1).
+#
+# ProfilingMiddleware records per view: wall time, DB query count and DB time,
+# response rendering time and response size. Each response reports them in a
+# Server-Timing header, and /metrics exposes them as Prometheus histograms. A sampled
+# fraction of sync requests runs under cProfile; profiles of the slow ones are saved
+# to PROFILING_PROFILE_DIR.
+#
+# The metrics live in process memory, so each worker process is scraped separately.
+# Recording one request costs a few perf_counter() calls and one lock acquisition.
+
+SERVER_TIMING = getattr(settings, 'PROFILING_SERVER_TIMING', True)
+SAMPLE_RATE = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.01)
+SLOW_REQUEST_MS = getattr(settings, 'PROFILING_SLOW_REQUEST_MS', 500)
+PROFILE_DIR = getattr(settings, 'PROFILING_PROFILE_DIR', None)
+MAX_PROFILES = getattr(settings, 'PROFILING_MAX_PROFILES', 100)
+METRICS_IPS = getattr(settings, 'PROFILING_METRICS_IPS', ('127.0.0.1', '::1'))
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db', 'serialize')
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+
+
+_request_stats = ContextVar('request_stats', default=None)
+
+
+@contextmanager
+def timing(name):
+    """Add the time spent in the block to the current request's stats, if it is being profiled"""
+    stats = _request_stats.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if stats is not None:
+            setattr(stats, name, getattr(stats, name) + time.perf_counter() - start)
+
+
+# ================== Metrics ==================
+
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name, self.help, self.buckets = name, help, buckets
+        self.series = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def expose(self, label_names):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, series in sorted(self.series.items()):
+            base = ','.join(f'{name}="{value}"' for name, value in zip(label_names, labels))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), series):
+                cumulative += count
+                yield f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}'
+            yield f'{self.name}_sum{{{base}}} {series[-1]}'
+            yield f'{self.name}_count{{{base}}} {cumulative}'
+
+
+class Registry:
+    label_names = ('view', 'method')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.duration = Histogram('django_request_duration_seconds', 'Time spent handling the request.', DURATION_BUCKETS)
+        self.queries = Histogram('django_request_db_queries', 'Database queries per request.', QUERY_BUCKETS)
+        self.db = Histogram('django_request_db_duration_seconds', 'Time spent in database queries.', DURATION_BUCKETS)
+        self.serialize = Histogram(
+            'django_request_serialize_duration_seconds', 'Time spent rendering the response body.', DURATION_BUCKETS,
+        )
+        self.size = Histogram('django_response_size_bytes', 'Response body size.', SIZE_BUCKETS)
+        self.statuses = {}  # (view, method, status) -> count
+        self.profiles = 0
+
+    def record(self, view, method, status, elapsed, stats, size):
+        labels = (view, method)
+        with self.lock:
+            self.duration.observe(labels, elapsed)
+            self.queries.observe(labels, stats.queries)
+            self.db.observe(labels, stats.db)
+            self.serialize.observe(labels, stats.serialize)
+            if size is not None:
+                self.size.observe(labels, size)
+            key = (view, method, status)
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+
+    def expose(self):
+        with self.lock:
+            lines = []
+            for histogram in (self.duration, self.queries, self.db, self.serialize, self.size):
+                lines.extend(histogram.expose(self.label_names))
+            lines.append('# HELP django_responses_total Responses by view and status code.')
+            lines.append('# TYPE django_responses_total counter')
+            for (view, method, status), count in sorted(self.statuses.items()):
+                lines.append(f'django_responses_total{{view="{view}",method="{method}",status="{status}"}} {count}')
+            lines.append('# HELP django_profiles_captured_total Slow sampled requests saved as cProfile stats.')
+            lines.append('# TYPE django_profiles_captured_total counter')
+            lines.append(f'django_profiles_captured_total {self.profiles}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def metrics(request):
+    """Prometheus text exposition of this process's request metrics"""
+    if not getattr(settings, 'PROFILING_ENABLED', False) or request.META.get('REMOTE_ADDR') not in METRICS_IPS:
+        raise Http404
+    return HttpResponse(registry.expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# ================== Database instrumentation ==================
+
+def count_query(execute, sql, params, many, context):
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db += time.perf_counter() - start
+
+
+def instrument(connection):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+def instrument_new_connection(sender, connection, **kwargs):
+    instrument(connection)
+
+
+# ================== Middleware ==================
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    func = match.func
+    view_class = getattr(func, 'view_class', None) or getattr(func, 'cls', None)
+    return (view_class or func).__name__
+
+
+def response_size(response):
+    if response.streaming:
+        return None
+    return len(response.content)
+
+
+def save_profile(profiler, request, elapsed):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f'{time.strftime("%Y%m%d-%H%M%S")}-{view_name(request)}-{elapsed * 1000:.0f}ms-{os.getpid()}.prof'
+    profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+    profiles = sorted(entry for entry in os.listdir(PROFILE_DIR) if entry.endswith('.prof'))
+    for old in profiles[:-MAX_PROFILES]:
+        os.remove(os.path.join(PROFILE_DIR, old))
+    with registry.lock:
+        registry.profiles += 1
+
+
+class ProfilingMiddleware:
+    """Record timing metrics for every request; see the module comment
+
+    Runs natively in both sync and async mode, so it adds no thread hop under ASGI.
+    cProfile sampling only applies to sync requests: in the event loop it would also
+    profile every other request running at the same time.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        connection_created.connect(instrument_new_connection, dispatch_uid='products.profiling')
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        for connection in connections.all(initialized_only=True):
+            instrument(connection)
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        profiler = None
+        if PROFILE_DIR and SAMPLE_RATE and random.random() < SAMPLE_RATE:
+            profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            if profiler is None:
+                response = self.get_response(request)
+            else:
+                response = profiler.runcall(self.get_response, request)
+        finally:
+            _request_stats.reset(token)
+        elapsed = time.perf_counter() - start
+        if profiler is not None and elapsed * 1000 >= SLOW_REQUEST_MS:
+            save_profile(profiler, request, elapsed)
+        return self.finish(request, response, stats, elapsed)
+
+    async def __acall__(self, request):
+        # Sync code the request runs through sync_to_async sees the same stats object
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - start)
+
+    def process_template_response(self, request, response):
+        # Runs just before the handler renders a DRF or TemplateResponse
+        stats = _request_stats.get()
+        if stats is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                stats.serialize += time.perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, stats, elapsed):
+        registry.record(view_name(request), request.method, response.status_code, elapsed, stats, response_size(response))
+        if SERVER_TIMING:
+            response['Server-Timing'] = (
+                f'app;dur={elapsed * 1000:.1f}, db;dur={stats.db * 1000:.1f};desc="{stats.queries} queries", '
+                f'serialize;dur={stats.serialize * 1000:.1f}'
+            )
+        return response
@@ -0,0 +1,31 @@
+import json
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # Optional (pip install orjson); the stdlib C encoder is used without it
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer for payloads that are already plain JSON types, such as ValuesListSerializer output
+
+    Compact output goes through orjson when it is installed, or through json.dumps without
+    a Python-level default() hook. The bytes are the same as JSONRenderer's; anything that
+    needs the DRF encoder (Decimals, dates, lazy strings, indented output) falls back to it.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or not self.compact or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            if orjson is not None and self.ensure_ascii is False:
+                # Passthrough makes orjson refuse types whose native format differs from DRF's
+                ret = orjson.dumps(data, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS).decode()
+            else:
+                ret = json.dumps(data, ensure_ascii=self.ensure_ascii, allow_nan=not self.strict, separators=(',', ':'))
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        return ret.encode()
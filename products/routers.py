@@ -0,0 +1,43 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from e_commerce_api.databases import REPLICA_ALIAS
+
+# Sends catalog reads to the read replica when settings.DATABASES has one.
+#
+# Only code running inside read_from_replica() reads from the replica: the ProductList,
+# ProductExport and ProductDetail GET handlers, sync and async. Everything else,
+# including the read half of every write, stays on the primary, so it never sees
+# replication lag.
+#
+# Lagging catalog reads can still be cached until the next product write bumps the
+# cache version or PRODUCT_CACHE_TIMEOUT runs out.
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+@contextmanager
+def read_from_replica():
+    token = _read_alias.set(REPLICA_ALIAS if REPLICA_ALIAS in settings.DATABASES else None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,157 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Category, Product
+from .signals import products_bulk_saved
+
+# Full-text product search backed by an SQLite FTS5 table (created in migration 0003).
+# The table holds one row per product, keyed by rowid = product id, over the
+# product name, description and category name.
+
+FTS_TABLE = 'products_product_fts'
+
+# bm25 column weights for name, description and category
+RANK_WEIGHTS = (10.0, 1.0, 4.0)
+
+INDEXED_FIELDS = {'name', 'description', 'category'}
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query where every word must match as a prefix
+
+    Words are quoted so FTS5 operators and punctuation in user input are not interpreted.
+    """
+    return ' '.join(f'"{token}"*' for token in TOKEN_RE.findall(text.lower()))
+
+
+def search_products(queryset, text):
+    """Restrict a Product or ProductListing queryset to rows matching text, best matches first"""
+    match = build_match_query(text)
+    if not match:
+        return queryset
+    if not fts_enabled():
+        query = Q()
+        for token in TOKEN_RE.findall(text):
+            query &= Q(name__icontains=token) | Q(description__icontains=token) | Q(category__name__icontains=token)
+        return queryset.filter(query)
+    # extra() lets the FTS table drive a join instead of an IN (subquery) over every match.
+    # Rows are keyed by product id, so this works for ProductListing querysets too.
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = {queryset.model._meta.db_table}.id', f'{FTS_TABLE} MATCH %s'],
+        params=[match],
+        select={'search_rank': f'bm25({FTS_TABLE}, {weights})'},
+        order_by=['search_rank', '-id'],
+    )
+
+
+def index_product(product):
+    """Insert or replace the search row for a product"""
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description, category) VALUES (%s, %s, %s, %s)',
+            [product.pk, product.name, product.description, product.category.name],
+        )
+
+
+def remove_product(product_id):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product_id])
+
+
+def reindex_category(category):
+    """Update the category name on every search row in that category"""
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {FTS_TABLE} SET category = %s WHERE rowid IN '
+            f'(SELECT id FROM products_product WHERE category_id = %s)',
+            [category.name, category.pk],
+        )
+
+
+def index_products(product_ids):
+    """Refresh the search rows for many products with two statements"""
+    if not fts_enabled() or not product_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', list(product_ids))
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description, category) '
+            f'SELECT p.id, p.name, p.description, c.name FROM products_product p '
+            f'JOIN products_category c ON c.id = p.category_id WHERE p.id IN ({placeholders})',
+            list(product_ids),
+        )
+
+
+def rebuild_index():
+    """Rebuild the whole search table from Product, e.g. after bulk_create which skips signals"""
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description, category) '
+            f'SELECT p.id, p.name, p.description, c.name FROM products_product p '
+            f'JOIN products_category c ON c.id = p.category_id'
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+
+
+# ================== Index maintenance ==================
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, update_fields=None, **kwargs):
+    # Saves that only touch stock, price etc. leave the search row alone
+    if update_fields is not None and not INDEXED_FIELDS & set(update_fields):
+        return
+    index_product(instance)
+
+@receiver(post_delete, sender=Product)
+def remove_deleted_product(sender, instance, **kwargs):
+    remove_product(instance.pk)
+
+@receiver(post_save, sender=Category)
+def reindex_saved_category(sender, instance, created, **kwargs):
+    if not created:
+        reindex_category(instance)
+
+@receiver(products_bulk_saved)
+def index_bulk_saved_products(sender, product_ids, **kwargs):
+    index_products(product_ids)
+
+
+# ================== API filter ==================
+
+class ProductSearchFilter(BaseFilterBackend):
+    """Ranked full-text search over name, description and category name via ?q=
+
+    Every word is matched as a prefix, so ?q=mac pro finds "MacBook Pro". ?search=,
+    the parameter of the SearchFilter this replaced, is still read when ?q= is absent.
+    """
+    search_param = 'q'
+    legacy_search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        text = params.get(self.search_param) or params.get(self.legacy_search_param, '')
+        return search_products(queryset, text) if text.strip() else queryset
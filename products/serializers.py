@@ -1,5 +1,9 @@
+from django.contrib.auth import authenticate
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
-from .models import CustomUser, Product, Order
+from .models import CustomUser, Product, ProductListing, Order, StockHold
+from . import images
+from .transitions import check_transition
 
 # CustomUser Serializer
 class UserSerializer(serializers.ModelSerializer):
@@ -19,14 +23,188 @@ class UserSerializer(serializers.ModelSerializer):
         )
         return user
 
+# URLs of a product's resized images by format and width, or null until they are rendered
+class ImageVariantsField(serializers.Field):
+    def __init__(self, **kwargs):
+        kwargs.update(source='image_hash', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, digest):
+        if not digest:
+            return None
+        request = self.context.get('request')
+        build_absolute_uri = request.build_absolute_uri if request is not None else str
+        return {
+            format: {str(width): build_absolute_uri(images.variant_url(digest, width, format)) for width in images.VARIANT_WIDTHS}
+            for format in images.VARIANT_FORMATS
+        }
+
 # Product Serializer
 class ProductSerializer(serializers.ModelSerializer):
+    thumbnails = ImageVariantsField()
+
     class Meta:
         model = Product
-        fields = '__all__'
+        # held_quantity changes at checkout without touching updated_date, so it stays out of the cached payloads
+        exclude = ['image_hash', 'held_quantity']
+
+# The listing holds the image's storage URL already; only the host is added per request
+class ListingImageField(serializers.Field):
+    def __init__(self, **kwargs):
+        kwargs.update(source='image_url', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, url):
+        if not url:
+            return None
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+# ProductSerializer's output, read from the catalog read model (see products/listings.py)
+class ProductListingSerializer(serializers.ModelSerializer):
+    thumbnails = ImageVariantsField()
+    image = ListingImageField()
+
+    class Meta:
+        model = ProductListing
+        fields = [
+            'id', 'thumbnails', 'sku', 'name', 'description', 'price', 'stock_quantity', 'image',
+            'created_date', 'updated_date', 'category',
+        ]
 
 # Order Serializer
 class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = '__all__'
+        read_only_fields = ['unit_price', 'total_price']  # Set from the product price when the order is placed
+
+    def validate_status(self, value):
+        if self.instance is not None:
+            try:
+                check_transition(self.instance.status, value)
+            except DjangoValidationError as e:
+                raise serializers.ValidationError(e.messages)
+        return value
+
+# Exchanges a username and password for a bearer token, see products/authentication.py
+class TokenSerializer(serializers.Serializer):
+    username = serializers.CharField()
+    password = serializers.CharField(write_only=True, trim_whitespace=False)
+
+    def validate(self, attrs):
+        user = authenticate(self.context.get('request'), username=attrs['username'], password=attrs['password'])
+        if user is None:
+            raise serializers.ValidationError('Invalid username or password.')
+        attrs['user'] = user
+        return attrs
+
+# Moves many orders to one status, see products.transitions.transition
+class OrderTransitionSerializer(serializers.Serializer):
+    orders = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=10000)
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+
+# Bulk order serializers. Products are plain ids here and are resolved in one
+# query by products.stock.place_orders rather than one lookup per line.
+class OrderLineSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+# The orders go to the requesting user
+class BulkOrderSerializer(serializers.Serializer):
+    lines = OrderLineSerializer(many=True, allow_empty=False, max_length=100)
+
+# Cart holds, see products/holds.py
+class StockHoldSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StockHold
+        fields = ['id', 'user', 'product', 'quantity', 'created_date', 'expires_at']
+        # The hold goes to the requesting user and lasts HOLD_TTL from when it is placed
+        read_only_fields = ['user', 'expires_at']
+
+class CheckoutSerializer(serializers.Serializer):
+    holds = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=100)
+
+
+# Read-optimized list serialization. Rows come from .values() and each field goes
+# through a converter picked once per request, instead of the per-object, per-field
+# walk ModelSerializer does. Output matches the ModelSerializer it is built from.
+class ValuesListSerializer:
+    # Fields whose to_representation is a no-op for the values the database returns
+    passthrough_fields = (
+        serializers.IntegerField, serializers.CharField, serializers.BooleanField,
+        serializers.PrimaryKeyRelatedField, serializers.ChoiceField,
+    )
+
+    def __init__(self, serializer_class, context):
+        serializer = serializer_class(context=context)
+        self.request = context.get('request')
+        self.fields = [
+            (name, field.source, self.get_converter(field))
+            for name, field in serializer.fields.items() if not field.write_only
+        ]
+        self.columns = [source for _, source, _ in self.fields]
+
+    def values(self, queryset):
+        """The queryset as .values() rows carrying every column this serializer reads"""
+        # Explicit extra() selects (the search rank) have to be named for values() to keep ordering on them
+        return queryset.values(*self.columns, *queryset.query.extra_select)
+
+    def get_converter(self, field):
+        if isinstance(field, serializers.FileField):
+            return self.file_url_converter(field)
+        if isinstance(field, self.passthrough_fields):
+            return None
+        return field.to_representation
+
+    def file_url_converter(self, field):
+        # .values() gives the stored file name; build the URL the way FieldFile.url does
+        storage = field.parent.Meta.model._meta.get_field(field.source).storage
+        build_absolute_uri = self.request.build_absolute_uri if self.request is not None else None
+
+        def convert(name):
+            if not name:
+                return None
+            url = storage.url(name)
+            return build_absolute_uri(url) if build_absolute_uri else url
+        return convert
+
+    def to_representation(self, rows):
+        fields = self.fields
+        return [
+            {name: row[source] if convert is None or row[source] is None else convert(row[source])
+             for name, source, convert in fields}
+            for row in rows
+        ]
+
+
+# Admin analytics, built from products.analytics.summary()
+class SalesTotalsSerializer(serializers.Serializer):
+    orders = serializers.IntegerField(source='total_orders')
+    quantity = serializers.IntegerField(source='total_quantity')
+    revenue = serializers.DecimalField(source='total_revenue', max_digits=16, decimal_places=2)
+
+class DailySalesSerializer(SalesTotalsSerializer):
+    day = serializers.DateField()
+
+class CategorySalesSerializer(SalesTotalsSerializer):
+    category = serializers.IntegerField()
+    name = serializers.CharField(source='category__name')
+
+class ProductSalesSerializer(SalesTotalsSerializer):
+    product = serializers.IntegerField()
+    name = serializers.CharField(source='product__name')
+
+class LowStockSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    stock_quantity = serializers.IntegerField()
+
+class AnalyticsSummarySerializer(serializers.Serializer):
+    since = serializers.DateField()
+    totals = SalesTotalsSerializer()
+    by_day = DailySalesSerializer(many=True)
+    by_category = CategorySalesSerializer(many=True)
+    top_products = ProductSalesSerializer(many=True)
+    statuses = serializers.DictField(child=serializers.IntegerField())
+    low_stock = LowStockSerializer(many=True)
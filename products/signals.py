@@ -0,0 +1,17 @@
+from django.dispatch import Signal
+
+# Sent after stock levels are changed with a queryset UPDATE, which skips post_save.
+# Receivers get product_ids and the matching category_ids.
+stock_changed = Signal()
+
+# Sent after products are written with bulk_create/bulk_update, which skip post_save.
+# Receivers get product_ids and the matching category_ids.
+products_bulk_saved = Signal()
+
+# Sent after orders are inserted with bulk_create, which skips post_save.
+# Receivers get the created orders.
+orders_created = Signal()
+
+# Sent by the outbox worker for each batch of OrderEvent rows it publishes.
+# Receivers get the events; an exception leaves the batch to be sent again.
+order_events_published = Signal()
@@ -0,0 +1,258 @@
+import gzip
+import json
+import mimetypes
+import os
+import re
+from dataclasses import dataclass, field
+from stat import S_ISREG
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponse, HttpResponseNotAllowed
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:  # Optional; without it only .gz variants are written
+    brotli = None
+
+# Production static files, served by the application itself.
+#
+# collectstatic with CompressedManifestStaticFilesStorage writes content-hashed copies
+# of every asset (style.3f2a9c1e.css) plus .br and .gz variants of the text ones.
+# StaticFilesMiddleware indexes STATIC_ROOT once at startup and answers STATIC_URL
+# requests from that index: the best encoding the client accepts, ETag and
+# Last-Modified validators, single byte ranges, and a one-year immutable Cache-Control
+# for hashed names. MEDIA_URL is served the same way, looked up per request since
+# uploads change; resized image variants have content-hash names and are immutable too.
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.xml', '.html', '.ico', '.webmanifest'}
+# A variant is only kept when it saves at least this fraction of the original
+MIN_SAVING = 0.05
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=60'
+IMMUTABLE_MEDIA_DIRS = ('product_images/variants/',)
+
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def compress_file(path):
+    """Write .br and .gz variants next to a file where they are worth it"""
+    with open(path, 'rb') as file:
+        data = file.read()
+    compressors = [('.gz', lambda data: gzip.compress(data, 9, mtime=0))]
+    if brotli is not None:
+        compressors.insert(0, ('.br', lambda data: brotli.compress(data, quality=11)))
+    for suffix, compress in compressors:
+        compressed = compress(data)
+        if len(compressed) <= len(data) * (1 - MIN_SAVING):
+            with open(path + suffix, 'wb') as file:
+                file.write(compressed)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage that also precompresses the collected text assets"""
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # A template naming an asset that does not exist gets its plain URL (a 404), not a server error
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in {*paths, *self.hashed_files.values()}:
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS and self.exists(name):
+                compress_file(self.path(name))
+
+
+@dataclass
+class StaticFile:
+    path: str
+    size: int
+    mtime: float
+    content_type: str
+    cache_control: str
+    encodings: dict = field(default_factory=dict)  # Content-Encoding -> (path, size)
+
+    @property
+    def etag(self):
+        return f'"{self.size:x}-{int(self.mtime):x}"'
+
+
+def stat_file(path, cache_control, encodings=()):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if not S_ISREG(stat.st_mode):
+        return None
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if content_type.startswith('text/') or content_type in ('application/javascript', 'application/json'):
+        content_type += '; charset=utf-8'
+    file = StaticFile(path, stat.st_size, stat.st_mtime, content_type, cache_control)
+    for encoding, suffix in encodings:
+        try:
+            file.encodings[encoding] = (path + suffix, os.stat(path + suffix).st_size)
+        except OSError:
+            pass
+    return file
+
+
+def index_static_root(root):
+    """{url path: StaticFile} for everything collectstatic wrote to root"""
+    try:
+        with open(os.path.join(root, ManifestStaticFilesStorage.manifest_name)) as manifest:
+            hashed = set(json.load(manifest).get('paths', {}).values())
+    except (OSError, ValueError):
+        hashed = set()
+    files = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if name.endswith(('.br', '.gz')) and os.path.splitext(name)[0] in names:
+                continue  # Served as an encoding of the file it was made from
+            path = os.path.join(directory, name)
+            url = os.path.relpath(path, root).replace(os.sep, '/')
+            files[url] = stat_file(path, IMMUTABLE if url in hashed else REVALIDATE, ENCODINGS)
+    return files
+
+
+def parse_range(header, size):
+    """(start, end) of a single satisfiable byte range, 'unsatisfiable', or None to send it all"""
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None  # Malformed or multiple ranges: ignored, as RFC 9110 allows
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(size - int(last), 0), size - 1
+    if start > end or start >= size:
+        return 'unsatisfiable'
+    return start, end
+
+
+def accepted_encodings(header):
+    accepted = set()
+    for token in header.split(','):
+        name, _, params = token.partition(';')
+        params = params.replace(' ', '')
+        try:
+            quality = float(params[2:]) if params.startswith('q=') else 1
+        except ValueError:
+            continue
+        if quality > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def serve(request, file, buffered=False):
+    """The response for one static or media file
+
+    buffered reads the body into memory, for ASGI, where Django would otherwise warn
+    about and then buffer a FileResponse anyway.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    headers = {
+        'Cache-Control': file.cache_control,
+        'ETag': file.etag,
+        'Last-Modified': http_date(file.mtime),
+        'Accept-Ranges': 'bytes',
+    }
+    if file.encodings:
+        headers['Vary'] = 'Accept-Encoding'
+
+    response = get_conditional_response(request, etag=file.etag, last_modified=int(file.mtime))
+    if response is not None:
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    byte_range = None
+    if 'Range' in request.headers and request.headers.get('If-Range', file.etag) == file.etag:
+        byte_range = parse_range(request.headers['Range'], file.size)
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416, headers=headers)
+        response['Content-Range'] = f'bytes */{file.size}'
+        return response
+
+    path, size, encoding = file.path, file.size, None
+    if byte_range is None:
+        # Ranges always refer to the identity encoding
+        accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        for name, (encoded_path, encoded_size) in file.encodings.items():
+            if name in accepted:
+                path, size, encoding = encoded_path, encoded_size, name
+                break
+
+    if byte_range is not None:
+        start, end = byte_range
+        with open(path, 'rb') as content:
+            content.seek(start)
+            body = content.read(end - start + 1) if request.method == 'GET' else b''
+        response = HttpResponse(body, status=206, content_type=file.content_type, headers=headers)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+        return response
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=file.content_type, headers=headers)
+    elif buffered:
+        with open(path, 'rb') as content:
+            response = HttpResponse(content.read(), content_type=file.content_type, headers=headers)
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=file.content_type, headers=headers)
+        del response['Content-Disposition']
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Content-Length'] = size
+    return response
+
+
+class StaticFilesMiddleware:
+    """Answer STATIC_URL and MEDIA_URL requests without going through URL resolution or views"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.static_prefix = settings.STATIC_URL if settings.STATIC_URL.startswith('/') else '/' + settings.STATIC_URL
+        self.media_prefix = settings.MEDIA_URL if settings.MEDIA_URL.startswith('/') else '/' + settings.MEDIA_URL
+        self.static_files = index_static_root(settings.STATIC_ROOT) if settings.STATIC_ROOT else {}
+
+    def find(self, path):
+        if path.startswith(self.static_prefix):
+            return self.static_files.get(path[len(self.static_prefix):])
+        if settings.MEDIA_ROOT and path.startswith(self.media_prefix):
+            name = path[len(self.media_prefix):]
+            try:
+                full_path = safe_join(settings.MEDIA_ROOT, name)
+            except SuspiciousFileOperation:  # Outside MEDIA_ROOT
+                return None
+            return stat_file(full_path, IMMUTABLE if name.startswith(IMMUTABLE_MEDIA_DIRS) else REVALIDATE)
+        return None
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        file = self.find(request.path_info)
+        return serve(request, file) if file is not None else self.get_response(request)
+
+    async def __acall__(self, request):
+        file = await sync_to_async(self.find)(request.path_info)
+        if file is None:
+            return await self.get_response(request)
+        return await sync_to_async(serve)(request, file, buffered=True)
@@ -0,0 +1,90 @@
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+
+from .models import Order, Product
+from .signals import orders_created, stock_changed
+
+
+# Stock reservation for order placement
+def place_order(user, product, quantity, **fields):
+    """Create an order and take its quantity out of stock in one transaction
+
+    Raises django.core.exceptions.ValidationError when the quantity is not
+    positive or the product does not have enough stock left.
+    """
+    with transaction.atomic():
+        product.reduce_stock(quantity)
+        return Order.objects.create(user=user, product=product, quantity=quantity, **fields)
+
+
+def place_orders(user, lines):
+    """Create one order per (product_id, quantity) line with a single stock check and decrement
+
+    Lines for missing products or without enough stock are rejected; the rest are
+    placed. Returns one result dict per line, in input order.
+    """
+    with transaction.atomic():
+        # Locking in primary key order means two carts sharing products cannot deadlock
+        product_ids = sorted({product_id for product_id, _ in lines})
+        rows = (
+            Product.objects.select_for_update()
+            .filter(pk__in=product_ids)
+            .order_by('pk')
+            .values_list('pk', 'stock_quantity', 'category_id', 'price')
+        )
+        stock = {pk: stock_quantity for pk, stock_quantity, _, _ in rows}
+        categories = {pk: category_id for pk, _, category_id, _ in rows}
+        prices = {pk: price for pk, _, _, price in rows}
+
+        results = []
+        taken = Counter()
+        for product_id, quantity in lines:
+            result = {'product': product_id, 'quantity': quantity}
+            if product_id not in stock:
+                result.update(status='rejected', error='Product does not exist.')
+            elif quantity <= 0:
+                result.update(status='rejected', error='Quantity must be a positive integer.')
+            elif stock[product_id] - taken[product_id] < quantity:
+                result.update(status='rejected', error='Not enough stock available.')
+            else:
+                taken[product_id] += quantity
+                result['status'] = 'created'
+            results.append(result)
+
+        if taken:
+            # One UPDATE for every product; the WHERE clause re-checks each row's stock
+            # so nothing is oversold even where SELECT ... FOR UPDATE is a no-op
+            enough_stock = Q()
+            for product_id, quantity in taken.items():
+                enough_stock |= Q(pk=product_id, stock_quantity__gte=quantity)
+            updated = Product.objects.filter(enough_stock).update(
+                stock_quantity=Case(
+                    *(When(pk=product_id, then=F('stock_quantity') - quantity) for product_id, quantity in taken.items())
+                ),
+                updated_date=timezone.now(),
+            )
+            if updated != len(taken):
+                raise ValidationError('Stock changed while the order was being placed, please retry.')
+
+            orders = Order.objects.bulk_create([
+                # bulk_create skips Order.save(), so the prices are filled in here
+                Order(
+                    user=user, product_id=result['product'], quantity=result['quantity'],
+                    unit_price=prices[result['product']], total_price=prices[result['product']] * result['quantity'],
+                )
+                for result in results if result['status'] == 'created'
+            ])
+            created = iter(orders)
+            for result in results:
+                if result['status'] == 'created':
+                    result['order'] = next(created).pk
+
+            orders_created.send(sender=Order, orders=orders)
+            stock_changed.send(
+                sender=Product, product_ids=list(taken), category_ids=list({categories[pk] for pk in taken}),
+            )
+        return results
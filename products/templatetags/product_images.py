@@ -0,0 +1,29 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from ..images import VARIANT_WIDTHS, variant_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def product_picture(product, size, **attrs):
+    """<picture> for a product image displayed `size` CSS pixels wide
+
+    Offers every resized variant as WebP with a JPEG fallback and lets the browser pick
+    by pixel density. Until the variants exist, or without an image, it is a plain <img>.
+    Extra keyword arguments become attributes of the <img>.
+    """
+    attrs.setdefault('alt', product.name)
+    img_attrs = format_html_join(' ', '{}="{}"', sorted(attrs.items()))
+    if not product.image_hash or not product.image:
+        return format_html('<img src="{}" {}>', product.get_image_url(), img_attrs)
+
+    def srcset(format):
+        return ', '.join(f'{variant_url(product.image_hash, width, format)} {width}w' for width in VARIANT_WIDTHS)
+
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}px">'
+        '<img src="{}" srcset="{}" sizes="{}px" {}></picture>',
+        srcset('webp'), size, product.get_image_url(size), srcset('jpeg'), size, img_attrs,
+    )
@@ -1,3 +1,1296 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .models import CustomUser, Category, DailySales, Product, ProductListing, Order, OrderEvent, OrderStatusCount, StockHold
+from .serializers import OrderSerializer, ProductSerializer
+from .stock import place_order, place_orders
+from .holds import checkout, place_hold, release_holds, sweep_expired_holds
+from .signals import order_events_published, products_bulk_saved
+from .transitions import drain_outbox, transition
+from .analytics import queue_changes, refresh
+from . import cache as product_cache
+from . import async_views
+from . import profiling
+from . import routers
+from . import images
+from . import fragments
+from . import permissions
+from .authentication import issue_token
+from . import throttling
+from .staticfiles import IMMUTABLE, REVALIDATE, compress_file
+from .routers import ReplicaRouter, read_from_replica
+from e_commerce_api.databases import database_settings
+
+
+def setUpModule():
+    # A private bucket store, so earlier runs and a local dev server do not eat into the limits
+    throttling._store, throttling._store_pid = throttling.BucketStore(), os.getpid()
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='buyer', password='secret-pass-123')
+        self.category = Category.objects.create(name='Laptops')
+        self.product = Product.objects.create(
+            name='MacBook Pro', description='Laptop', price='10.00',
+            category=self.category, stock_quantity=5,
+        )
+
+    def test_reduce_stock_decrements_in_database(self):
+        self.product.reduce_stock(2)
+        self.assertEqual(self.product.stock_quantity, 3)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock_quantity, 3)
+
+    def test_reduce_stock_uses_current_row_not_stale_instance(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        self.product.reduce_stock(4)
+        with self.assertRaises(ValidationError):
+            stale.reduce_stock(4)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock_quantity, 1)
+
+    def test_place_order_out_of_stock_creates_nothing(self):
+        with self.assertRaises(ValidationError):
+            place_order(self.user, self.product, 6)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock_quantity, 5)
+
+    def test_make_order_view(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('make-order'), {'product_id': self.product.pk, 'quantity': 3})
+        self.client.post(reverse('make-order'), {'product_id': self.product.pk, 'quantity': 3})
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock_quantity, 2)
+
+    def test_order_api_create_checks_stock(self):
+        url = reverse('order-list')
+        data = {'user': self.user.pk, 'product': self.product.pk, 'quantity': 4}
+        self.assertEqual(self.client.post(url, data).status_code, 201)
+        self.assertEqual(self.client.post(url, data).status_code, 400)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock_quantity, 1)
+
+
+class QueryCountTests(TestCase):
+    """Listing views must run a fixed number of queries whatever the row count"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='buyer', password='secret-pass-123', is_staff=True, is_superuser=True,
+        )
+        self.category = Category.objects.create(name='Laptops')
+        self.client.force_login(self.user)
+        fragments.get_cache().clear()
+
+    def create_orders(self, count):
+        # Committing runs the cache invalidation, as it would after a real request. The
+        # image files do not exist, so no variants are rendered.
+        with mock.patch.object(images, 'generate_logged'), self.captureOnCommitCallbacks(execute=True):
+            for i in range(count):
+                product = Product.objects.create(
+                    name=f'Product {i}', description='Laptop', price='10.00', category=self.category,
+                    stock_quantity=10, image='product_images/pc1.jpg',
+                )
+                Order.objects.create(user=self.user, product=product, quantity=1)
+
+    def assertConstantQueries(self, url, expected):
+        for count in (1, 20):
+            self.create_orders(count)
+            with self.assertNumQueries(expected):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_user_dashboard(self):
+        self.assertConstantQueries(reverse('user-dashboard'), 6)
+
+    def test_order_list_api(self):
+        self.assertConstantQueries(reverse('order-list') + '?format=json', 5)
+
+    def test_order_detail_api(self):
+        self.create_orders(1)
+        order = Order.objects.first()
+        with self.assertNumQueries(4):
+            self.client.get(reverse('order-detail', args=[order.pk]) + '?format=json')
+
+    def test_admin_order_changelist(self):
+        self.assertConstantQueries(reverse('admin:products_order_changelist'), 5)
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        product_cache.get_cache().clear()
+        self.user = CustomUser.objects.create_user(username='buyer', password='secret-pass-123')
+        self.category = Category.objects.create(name='Laptops')
+        for i in range(25):
+            product = Product.objects.create(
+                name=f'Product {i}', description='Laptop', price='10.00', category=self.category,
+                stock_quantity=10, image='product_images/pc1.jpg',
+            )
+            Order.objects.create(user=self.user, product=product, quantity=1)
+
+    def test_order_and_user_lists_are_paginated(self):
+        response = self.client.get(reverse('order-list') + '?format=json')
+        self.assertEqual(response.json()['count'], 25)
+        self.assertEqual(len(response.json()['results']), 10)
+        response = self.client.get(reverse('user-list') + '?format=json')
+        self.assertEqual(response.json()['count'], 1)
+
+    def test_cursor_pagination_walks_every_product_once(self):
+        url = '/products/api/v1/products/?format=json&cursor='
+        seen = []
+        while url:
+            page = self.client.get(url).json()
+            seen.extend(row['id'] for row in page['results'])
+            url = page['next']
+        self.assertEqual(sorted(seen), sorted(Product.objects.values_list('id', flat=True)))
+
+    def test_product_export_streams_ndjson(self):
+        response = self.client.get(reverse('product-export') + '?format=json&in_stock=true')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 25)
+        self.assertEqual(json.loads(lines[0])['category'], self.category.pk)
+
+    def test_product_export_reads_from_the_replica(self):
+        aliases = []
+
+        def db_for_read(router, model, **hints):
+            if model is ProductListing:
+                aliases.append(routers._read_alias.get())
+
+        # The primary stands in for the replica; what matters is that the export asks for it
+        with mock.patch.object(routers, 'REPLICA_ALIAS', 'default'), mock.patch.object(ReplicaRouter, 'db_for_read', db_for_read):
+            response = self.client.get(reverse('product-export') + '?format=json&in_stock=true')
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 25)
+        self.assertTrue(aliases)
+        self.assertEqual(set(aliases), {'default'})
+
+    def test_fast_list_output_matches_model_serializers(self):
+        Product.objects.filter(pk=Product.objects.first().pk).update(description='Café   "quoted"')
+        for url, queryset, serializer_class in (
+            ('/products/api/v1/products/?format=json&cursor=', Product.objects.order_by('-created_date', '-id'), ProductSerializer),
+            (reverse('order-list') + '?format=json&cursor=', Order.objects.order_by('-order_date', '-id'), OrderSerializer),
+        ):
+            response = self.client.get(url)
+            request = response.wsgi_request
+            expected = serializer_class(queryset[:10], many=True, context={'request': request}).data
+            self.assertEqual(
+                JSONRenderer().render(expected),
+                JSONRenderer().render(response.json()['results']),
+            )
+            self.assertIn(JSONRenderer().render(expected)[1:-1], response.content)
+
+    def test_template_product_list_is_paginated(self):
+        response = self.client.get(reverse('product-list'))
+        self.assertEqual(len(response.context['products']), 12)
+
+
+class ProductSearchTests(TestCase):
+    url = '/products/api/v1/products/'
+
+    def setUp(self):
+        product_cache.get_cache().clear()
+        self.laptops = Category.objects.create(name='Laptops')
+        self.phones = Category.objects.create(name='Phones')
+        self.macbook = Product.objects.create(
+            name='MacBook Pro', description='Apple laptop', price='10.00', category=self.laptops, stock_quantity=1,
+        )
+        self.thinkpad = Product.objects.create(
+            name='ThinkPad X1', description='Business machine, lighter than a MacBook', price='10.00',
+            category=self.laptops, stock_quantity=1,
+        )
+        self.iphone = Product.objects.create(
+            name='iPhone 16', description='Smartphone', price='10.00', category=self.phones, stock_quantity=1,
+        )
+
+    def search(self, text):
+        response = self.client.get(self.url, {'q': text, 'format': 'json'})
+        return [row['id'] for row in response.json()['results']]
+
+    def test_ranks_name_matches_above_description_matches(self):
+        self.assertEqual(self.search('macbook'), [self.macbook.pk, self.thinkpad.pk])
+
+    def test_prefix_and_category_matching(self):
+        self.assertEqual(self.search('thinkp'), [self.thinkpad.pk])
+        self.assertEqual(self.search('phones'), [self.iphone.pk])
+        self.assertEqual(self.search('mac pro'), [self.macbook.pk])
+        # ?search= from before ?q= still filters
+        response = self.client.get(self.url, {'search': 'mac pro', 'format': 'json'})
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.macbook.pk])
+
+    def test_operators_in_input_are_treated_as_words(self):
+        self.assertEqual(self.search('"iphone" OR'), [])
+        self.assertEqual(self.search('iphone*'), [self.iphone.pk])
+
+    def test_index_follows_saves_and_deletes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.iphone.name = 'Galaxy S24'
+            self.iphone.save()
+        self.assertEqual(self.search('iphone'), [])
+        self.assertEqual(self.search('galaxy'), [self.iphone.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.phones.name = 'Mobiles'
+            self.phones.save()
+        self.assertEqual(self.search('mobiles'), [self.iphone.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.iphone.delete()
+        self.assertEqual(self.search('galaxy'), [])
+
+
+class ProductCacheTests(TestCase):
+    list_url = '/products/api/v1/products/'
+
+    def setUp(self):
+        product_cache.get_cache().clear()
+        product_cache.reset_stats()
+        self.laptops = Category.objects.create(name='Laptops')
+        self.phones = Category.objects.create(name='Phones')
+        self.macbook = Product.objects.create(
+            name='MacBook Pro', description='Laptop', price='10.00', category=self.laptops, stock_quantity=5,
+        )
+        self.iphone = Product.objects.create(
+            name='iPhone 16', description='Phone', price='10.00', category=self.phones, stock_quantity=5,
+        )
+
+    def detail(self):
+        return self.client.get(f'/products/api/v1/products/{self.macbook.pk}/?format=json').json()
+
+    def test_repeated_reads_skip_the_database(self):
+        self.client.get(self.list_url, {'page': 1, 'category': self.laptops.pk})
+        self.detail()
+        with self.assertNumQueries(0):
+            # Parameter order and output format do not change the key
+            self.client.get(self.list_url, {'category': self.laptops.pk, 'page': 1, 'format': 'json'})
+            self.detail()
+        # Validators and payloads are both served from the cache
+        self.assertEqual(product_cache.stats()['hits'], 4)
+
+    def test_product_save_invalidates_detail_and_lists(self):
+        self.assertEqual(self.detail()['price'], '10.00')
+        self.client.get(self.list_url, {'category': self.phones.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.macbook.price = '12.00'
+            self.macbook.save()
+        self.assertEqual(self.detail()['price'], '12.00')
+        results = self.client.get(self.list_url, {'format': 'json'}).json()['results']
+        self.assertEqual({row['id']: row['price'] for row in results}[self.macbook.pk], '12.00')
+        # Lists scoped to another category keep their cached page
+        with self.assertNumQueries(0):
+            self.client.get(self.list_url, {'category': self.phones.pk})
+
+    def test_moving_a_product_invalidates_its_old_category(self):
+        self.assertEqual(self.client.get(self.list_url, {'category': self.laptops.pk, 'format': 'json'}).json()['count'], 1)
+        macbook = Product.objects.get(pk=self.macbook.pk)
+        macbook.category = self.phones
+        with self.captureOnCommitCallbacks(execute=True):
+            macbook.save()
+        self.assertEqual(self.client.get(self.list_url, {'category': self.laptops.pk, 'format': 'json'}).json()['count'], 0)
+
+    def test_stock_decrement_invalidates_detail(self):
+        self.detail()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.macbook.reduce_stock(2)
+        self.assertEqual(self.detail()['stock_quantity'], 3)
+
+
+class ConditionalRequestTests(TestCase):
+    def setUp(self):
+        product_cache.get_cache().clear()
+        self.user = CustomUser.objects.create_user(username='buyer', password='secret-pass-123')
+        self.category = Category.objects.create(name='Laptops')
+        self.product = Product.objects.create(
+            name='MacBook Pro', description='Laptop', price='10.00', category=self.category, stock_quantity=5,
+        )
+        self.order = Order.objects.create(user=self.user, product=self.product, quantity=1)
+
+    def test_if_none_match_returns_not_modified(self):
+        for url in (
+            f'/products/api/v1/products/{self.product.pk}/?format=json',
+            '/products/api/v1/products/?format=json',
+            f'/products/api/v1/orders/{self.order.pk}/?format=json',
+            '/products/api/v1/orders/?format=json',
+        ):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('Last-Modified', response)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response.content, b'')
+
+    def test_if_modified_since_returns_not_modified(self):
+        url = f'/products/api/v1/orders/{self.order.pk}/?format=json'
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_etag_changes_with_the_row(self):
+        url = '/products/api/v1/orders/?format=json'
+        etag = self.client.get(url)['ETag']
+        Order.objects.create(user=self.user, product=self.product, quantity=2)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_if_match_guards_updates(self):
+        self.client.force_login(self.user)
+        url = f'/products/api/v1/orders/{self.order.pk}/?format=json'
+        etag = self.client.get(url)['ETag']
+        data = {'user': self.user.pk, 'product': self.product.pk, 'quantity': 3, 'status': 'Processed'}
+        response = self.client.put(url, data, content_type='application/json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        # A second client still holding the old ETag loses
+        data['quantity'] = 4
+        response = self.client.put(url, data, content_type='application/json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).quantity, 3)
+
+
+class BulkOrderTests(TestCase):
+    url = '/products/api/v1/orders/bulk/'
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='buyer', password='secret-pass-123')
+        category = Category.objects.create(name='Laptops')
+        self.macbook = Product.objects.create(
+            name='MacBook Pro', description='Laptop', price='10.00', category=category, stock_quantity=5,
+        )
+        self.thinkpad = Product.objects.create(
+            name='ThinkPad X1', description='Laptop', price='10.00', category=category, stock_quantity=1,
+        )
+        self.client.force_login(self.user)
+
+    def post(self, lines):
+        return self.client.post(self.url, {'lines': lines}, content_type='application/json')
+
+    def test_places_lines_and_reports_each_one(self):
+        response = self.post([
+            {'product': self.macbook.pk, 'quantity': 3},
+            {'product': self.thinkpad.pk, 'quantity': 2},
+            {'product': self.macbook.pk, 'quantity': 2},
+            {'product': self.macbook.pk, 'quantity': 1},
+            {'product': 999999, 'quantity': 1},
+        ])
+        self.assertEqual(response.status_code, 201)
+        statuses = [(line['status'], line.get('error')) for line in response.json()['results']]
+        self.assertEqual(statuses, [
+            ('created', None),
+            ('rejected', 'Not enough stock available.'),
+            ('created', None),
+            ('rejected', 'Not enough stock available.'),
+            ('rejected', 'Product does not exist.'),
+        ])
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(Product.objects.get(pk=self.macbook.pk).stock_quantity, 0)
+        self.assertEqual(Product.objects.get(pk=self.thinkpad.pk).stock_quantity, 1)
+
+    def test_uses_a_fixed_number_of_queries(self):
+        lines = [{'product': self.macbook.pk, 'quantity': 1}, {'product': self.thinkpad.pk, 'quantity': 1}]
+        # Session and user, savepoint, locking SELECT, one UPDATE, one INSERT, the analytics queue INSERT,
+        # the listings' stock UPDATE, release
+        with self.assertNumQueries(9):
+            self.post(lines)
+
+    def test_nothing_placed_is_a_bad_request(self):
+        response = self.post([{'product': self.thinkpad.pk, 'quantity': 2}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_requires_a_logged_in_user(self):
+        other = CustomUser.objects.create_user(username='other', password='secret-pass-123')
+        lines = [{'product': self.macbook.pk, 'quantity': 1}]
+        self.client.logout()
+        response = self.client.post(self.url, {'user': self.user.pk, 'lines': lines}, content_type='application/json')
+        self.assertIn(response.status_code, (401, 403))
+        self.assertFalse(Order.objects.exists())
+        # A user in the body is ignored: the orders are the requesting user's
+        self.client.force_login(other)
+        self.client.post(self.url, {'user': self.user.pk, 'lines': lines}, content_type='application/json')
+        self.assertEqual(Order.objects.get().user, other)
+
+
+class CartHoldTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='buyer', password='secret-pass-123')
+        self.other = CustomUser.objects.create_user(username='other', password='secret-pass-123')
+        category = Category.objects.create(name='Laptops')
+        self.product = Product.objects.create(
+            name='MacBook Pro', description='Laptop', price='10.00', category=category, stock_quantity=5,
+        )
+
+    def stock(self):
+        return Product.objects.values_list('stock_quantity', 'held_quantity').get(pk=self.product.pk)
+
+    def expire(self, *holds):
+        StockHold.objects.filter(pk__in=[hold.pk for hold in holds]).update(expires_at=timezone.now())
+
+    def test_holds_set_stock_aside_until_checkout(self):
+        place_hold(self.user, self.product.pk, 3)
+        self.assertEqual(self.stock(), (2, 3))
+        with self.assertRaisesMessage(ValidationError, 'Not enough stock available.'):
+            place_hold(self.other, self.product.pk, 3)
+
+        [order] = checkout(self.user)
+        self.assertEqual((order.quantity, order.total_price), (3, Decimal('30.00')))
+        self.assertEqual(self.stock(), (2, 0))
+        self.assertFalse(StockHold.objects.exists())
+        # The analytics rollups count the new orders once the queue is folded in
+        refresh()
+        self.assertEqual(OrderStatusCount.objects.get(status='Pending').count, 1)
+
+    def test_expired_holds_go_back_to_stock(self):
+        first = place_hold(self.user, self.product.pk, 2)
+        second = place_hold(self.user, self.product.pk, 3)
+        self.expire(first)
+        self.assertEqual(sweep_expired_holds(batch_size=1), 1)
+        self.assertEqual(self.stock(), (2, 3))
+
+        # A sold out product takes back its own expired holds before turning a buyer away
+        place_hold(self.user, self.product.pk, 2)
+        self.expire(second)
+        place_hold(self.other, self.product.pk, 3)
+        self.assertEqual(self.stock(), (0, 5))
+
+    def test_checkout_refuses_expired_holds(self):
+        hold = place_hold(self.user, self.product.pk, 2)
+        self.expire(hold)
+        with self.assertRaises(ValidationError):
+            checkout(self.user, [hold.pk])
+        self.assertFalse(Order.objects.exists())
+
+    def test_cart_api(self):
+        url = reverse('cart-hold-list')
+        self.assertIn(self.client.post(url, {'product': self.product.pk, 'quantity': 1}).status_code, (401, 403))
+        self.client.force_login(self.user)
+        response = self.client.post(url, {'user': self.other.pk, 'product': self.product.pk, 'quantity': 4})
+        self.assertEqual(response.status_code, 201)
+        # Holds always go to the requesting user
+        self.assertEqual(response.json()['user'], self.user.pk)
+        hold_id = response.json()['id']
+        self.assertEqual(self.client.post(url, {'product': self.product.pk, 'quantity': 4}).status_code, 400)
+        # Held stock no longer counts as in stock
+        other_hold = place_hold(self.other, self.product.pk, 1)
+        self.assertEqual(self.client.get('/products/api/v1/products/', {'in_stock': 'true'}).json()['count'], 0)
+
+        # Other users' holds can be neither seen nor released
+        self.assertEqual([hold['id'] for hold in self.client.get(url, {'format': 'json'}).json()], [hold_id])
+        self.assertEqual(self.client.delete(reverse('cart-hold-detail', args=[other_hold.pk])).status_code, 404)
+        self.assertEqual(self.client.delete(reverse('cart-hold-detail', args=[hold_id])).status_code, 204)
+        self.assertEqual(self.stock(), (4, 1))
+        response = self.client.post(reverse('cart-checkout'), {'holds': [other_hold.pk]}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        self.client.force_login(self.other)
+        response = self.client.post(reverse('cart-checkout'), {}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['orders']), 1)
+        self.assertEqual(self.stock(), (4, 0))
+
+
+class OrderTransitionTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='buyer', password='secret-pass-123')
+        category = Category.objects.create(name='Laptops')
+        self.macbook = Product.objects.create(
+            name='MacBook Pro', description='Laptop', price='10.00', category=category, stock_quantity=10,
+        )
+        self.mouse = Product.objects.create(
+            name='Mouse', description='Mouse', price='2.00', category=category, stock_quantity=10,
+        )
+        results = place_orders(self.user, [(self.macbook.pk, 1), (self.macbook.pk, 2), (self.mouse.pk, 3)])
+        self.orders = [result['order'] for result in results]
+
+    def stock(self):
+        return list(Product.objects.order_by('pk').values_list('stock_quantity', flat=True))
+
+    def statuses(self):
+        return list(Order.objects.order_by('pk').values_list('status', flat=True))
+
+    def test_set_based_transitions(self):
+        self.assertEqual(transition(self.orders[:1], 'Processed'), 1)
+        self.assertEqual(transition(Order.objects.filter(status='Processed'), 'Shipped', batch_size=1), 1)
+        # The shipped order cannot be cancelled; the other two are, and their stock comes back
+        with self.assertNumQueries(9):
+            self.assertEqual(transition(self.orders, 'Cancelled'), 2)
+        self.assertEqual(self.statuses(), ['Shipped', 'Cancelled', 'Cancelled'])
+        self.assertEqual(self.stock(), [9, 10])
+        self.assertEqual(
+            list(OrderEvent.objects.order_by('pk').values_list('order', 'to_status')),
+            [(self.orders[0], 'Processed'), (self.orders[0], 'Shipped'), (self.orders[1], 'Cancelled'), (self.orders[2], 'Cancelled')],
+        )
+        refresh()
+        self.assertEqual(
+            dict(OrderStatusCount.objects.filter(count__gt=0).values_list('status', 'count')), {'Shipped': 1, 'Cancelled': 2},
+        )
+
+    def test_single_order_saves_are_validated_and_recorded(self):
+        self.client.force_login(self.user)
+        url = reverse('order-detail', args=[self.orders[2]])
+        response = self.client.patch(url, {'status': 'Delivered'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(url, {'status': 'Cancelled'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stock(), [7, 10])
+        self.assertEqual(list(OrderEvent.objects.values_list('from_status', 'to_status')), [('Pending', 'Cancelled')])
+
+    def test_edit_form_moves_orders_through_transition(self):
+        url = reverse('edit-order', args=[self.orders[2]])
+        data = {'product': self.mouse.pk, 'quantity': 3, 'status': 'Cancelled'}
+        # Another user's order cannot be edited, so it cannot be cancelled and restocked either
+        CustomUser.objects.create_user(username='other', password='secret-pass-123')
+        self.client.login(username='other', password='secret-pass-123')
+        self.assertEqual(self.client.post(url, data).status_code, 403)
+        self.assertEqual(self.statuses(), ['Pending', 'Pending', 'Pending'])
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.post(url, {**data, 'status': 'Delivered'}).status_code, 200)
+        self.assertRedirects(self.client.post(url, data), reverse('user-dashboard'), fetch_redirect_response=False)
+        self.assertEqual(self.statuses(), ['Pending', 'Pending', 'Cancelled'])
+        self.assertEqual(self.stock(), [7, 10])
+        self.assertEqual(list(OrderEvent.objects.values_list('from_status', 'to_status')), [('Pending', 'Cancelled')])
+
+    def test_outbox_is_drained_in_batches(self):
+        transition(self.orders, 'Processed')
+        received = []
+
+        def receiver(sender, events, **kwargs):
+            received.append([event.order_id for event in events])
+        order_events_published.connect(receiver)
+        self.addCleanup(order_events_published.disconnect, receiver)
+
+        self.assertEqual(drain_outbox(batch_size=2), 3)
+        self.assertEqual(received, [self.orders[:2], self.orders[2:]])
+        self.assertEqual(drain_outbox(), 0)
+        self.assertFalse(OrderEvent.objects.filter(published_date__isnull=True).exists())
+
+    def test_transition_api(self):
+        admin = CustomUser.objects.create_superuser(username='boss', password='secret-pass-123')
+        self.client.force_login(admin)
+        response = self.client.post(
+            reverse('order-transition'), {'orders': [*self.orders, 999999], 'status': 'Cancelled'}, content_type='application/json',
+        )
+        self.assertEqual(response.json(), {'updated': 3, 'skipped': 1})
+        self.assertEqual(self.stock(), [10, 10])
+
+
+class PermissionTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='clerk', password='secret-pass-123')
+        self.other = CustomUser.objects.create_user(username='buyer', password='secret-pass-123')
+        category = Category.objects.create(name='Laptops')
+        self.product = Product.objects.create(
+            name='MacBook Pro', description='Laptop', price='10.00', category=category, stock_quantity=5,
+        )
+        self.order = Order.objects.create(user=self.other, product=self.product, quantity=1)
+
+    def fresh(self, user):
+        # What each request loads from the session
+        return CustomUser.objects.get(pk=user.pk)
+
+    def test_bitset_is_compiled_once_and_invalidated(self):
+        group = Group.objects.create(name='Stock clerks')
+        self.user.groups.add(group)
+        self.assertFalse(self.fresh(self.user).has_perm('products.can_manage_inventory'))
+
+        group.permissions.add(Permission.objects.get(codename='can_manage_inventory', content_type__model='product'))
+        self.assertTrue(self.fresh(self.user).has_perm('products.can_manage_inventory'))
+        # The next request's user object is answered from the cache
+        user = self.fresh(self.user)
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm('products.can_manage_inventory'))
+            self.assertFalse(user.has_perm('products.can_manage_orders'))
+        self.user.groups.remove(group)
+        self.assertFalse(self.fresh(self.user).has_perm('products.can_manage_inventory'))
+
+        # can_manage_orders is defined on CustomUser and on Order; either one grants the name
+        self.user.user_permissions.add(Permission.objects.get(codename='can_manage_orders', content_type__model='customuser'))
+        self.assertTrue(self.fresh(self.user).has_perm('products.can_manage_orders'))
+
+    def test_roles(self):
+        # The role is picked at signup, so it must not grant anything
+        self.user.role = 'admin'
+        self.user.save()
+        self.assertFalse(self.fresh(self.user).has_perm('products.delete_product'))
+        self.user.is_superuser = True
+        self.user.save()
+        self.assertTrue(self.fresh(self.user).has_perm('products.delete_product'))
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(permissions.user_bits(self.fresh(self.user)), 0)
+
+    def test_api_writes(self):
+        url = f'/products/api/v1/products/{self.product.pk}/'
+        self.assertEqual(self.client.get(url + '?format=json').status_code, 200)
+        self.assertEqual(self.client.patch(url, {'price': '12.00'}, content_type='application/json').status_code, 401)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.patch(url, {'price': '12.00'}, content_type='application/json').status_code, 403)
+        self.user.user_permissions.add(Permission.objects.filter(codename='can_update_product_quantity').first())
+        self.assertEqual(self.client.patch(url, {'price': '12.00'}, content_type='application/json').status_code, 200)
+
+        # Orders: the owner, or someone with an order permission
+        url = reverse('order-detail', args=[self.order.pk])
+        self.assertEqual(self.client.patch(url, {'quantity': 2}, content_type='application/json').status_code, 403)
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.patch(url, {'quantity': 2}, content_type='application/json').status_code, 200)
+
+    def test_signup_role_grants_nothing(self):
+        self.client.post(reverse('signup'), {
+            'username': 'mallory', 'password1': 'secret-pass-123', 'password2': 'secret-pass-123', 'role': 'admin',
+        })
+        self.client.force_login(CustomUser.objects.get(username='mallory'))
+        url = f'/products/api/v1/products/{self.product.pk}/'
+        self.assertEqual(self.client.patch(url, {'price': '0.01'}, content_type='application/json').status_code, 403)
+        self.assertEqual(self.client.delete(url).status_code, 403)
+
+
+class TokenAuthenticationTests(TestCase):
+    url = '/products/api/v1/orders/?format=json'
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='buyer', password='secret-pass-123')
+
+    def get(self, token, url=None):
+        return self.client.get(url or self.url, HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_token_for_password(self):
+        url = reverse('auth-token')
+        self.assertEqual(self.client.post(url, {'username': 'buyer', 'password': 'wrong'}).status_code, 400)
+        response = self.client.post(url, {'username': 'buyer', 'password': 'secret-pass-123'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user'], self.user.pk)
+        self.assertNotIn('sessionid', response.cookies)
+        self.assertEqual(self.get(response.json()['token']).status_code, 200)
+
+    def test_warm_token_costs_no_queries(self):
+        token = issue_token(self.user)
+        self.get(token)
+        with self.assertNumQueries(2):  # The list's own count and page, as for an anonymous request
+            response = self.get(token)
+        self.assertEqual(response.status_code, 200)
+
+        # Writes check the bitset of the token's user
+        url = reverse('order-detail', args=[Order.objects.create(
+            user=self.user, product=Product.objects.create(
+                name='Mouse', description='Mouse', price='2.00', category=Category.objects.create(name='Mice'), stock_quantity=5,
+            ), quantity=1,
+        ).pk])
+        response = self.client.patch(url, {'quantity': 2}, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200)
+
+    def test_rejected_tokens(self):
+        token = issue_token(self.user)
+        self.assertEqual(self.get(token[:-2] + 'xx').status_code, 401)
+        self.assertEqual(self.get(issue_token(self.user, max_age=-1)).status_code, 401)
+        self.assertEqual(self.get(token).status_code, 200)
+        # A new password revokes the tokens issued before it
+        self.user.set_password('another-pass-456')
+        self.user.save()
+        response = self.get(token)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="api"')
+
+    def test_sessions_load_their_user_from_the_database(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.get(issue_token(self.user)).status_code, 200)  # Now in the token LRU
+        # Deactivated as another process would, without reaching this process's LRU
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get(reverse('user-dashboard')).status_code, 302)  # To the login page
+
+
+class ProductListingTests(TestCase):
+    url = '/products/api/v1/products/'
+
+    def setUp(self):
+        product_cache.get_cache().clear()
+        self.user = CustomUser.objects.create_user(username='buyer', password='secret-pass-123')
+        self.laptops = Category.objects.create(name='Laptops')
+        with mock.patch.object(images, 'generate_logged'):
+            self.macbook = Product.objects.create(
+                sku='MBP-14', name='MacBook Pro', description='Laptop', price='10.00', category=self.laptops,
+                stock_quantity=2, image='product_images/pc2.jpg',
+            )
+
+    def listing(self, product):
+        return ProductListing.objects.get(pk=product.pk)
+
+    def test_list_matches_product_serializer(self):
+        Product.objects.filter(pk=self.macbook.pk).update(image_hash='a' * 64)
+        products_bulk_saved.send(sender=Product, product_ids=[self.macbook.pk], category_ids=[self.laptops.pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'format': 'json'})
+        self.assertFalse([query for query in queries if 'products_product"' in query['sql']])
+        expected = ProductSerializer(Product.objects.get(pk=self.macbook.pk), context={'request': response.wsgi_request}).data
+        self.assertEqual(response.json()['results'], [json.loads(JSONRenderer().render(expected))])
+
+    def test_kept_in_sync(self):
+        self.macbook.price = '12.50'
+        self.macbook.save()
+        self.assertEqual(self.listing(self.macbook).price, Decimal('12.50'))
+
+        place_order(self.user, self.macbook, 2)
+        listing = self.listing(self.macbook)
+        self.assertEqual((listing.stock_quantity, listing.in_stock), (0, False))
+        self.assertEqual(listing.updated_date, Product.objects.get(pk=self.macbook.pk).updated_date)
+        self.assertEqual(self.client.get(self.url, {'format': 'json', 'in_stock': 'false'}).json()['count'], 1)
+        self.assertEqual(self.client.get(self.url, {'format': 'json', 'in_stock': 'true'}).json()['count'], 0)
+
+        self.laptops.name = 'Notebooks'
+        self.laptops.save()
+        self.assertEqual(self.listing(self.macbook).category_name, 'Notebooks')
+        self.macbook.delete()
+        self.assertFalse(ProductListing.objects.exists())
+
+    def test_bulk_writes_keep_image_urls(self):
+        url = self.listing(self.macbook).image_url
+        self.assertTrue(url.endswith('product_images/pc2.jpg'))
+        products_bulk_saved.send(sender=Product, product_ids=[self.macbook.pk], category_ids=[self.laptops.pk])
+        self.assertEqual(self.listing(self.macbook).image_url, url)
+
+        Product.objects.filter(pk=self.macbook.pk).update(image='product_images/pc3.jpg')
+        products_bulk_saved.send(sender=Product, product_ids=[self.macbook.pk], category_ids=[self.laptops.pk])
+        self.assertTrue(self.listing(self.macbook).image_url.endswith('product_images/pc3.jpg'))
+
+    def test_rebuild_command(self):
+        Product.objects.bulk_create([
+            Product(name=f'Mouse {i}', description='Mouse', price='2.00', category=self.laptops, stock_quantity=i)
+            for i in range(3)
+        ])
+        self.assertEqual(ProductListing.objects.count(), 1)
+        out = io.StringIO()
+        call_command('rebuild_listings', stdout=out)
+        self.assertIn('4 products', out.getvalue())
+        self.assertEqual(ProductListing.objects.filter(in_stock=False).count(), 1)
+        # Pages are numbered over the created_date/id order, newest first
+        results = self.client.get(self.url, {'format': 'json'}).json()['results']
+        self.assertEqual([row['id'] for row in results], list(Product.objects.order_by('-created_date', '-id').values_list('pk', flat=True)))
+
+
+class ProductImportTests(TestCase):
+    url = '/products/api/v1/products/import/'
+
+    def setUp(self):
+        product_cache.get_cache().clear()
+        self.admin = CustomUser.objects.create_superuser(username='admin', password='secret-pass-123')
+        self.client.force_login(self.admin)
+        self.laptops = Category.objects.create(name='Laptops')
+
+    def post_csv(self, body):
+        return self.client.post(self.url, body, content_type='text/csv')
+
+    def test_csv_upsert(self):
+        response = self.post_csv(
+            'sku,name,description,price,stock_quantity,category\n'
+            'MBP-14,MacBook Pro,"Laptop, 14""",1999.99,5,Laptops\n'
+            'IP-16,iPhone 16,Phone,999,10,Phones\n'
+            'BAD-1,Broken,,not-a-price,1,Phones\n'
+        )
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual(response.json()['errors'], [{'row': 3, 'error': 'Invalid price or stock_quantity.'}])
+        self.assertEqual(Product.objects.get(sku='IP-16').category.name, 'Phones')
+
+        response = self.post_csv('sku,name,price,stock_quantity,category\nMBP-14,MacBook Pro M4,1799.00,7,Laptops\n')
+        self.assertEqual(response.json()['updated'], 1)
+        product = Product.objects.get(sku='MBP-14')
+        self.assertEqual((product.name, str(product.price), product.stock_quantity), ('MacBook Pro M4', '1799.00', 7))
+        # The search index follows bulk writes too
+        results = self.client.get('/products/api/v1/products/', {'q': 'm4', 'format': 'json'}).json()['results']
+        self.assertEqual([row['id'] for row in results], [product.pk])
+
+    def test_ndjson_and_bad_lines(self):
+        response = self.client.post(
+            self.url,
+            '{"sku": "A1", "name": "Mouse", "price": "9.50", "stock_quantity": 3, "category": "Laptops"}\n'
+            '{not json\n',
+            content_type='application/x-ndjson',
+        )
+        self.assertEqual((response.json()['created'], response.json()['rejected']), (1, 1))
+
+    def test_stock_net_of_cart_holds(self):
+        self.post_csv('sku,name,price,stock_quantity,category\nMBP-14,MacBook Pro,1999.99,10,Laptops\n')
+        product = Product.objects.get(sku='MBP-14')
+        place_hold(self.admin, product.pk, 3)
+        # The feed counts the held units as on hand
+        self.post_csv('sku,name,price,stock_quantity,category\nMBP-14,MacBook Pro,1999.99,12,Laptops\n')
+        product.refresh_from_db()
+        self.assertEqual((product.stock_quantity, product.held_quantity), (9, 3))
+        release_holds(self.admin)
+        product.refresh_from_db()
+        self.assertEqual((product.stock_quantity, product.held_quantity), (12, 0))
+
+    def test_requires_staff(self):
+        self.client.logout()
+        self.assertEqual(self.post_csv('sku,name\n').status_code, 401)
+        self.client.force_login(CustomUser.objects.create_user(username='staff', password='secret-pass-123', is_staff=True))
+        self.assertEqual(self.post_csv('sku,name\n').status_code, 403)
+
+
+class OrderTotalTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='buyer', password='secret-pass-123')
+        self.laptops = Category.objects.create(name='Laptops')
+        self.phones = Category.objects.create(name='Phones')
+        self.macbook = Product.objects.create(
+            name='MacBook Pro', description='Laptop', price='1500.00', category=self.laptops, stock_quantity=10,
+        )
+        self.iphone = Product.objects.create(
+            name='iPhone', description='Phone', price='800.00', category=self.phones, stock_quantity=10,
+        )
+
+    def test_price_is_captured_when_the_order_is_placed(self):
+        order = place_order(self.user, self.macbook, 2)
+        Product.objects.filter(pk=self.macbook.pk).update(price='999.00')
+        order = Order.objects.get(pk=order.pk)
+        self.assertEqual((str(order.unit_price), str(order.order_total())), ('1500.00', '3000.00'))
+        order.quantity = 3
+        order.save(update_fields=['quantity'])
+        self.assertEqual(str(Order.objects.get(pk=order.pk).total_price), '4500.00')
+
+        # Moving the order to another product prices it at that product's current price
+        order.product = self.iphone
+        order.save(update_fields=['product'])
+        order = Order.objects.get(pk=order.pk)
+        self.assertEqual((str(order.unit_price), str(order.total_price)), ('800.00', '2400.00'))
+
+    def test_bulk_orders_store_totals(self):
+        self.client.force_login(self.user)
+        self.client.post(
+            '/products/api/v1/orders/bulk/',
+            {'lines': [{'product': self.iphone.pk, 'quantity': 3}]},
+            content_type='application/json',
+        )
+        self.assertEqual(str(Order.objects.get().total_price), '2400.00')
+
+    def test_revenue_aggregates(self):
+        place_order(self.user, self.macbook, 1)
+        place_order(self.user, self.iphone, 2)
+        with self.assertNumQueries(1):
+            by_category = {row['product__category']: row['revenue'] for row in Order.objects.revenue_by_category()}
+        self.assertEqual(by_category, {self.laptops.pk: Decimal('1500'), self.phones.pk: Decimal('1600')})
+        self.assertEqual(Order.objects.revenue(), Decimal('3100'))
+        self.assertEqual([row['revenue'] for row in Order.objects.revenue_by_day()], [Decimal('3100')])
+        self.assertEqual(list(Order.objects.revenue_by_user()), [{'user': self.user.pk, 'revenue': Decimal('3100')}])
+
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_user(username='boss', password='secret-pass-123', is_staff=True)
+        self.user = CustomUser.objects.create_user(username='buyer', password='secret-pass-123')
+        self.laptops = Category.objects.create(name='Laptops')
+        self.macbook = Product.objects.create(
+            name='MacBook Pro', description='Laptop', price='1500.00', category=self.laptops, stock_quantity=10,
+        )
+        self.mouse = Product.objects.create(
+            name='Mouse', description='Mouse', price='20.00', category=self.laptops, stock_quantity=3,
+        )
+
+    def summary(self):
+        self.client.force_login(self.admin)
+        return self.client.get('/products/api/v1/analytics/', {'format': 'json'}).json()
+
+    def test_rollups_follow_order_writes(self):
+        order = place_order(self.user, self.macbook, 2)
+        place_orders(self.user, [(self.mouse.pk, 1), (self.macbook.pk, 1)])
+        order = Order.objects.get(pk=order.pk)
+        order.status = 'Shipped'
+        order.quantity = 1
+        # The order write only queues its change; the rollups wait for refresh()
+        with CaptureQueriesContext(connection) as queries:
+            order.save()
+        self.assertFalse([query for query in queries if 'dailysales' in query['sql'] or 'orderstatuscount' in query['sql']])
+        self.assertEqual(self.summary()['totals']['orders'], 0)
+        self.assertEqual(refresh(), 5)
+        summary = self.summary()
+        self.assertEqual(summary['totals'], {'orders': 3, 'quantity': 3, 'revenue': '3020.00'})
+        self.assertEqual(summary['statuses'], {'Pending': 2, 'Shipped': 1})
+        self.assertEqual([row['name'] for row in summary['top_products']], ['MacBook Pro', 'Mouse'])
+        self.assertEqual([row['name'] for row in summary['low_stock']], ['Mouse'])
+
+        order.delete()
+        refresh()
+        self.assertEqual(self.summary()['statuses'], {'Pending': 2})
+
+    def test_refresh_folds_more_buckets_than_one_statement_matches(self):
+        products = Product.objects.bulk_create([
+            Product(name=f'Cable {i}', description='Cable', price='1.00', category=self.laptops, stock_quantity=1)
+            for i in range(1500)
+        ])
+        day = timezone.now()
+        queue_changes(added=[(day.date(), product.pk, 'Pending', 1, Decimal('1.00')) for product in products])
+        self.assertEqual(refresh(), 1500)
+        self.assertEqual(DailySales.objects.count(), 1500)
+        self.assertEqual(self.summary()['totals'], {'orders': 1500, 'quantity': 1500, 'revenue': '1500.00'})
+
+    def test_full_refresh_catches_up_on_writes_that_skip_signals(self):
+        place_order(self.user, self.macbook, 1)
+        Order.objects.bulk_create([
+            Order(user=self.user, product=self.mouse, quantity=2, unit_price='20.00', total_price='40.00'),
+        ])
+        refresh()
+        self.assertEqual(refresh(), 0)  # Nothing new, counts stay put
+        self.assertEqual(self.summary()['totals'], {'orders': 1, 'quantity': 1, 'revenue': '1500.00'})
+        place_order(self.user, self.mouse, 1)  # Queued, then superseded by the rebuild
+        self.assertEqual(refresh(full=True), 2)
+        self.assertEqual(refresh(), 0)
+        self.assertEqual(self.summary()['totals'], {'orders': 3, 'quantity': 4, 'revenue': '1560.00'})
+        self.assertEqual(self.summary()['statuses'], {'Pending': 3})
+
+    def test_summary_query_count_does_not_grow_with_orders(self):
+        self.client.force_login(self.admin)
+        for quantity in (1, 2):
+            place_order(self.user, self.macbook, quantity)
+            refresh()
+            with self.assertNumQueries(9):  # Session, user, one query per summary section and the top product names
+                self.client.get('/products/api/v1/analytics/', {'format': 'json'})
+
+    def test_admin_dashboard_is_staff_only(self):
+        self.client.force_login(self.user)
+        self.assertRedirects(
+            self.client.get(reverse('admin-dashboard')), reverse('user-dashboard'), fetch_redirect_response=False,
+        )
+        self.client.force_login(self.admin)
+        self.assertContains(self.client.get(reverse('admin-dashboard')), 'Low Stock')
+
+
+class AsyncCatalogTests(TestCase):
+    def setUp(self):
+        product_cache.get_cache().clear()
+        category = Category.objects.create(name='Laptops')
+        self.products = [
+            Product.objects.create(
+                name=f'Laptop {i}', description='Laptop', price='10.00', category=category,
+                stock_quantity=i, image='product_images/pc1.jpg',
+            )
+            for i in range(15)
+        ]
+        self.factory = AsyncRequestFactory()
+
+    async def test_api_reads_match_the_drf_views(self):
+        pk = self.products[0].pk
+        for url, view, kwargs in (
+            ('/products/api/v1/products/?format=json&page=2&page_size=5', async_views.product_list_api, {}),
+            ('/products/api/v1/products/?format=json&q=laptop&in_stock=true', async_views.product_list_api, {}),
+            (f'/products/api/v1/products/{pk}/?format=json', async_views.product_detail_api, {'pk': pk}),
+        ):
+            product_cache.get_cache().clear()
+            expected = await self.async_client.get(url)
+            product_cache.get_cache().clear()
+            response = await view(self.factory.get(url), **kwargs)
+            self.assertEqual(response.content, expected.content)
+            self.assertEqual(response['ETag'], expected['ETag'])
+            request = self.factory.get(url, headers={'If-None-Match': response['ETag']})
+            self.assertEqual((await view(request, **kwargs)).status_code, 304)
+
+    async def test_other_requests_fall_back_to_the_drf_views(self):
+        response = await async_views.product_list_api(self.factory.get('/products/api/v1/products/?format=json&cursor='))
+        await sync_to_async(response.render)()  # Done by Django's handler outside of tests
+        self.assertEqual(len(json.loads(response.content)['results']), 10)
+        response = await async_views.product_list_api(self.factory.get('/products/api/v1/products/?format=json&page=9'))
+        self.assertEqual(response.status_code, 404)
+        response = await async_views.product_detail_api(self.factory.get('/products/api/v1/products/0/?format=json'), pk=0)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_catalog_pages(self):
+        response = await async_views.product_list(self.factory.get('/products/products/?page=2'))
+        self.assertContains(response, 'Laptop 2')
+        response = await async_views.product_detail(self.factory.get('/'), pk=self.products[0].pk)
+        self.assertContains(response, 'Laptop 0')
+
+
+class DatabaseProfileTests(TestCase):
+    def test_profiles(self):
+        sqlite = database_settings('sqlite', 'db.sqlite3')['default']
+        self.assertIn('PRAGMA journal_mode=WAL', sqlite['OPTIONS']['init_command'])
+        self.assertEqual(sqlite['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+
+        env = {'DJANGO_DB_HOST': 'primary', 'DJANGO_DB_REPLICA_HOST': 'replica'}
+        databases = database_settings('postgres', None, env=env)
+        self.assertEqual(databases['default']['CONN_MAX_AGE'], 0)  # Required with the driver pool
+        self.assertIn('pool', databases['default']['OPTIONS'])
+        self.assertEqual(databases['replica']['HOST'], 'replica')
+        self.assertEqual(databases['replica']['TEST'], {'MIRROR': 'default'})
+
+        pgbouncer = database_settings('postgres', None, env={'DJANGO_DB_POOL': 'pgbouncer'})['default']
+        self.assertTrue(pgbouncer['DISABLE_SERVER_SIDE_CURSORS'])
+        self.assertNotIn('pool', pgbouncer['OPTIONS'])
+
+    def test_replica_reads_only_inside_read_from_replica(self):
+        router = ReplicaRouter()
+        with read_from_replica():
+            self.assertIsNone(router.db_for_read(Product))  # No replica configured
+        with mock.patch.dict(settings.DATABASES, replica=settings.DATABASES['default']):
+            with read_from_replica():
+                self.assertEqual(router.db_for_read(Product), 'replica')
+                self.assertEqual(router.db_for_write(Product), 'default')
+            self.assertIsNone(router.db_for_read(Product))
+
+
+@override_settings(MIDDLEWARE=['products.profiling.ProfilingMiddleware', *settings.MIDDLEWARE], PROFILING_ENABLED=True)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        product_cache.get_cache().clear()
+        category = Category.objects.create(name='Electronics')
+        Product.objects.create(name='Phone', description='d', price='10.00', category=category, stock_quantity=5)
+
+    def test_server_timing_and_metrics(self):
+        response = self.client.get('/products/api/v1/products/?format=json')
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="[1-9]\d* queries", serialize;dur=[\d.]+$')
+
+        metrics = self.client.get('/metrics').content.decode()
+        self.assertIn('# TYPE django_request_duration_seconds histogram', metrics)
+        self.assertIn('django_request_db_queries_bucket{view="ProductList",method="GET",le="+Inf"}', metrics)
+        self.assertRegex(metrics, r'django_responses_total\{view="ProductList",method="GET",status="200"\} [1-9]')
+
+    def test_metrics_hidden_from_other_addresses(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.8').status_code, 404)
+
+    def test_slow_sampled_requests_are_profiled(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.multiple(profiling, SAMPLE_RATE=1, SLOW_REQUEST_MS=0, PROFILE_DIR=directory):
+                self.client.get('/products/api/v1/products/?format=json')
+            self.assertEqual(len([name for name in os.listdir(directory) if 'ProductList' in name]), 1)
+
+
+def png_upload(name='photo.png', size=(1000, 500), color='red'):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+@mock.patch.object(images, 'RENDER_IN_BACKGROUND', False)
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        product_cache.get_cache().clear()
+        self.category = Category.objects.create(name='Electronics')
+
+    def create_product(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(
+                name='Phone', description='d', price='10.00', category=self.category, stock_quantity=5, image=png_upload(),
+            )
+
+    def test_variants_rendered_on_save(self):
+        product = self.create_product()
+        product.refresh_from_db()
+        self.assertEqual(len(product.image_hash), 32)
+        from PIL import Image
+        for width in images.VARIANT_WIDTHS:
+            for format in images.VARIANT_FORMATS:
+                with Image.open(os.path.join(settings.MEDIA_ROOT, images.variant_name(product.image_hash, width, format))) as variant:
+                    self.assertEqual(variant.size, (width, width // 2))
+
+        self.assertTrue(product.get_image_url(150, 'webp').endswith(f'/{product.image_hash}-200w.webp'))
+        self.assertEqual(product.get_image_url(), product.image.url)
+        data = self.client.get(f'/products/api/v1/products/{product.pk}/?format=json').json()
+        self.assertTrue(data['thumbnails']['jpeg']['100'].endswith(f'{product.image_hash}-100w.jpeg'))
+        self.assertNotIn('image_hash', data)
+        self.assertContains(self.client.get(reverse('product-details', args=[product.pk])), '<source type="image/webp"')
+
+    def test_variants_follow_the_image(self):
+        product = self.create_product()
+        product.refresh_from_db()
+        digest = product.image_hash
+
+        with mock.patch.object(images, 'generate_variants') as generate, self.captureOnCommitCallbacks(execute=True):
+            product.name = 'Renamed'
+            product.save()
+        generate.assert_not_called()
+        self.assertEqual(Product.objects.get(pk=product.pk).image_hash, digest)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.image = png_upload('other.png', color='blue')
+            product.save()
+        self.assertNotIn(Product.objects.get(pk=product.pk).image_hash, ('', digest))
+
+        product.image = None
+        product.save()
+        self.assertEqual(Product.objects.get(pk=product.pk).image_hash, '')
+
+    def test_backfill_command(self):
+        product = self.create_product()
+        Product.objects.filter(pk=product.pk).update(image_hash='')
+        call_command('backfill_image_variants', workers=1, stdout=io.StringIO())
+        self.assertEqual(len(Product.objects.get(pk=product.pk).image_hash), 32)
+
+
+class StaticFilesTests(TestCase):
+    css = b'body { color: black; }\n' * 200
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        static_root, media_root = os.path.join(root.name, 'static'), os.path.join(root.name, 'media')
+        os.makedirs(static_root)
+        os.makedirs(os.path.join(media_root, 'product_images', 'variants', 'ab'))
+        for name in ('app.css', 'app.0123456789ab.css'):
+            with open(os.path.join(static_root, name), 'wb') as file:
+                file.write(self.css)
+            compress_file(os.path.join(static_root, name))
+        with open(os.path.join(static_root, 'staticfiles.json'), 'w') as manifest:
+            json.dump({'paths': {'app.css': 'app.0123456789ab.css'}, 'version': '1.1'}, manifest)
+        with open(os.path.join(media_root, 'product_images', 'variants', 'ab', 'abcd-100w.jpeg'), 'wb') as file:
+            file.write(b'jpeg')
+        self.enterContext(override_settings(
+            STATIC_ROOT=static_root, MEDIA_ROOT=media_root,
+            MIDDLEWARE=['products.staticfiles.StaticFilesMiddleware', *settings.MIDDLEWARE],
+        ))
+
+    def test_hashed_assets_are_immutable_and_precompressed(self):
+        response = self.client.get('/static/app.0123456789ab.css', HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.css)
+        self.assertEqual(int(response['Content-Length']), os.path.getsize(os.path.join(settings.STATIC_ROOT, 'app.css.gz')))
+
+        response = self.client.get('/static/app.css')
+        self.assertEqual(response['Cache-Control'], REVALIDATE)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(b''.join(response.streaming_content), self.css)
+
+        not_modified = self.client.get('/static/app.css', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(self.client.get('/static/missing.css').status_code, 404)
+
+    def test_ranges(self):
+        response = self.client.get('/static/app.css', HTTP_RANGE='bytes=5-9', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, self.css[5:10])
+        self.assertEqual(response['Content-Range'], f'bytes 5-9/{len(self.css)}')
+        self.assertNotIn('Content-Encoding', response)
+
+        self.assertEqual(self.client.get('/static/app.css', HTTP_RANGE='bytes=-4').content, self.css[-4:])
+        self.assertEqual(self.client.get('/static/app.css', HTTP_RANGE=f'bytes={len(self.css)}-').status_code, 416)
+        # A stale If-Range gets the whole file
+        self.assertEqual(self.client.get('/static/app.css', HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"old"').status_code, 200)
+
+    def test_media(self):
+        response = self.client.get('/media/product_images/variants/ab/abcd-100w.jpeg')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(self.client.get('/media/../static/app.css').status_code, 404)
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        fragments.get_cache().clear()
+        self.user = CustomUser.objects.create_user(username='buyer', password='secret-pass-123')
+        self.other = CustomUser.objects.create_user(username='other', password='secret-pass-123')
+        category = Category.objects.create(name='Laptops')
+        self.product = Product.objects.create(
+            name='ThinkPad', description='Laptop', price='10.00', category=category, stock_quantity=10,
+        )
+        self.order = Order.objects.create(user=self.user, product=self.product, quantity=1)
+        self.client.force_login(self.user)
+
+    def test_product_cards_follow_product_saves(self):
+        self.assertContains(self.client.get(reverse('product-list')), 'ThinkPad')
+        # A write that skips updated_date leaves the cached card in place
+        Product.objects.filter(pk=self.product.pk).update(name='Renamed')
+        self.assertContains(self.client.get(reverse('product-list')), 'ThinkPad')
+
+        self.product.refresh_from_db()
+        self.product.save()
+        self.assertContains(self.client.get(reverse('product-list')), 'Renamed')
+
+    def test_orders_section_follows_the_users_orders(self):
+        self.assertContains(self.client.get(reverse('user-dashboard')), 'Quantity: 1')
+        Order.objects.filter(pk=self.order.pk).update(quantity=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(user=self.other, product=self.product, quantity=1)
+        self.assertContains(self.client.get(reverse('user-dashboard')), 'Quantity: 1')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.refresh_from_db()
+            self.order.quantity = 3
+            self.order.save()
+        self.assertContains(self.client.get(reverse('user-dashboard')), 'Quantity: 3')
+
+
+class ThrottleTests(TestCase):
+    rates = {'client': '100/min', 'users': '2/min', 'products': '60/min'}
+
+    def setUp(self):
+        throttling.get_store().clear()
+        self.user = CustomUser.objects.create_user(username='buyer', password='secret-pass-123')
+
+    def test_token_bucket(self):
+        store = throttling.BucketStore(slots=16)
+        self.assertEqual([store.take('a', 2, 0.5, now=100) for _ in range(3)], [0, 0, 2])
+        self.assertEqual(store.take('b', 2, 0.5, now=100), 0)  # Buckets are per key
+        self.assertAlmostEqual(store.take('a', 2, 0.5, now=101), 1)
+        self.assertEqual(store.take('a', 2, 0.5, now=102), 0)
+        self.assertEqual(throttling.parse_rate('600/min:50'), (50, 10))
+
+    def test_processes_share_buckets_through_the_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'buckets')
+            worker_1, worker_2 = throttling.BucketStore(path, slots=16), throttling.BucketStore(path, slots=16)
+            self.assertEqual(worker_1.take('client', 1, 1, now=100), 0)
+            self.assertEqual(worker_2.take('client', 1, 1, now=100), 1)
+
+    def test_api_returns_429_with_retry_after(self):
+        with override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': self.rates}):
+            url = '/products/api/v1/users/?format=json'
+            self.assertEqual([self.client.get(url).status_code for _ in range(3)], [200, 200, 429])
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response['Retry-After'], '30')
+            # Other endpoints, and other clients, have buckets of their own
+            self.assertEqual(self.client.get('/products/api/v1/products/?format=json').status_code, 200)
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.2').status_code, 200)
+            self.client.force_login(self.user)
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    async def test_async_catalog_reads_are_throttled(self):
+        rates = {**self.rates, 'products': '1/min'}
+        with override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': rates}):
+            url = '/products/api/v1/products/?format=json'
+            statuses = [(await async_views.product_list_api(AsyncRequestFactory().get(url))).status_code for _ in range(2)]
+            self.assertEqual(statuses, [200, 429])
+            # Users are keyed as on the sync views, not by their address, and share one bucket with them
+            headers = {'Authorization': f'Bearer {issue_token(self.user)}'}
+            response = await async_views.product_list_api(AsyncRequestFactory().get(url, headers=headers))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual((await self.async_client.get(url, headers=headers)).status_code, 429)
+            detail = await async_views.product_detail_api(AsyncRequestFactory().get('/', headers=headers), pk=0)
+            self.assertEqual(detail.status_code, 429)
+
+
+class ApiBenchmarkTests(TestCase):
+    def test_report_and_baseline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = os.path.join(directory, 'baseline.json')
+            options = {
+                'skip_seed': True, 'only': 'api order ', 'repeat': 2, 'warmup': 0, 'output': os.devnull,
+                'stderr': io.StringIO(), 'slack_ms': 1000,  # Only the query count is meant to regress
+            }
+            call_command('bench_api', save_baseline=baseline, **options)
+            with open(baseline) as file:
+                report = json.load(file)
+            self.assertIn('api order delete', report['routes'])
+            self.assertEqual(report['routes']['api order create']['statuses'], {'201': 2})
+
+            report['routes']['api order create']['queries'] -= 1
+            with open(baseline, 'w') as file:
+                json.dump(report, file)
+            with self.assertRaisesMessage(CommandError, '1 routes failed or regressed'):
+                call_command('bench_api', baseline=baseline, **options)
@@ -0,0 +1,176 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+from functools import lru_cache
+from hashlib import blake2b
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+# API throttling with token buckets.
+#
+# Every client (the user, or the address for anonymous requests) has one bucket for
+# the whole API and one per endpoint scope. A bucket holds up to its burst of tokens
+# and refills at its rate; each request takes a token, and a request finding the
+# bucket empty gets a 429 with Retry-After set to when the next token arrives.
+#
+# The buckets live in a memory-mapped file (THROTTLE_STORE_PATH), so every worker
+# process on the host shares them without an external service. A check is a hash,
+# a few struct reads and one write under an fcntl lock, all in the page cache.
+#
+# Rates use DRF's 'number/period' form, with an optional ':burst' (the bucket size,
+# which defaults to number): '600/min' or '600/min:50'. A view picks its endpoint
+# limit with throttle_scope (a DEFAULT_THROTTLE_RATES entry) or a throttle_rate of its own.
+
+STORE_PATH = getattr(settings, 'THROTTLE_STORE_PATH', None)
+STORE_SLOTS = getattr(settings, 'THROTTLE_STORE_SLOTS', 65536)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    """(burst, tokens per second) for a rate such as '600/min' or '600/min:50'"""
+    rate, _, burst = rate.partition(':')
+    number, period = rate.split('/')
+    return int(burst or number), int(number) / PERIODS[period[0]]
+
+
+class BucketStore:
+    """Token buckets in a table of fixed-size slots in a shared mapping
+
+    Each slot is (key hash, tokens, last update). Key hashes come from blake2b,
+    since hash() differs between processes. A key probes PROBES slots from its home
+    slot; when all of them belong to other keys the least recently used one is
+    taken over, which can only hand the evicted client a full bucket. With path=None
+    the mapping is anonymous and the buckets are private to the process.
+    """
+    SLOT = struct.Struct('<Qdd')
+    PROBES = 8
+
+    def __init__(self, path=None, slots=STORE_SLOTS):
+        self.slots = slots
+        size = slots * self.SLOT.size
+        self.lock = threading.Lock()  # fcntl locks do not exclude threads of one process
+        if path is None:
+            self.fd = None
+            self.map = mmap.mmap(-1, size)
+        else:
+            self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            if os.fstat(self.fd).st_size < size:
+                os.ftruncate(self.fd, size)
+            self.map = mmap.mmap(self.fd, size)
+
+    def find(self, digest):
+        """The slot holding digest's bucket, or the one to put it in, and its (tokens, updated)"""
+        home = digest % self.slots
+        oldest = None
+        for probe in range(self.PROBES):
+            slot = (home + probe) % self.slots
+            found, tokens, updated = self.SLOT.unpack_from(self.map, slot * self.SLOT.size)
+            if found == digest:
+                return slot, tokens, updated
+            if found == 0:  # Slots are never freed, so the key is not further along
+                return slot, None, None
+            if oldest is None or updated < oldest[1]:
+                oldest = (slot, updated)
+        return oldest[0], None, None
+
+    def take(self, key, burst, rate, now=None):
+        """Take a token from key's bucket; 0 when there was one, else the seconds until there is"""
+        now = time.time() if now is None else now
+        digest = int.from_bytes(blake2b(key.encode(), digest_size=8).digest(), 'little') or 1  # 0 marks a free slot
+        with self.lock:
+            if self.fd is not None:
+                fcntl.lockf(self.fd, fcntl.LOCK_EX)
+            try:
+                slot, tokens, updated = self.find(digest)
+                if tokens is None:
+                    tokens = burst
+                else:
+                    tokens = min(burst, tokens + max(now - updated, 0) * rate)
+                if tokens >= 1:
+                    tokens, wait = tokens - 1, 0
+                else:
+                    wait = (1 - tokens) / rate
+                self.SLOT.pack_into(self.map, slot * self.SLOT.size, digest, tokens, now)
+            finally:
+                if self.fd is not None:
+                    fcntl.lockf(self.fd, fcntl.LOCK_UN)
+        return wait
+
+    def clear(self):
+        with self.lock:
+            self.map[:] = bytes(len(self.map))
+
+
+_store = None
+_store_pid = None
+
+
+def get_store():
+    # Opened again after a fork: record locks belong to the process that took them
+    global _store, _store_pid
+    if _store is None or _store_pid != os.getpid():
+        _store, _store_pid = BucketStore(STORE_PATH), os.getpid()
+    return _store
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Base class: one bucket per get_cache_key(), limited by get_rate()"""
+    scope = None
+
+    def get_rate(self, view):
+        rates = api_settings.DEFAULT_THROTTLE_RATES
+        if self.scope not in rates:
+            raise ImproperlyConfigured(f"No default throttle rate set for '{self.scope}' scope")
+        return rates[self.scope]
+
+    def get_client(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def get_cache_key(self, request, view):
+        raise NotImplementedError('.get_cache_key() must be overridden')
+
+    def allow_request(self, request, view):
+        rate = self.get_rate(view)
+        if rate is None:
+            return True
+        burst, per_second = parse_rate(rate)
+        self.wait_seconds = get_store().take(self.get_cache_key(request, view), burst, per_second)
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class ClientRateThrottle(TokenBucketThrottle):
+    """Every API request a user or address makes, whatever the endpoint"""
+    scope = 'client'
+
+    def get_cache_key(self, request, view):
+        return f'client:{self.get_client(request)}'
+
+
+class EndpointRateThrottle(TokenBucketThrottle):
+    """Requests a user or address makes to views sharing a throttle_scope
+
+    Views without a throttle_scope or throttle_rate are left to ClientRateThrottle.
+    """
+
+    def get_rate(self, view):
+        self.scope = getattr(view, 'throttle_scope', None) or type(view).__name__
+        rate = getattr(view, 'throttle_rate', None)
+        if rate is None and getattr(view, 'throttle_scope', None):
+            return super().get_rate(view)
+        return rate
+
+    def get_cache_key(self, request, view):
+        return f'{self.scope}:{self.get_client(request)}'
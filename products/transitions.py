@@ -0,0 +1,155 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, F, QuerySet, When
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import analytics, fragments
+from .models import Order, OrderEvent, Product
+from .signals import order_events_published, stock_changed
+
+# Order status transitions.
+#
+# TRANSITIONS lists the moves an order may make. transition() applies one move to any
+# number of orders, one set-based UPDATE per batch: cancelled quantities go back to
+# stock with one aggregated F() increment per product, and an OrderEvent per order is
+# written to the outbox in the same transaction. Queryset updates skip the Order
+# signals, so the analytics status counts, the dashboard fragment versions and the
+# product caches are brought along here. The edit form moves orders through
+# transition() too; single orders saved through the API get the same stock return and
+# outbox event from the post_save receiver.
+#
+# drain_outbox() (the drain_order_events command) publishes the events in batches by
+# sending order_events_published, and marks them published once every receiver is done.
+
+TRANSITIONS = {
+    'Pending': {'Processed', 'Cancelled'},
+    'Processed': {'Shipped', 'Cancelled'},
+    'Shipped': {'Delivered'},
+    'Delivered': set(),
+    'Cancelled': set(),
+}
+
+BATCH_SIZE = 1000
+OUTBOX_BATCH_SIZE = 500
+
+
+def check_transition(from_status, to_status):
+    """Raise ValidationError unless an order may go from from_status to to_status"""
+    if from_status != to_status and to_status not in TRANSITIONS.get(from_status, ()):
+        raise ValidationError(f'An order cannot go from {from_status} to {to_status}.')
+
+
+def restock(quantities):
+    """Put {product_id: quantity} back in stock with one UPDATE"""
+    Product.objects.filter(pk__in=quantities).update(
+        stock_quantity=Case(*(When(pk=pk, then=F('stock_quantity') + quantity) for pk, quantity in quantities.items())),
+        updated_date=timezone.now(),
+    )
+    category_ids = set(Product.objects.filter(pk__in=quantities).values_list('category_id', flat=True))
+    stock_changed.send(sender=Product, product_ids=list(quantities), category_ids=list(category_ids))
+
+
+def batches(orders, batch_size):
+    if isinstance(orders, QuerySet):
+        last_pk = 0
+        while True:
+            ids = list(orders.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return
+            yield ids
+            last_pk = ids[-1]
+    else:
+        ids = sorted(set(orders))
+        for start in range(0, len(ids), batch_size):
+            yield ids[start:start + batch_size]
+
+
+def transition(orders, to_status, batch_size=BATCH_SIZE):
+    """Move orders (a queryset or order ids) to to_status wherever TRANSITIONS allows it
+
+    Each batch of batch_size orders is moved in its own transaction. Orders whose
+    status does not allow the move are left alone. Returns how many were moved.
+    """
+    if to_status not in TRANSITIONS:
+        raise ValidationError(f'Unknown order status {to_status}.')
+    from_statuses = [status for status, targets in TRANSITIONS.items() if to_status in targets]
+    if isinstance(orders, QuerySet):
+        orders = orders.filter(status__in=from_statuses)
+    return sum(transition_batch(ids, from_statuses, to_status) for ids in batches(orders, batch_size))
+
+
+def transition_batch(ids, from_statuses, to_status):
+    with transaction.atomic():
+        rows = list(
+            Order.objects.select_for_update()
+            .filter(pk__in=ids, status__in=from_statuses)
+            .order_by('pk')
+            .values_list('pk', 'user_id', 'product_id', 'quantity', 'total_price', 'order_date', 'status')
+        )
+        if not rows:
+            return 0
+        Order.objects.filter(pk__in=[row[0] for row in rows]).update(status=to_status, updated_date=timezone.now())
+        OrderEvent.objects.bulk_create([
+            OrderEvent(order_id=pk, from_status=status, to_status=to_status) for pk, *_, status in rows
+        ])
+        if to_status == 'Cancelled':
+            quantities = Counter()
+            for _, _, product_id, quantity, _, _, _ in rows:
+                quantities[product_id] += quantity
+            restock(quantities)
+
+        # What the Order signal receivers would have queued for each save
+        analytics.queue_changes(
+            removed=[analytics.order_state(date, product_id, status, quantity, total) for _, _, product_id, quantity, total, date, status in rows],
+            added=[analytics.order_state(date, product_id, to_status, quantity, total) for _, _, product_id, quantity, total, date, _ in rows],
+        )
+        fragments.bump_orders_versions({user_id for _, user_id, *_ in rows})
+    return len(rows)
+
+
+def drain_outbox(batch_size=OUTBOX_BATCH_SIZE):
+    """Publish unpublished OrderEvents oldest first, one batch per transaction; returns how many"""
+    published = 0
+    while True:
+        with transaction.atomic():
+            events = list(
+                OrderEvent.objects.select_for_update(skip_locked=True)
+                .filter(published_date__isnull=True)
+                .order_by('pk')[:batch_size]
+            )
+            if not events:
+                break
+            # A receiver raising rolls the batch back, so it is sent again next time
+            order_events_published.send(sender=OrderEvent, events=events)
+            OrderEvent.objects.filter(pk__in=[event.pk for event in events]).update(published_date=timezone.now())
+        published += len(events)
+        if len(events) < batch_size:
+            break
+    return published
+
+
+def purge_published(days, batch_size=OUTBOX_BATCH_SIZE * 10):
+    """Delete events published more than days ago; returns how many"""
+    cutoff = timezone.now() - timedelta(days=days)
+    purged = 0
+    while ids := list(OrderEvent.objects.filter(published_date__lt=cutoff).values_list('pk', flat=True)[:batch_size]):
+        purged += OrderEvent.objects.filter(pk__in=ids).delete()[0]
+    return purged
+
+
+# ================== Signal receivers ==================
+
+@receiver(post_save, sender=Order)
+def record_saved_transition(sender, instance, created, update_fields=None, **kwargs):
+    previous = instance.__dict__.get('_loaded_status')
+    instance._loaded_status = instance.status
+    if created or previous is None or previous == instance.status:
+        return
+    OrderEvent.objects.create(order=instance, from_status=previous, to_status=instance.status)
+    if instance.status == 'Cancelled':
+        restock({instance.product_id: instance.quantity})
@@ -1,12 +1,21 @@
 from django.urls import path
-from . import views
+from . import views, async_views
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
 from django.urls import path
 
+# Catalog reads use the async views when served over ASGI
+if settings.ASGI_DEPLOYMENT:
+    product_list_api, product_detail_api = async_views.product_list_api, async_views.product_detail_api
+    product_list_page, product_detail_page = async_views.product_list, async_views.product_detail
+else:
+    product_list_api, product_detail_api = views.ProductList.as_view(), views.ProductDetail.as_view()
+    product_list_page, product_detail_page = views.product_list, views.product_detail
+
 urlpatterns = [
     # ================== API - User Management URLs ==================
+    path('api/v1/auth/token/', views.TokenCreate.as_view(), name='auth-token'),  # Bearer token for a username and password
     path('api/v1/users/', views.UserList.as_view(), name='user-list'),  # List and create users
     path('api/v1/users/<int:pk>/', views.UserDetail.as_view(), name='user-detail'),  # Retrieve, update, or delete a specific user
     path('api/v1/users/create/', views.UserCreate.as_view(), name='user-create'),  # Create a new user
@@ -14,8 +23,10 @@ urlpatterns = [
     path('api/v1/users/delete/<int:pk>/', views.UserDetail.as_view(), name='user-delete'),  # Delete a user (UserDetail already handles deletes)
 
     # ================== API - Product Management URLs ==================
-    path('api/v1/products/', views.ProductList.as_view(), name='product-list'),  
-    path('api/v1/products/<int:pk>/', views.ProductDetail.as_view(), name='product-detail'),  
+    path('api/v1/products/', product_list_api, name='product-list'),  
+    path('api/v1/products/<int:pk>/', product_detail_api, name='product-detail'),  
+    path('api/v1/products/import/', views.ProductImport.as_view(), name='product-import'),  # Bulk upsert from a CSV/NDJSON feed
+    path('api/v1/products/export/', views.ProductExport.as_view(), name='product-export'),  # Stream products as NDJSON
     path('api/v1/products/create/', views.ProductList.as_view(), name='create-product'),  
     path('api/v1/products/update/<int:pk>/', views.ProductDetail.as_view(), name='update-product'),  
     path('api/v1/products/delete/<int:pk>/', views.ProductDetail.as_view(), name='delete-product'), 
@@ -23,14 +34,25 @@ urlpatterns = [
     # ================== API - Order Management URLs ==================
     path('api/v1/orders/', views.OrderList.as_view(), name='order-list'),  
     path('api/v1/orders/<int:pk>/', views.OrderDetail.as_view(), name='order-detail'),  
+    path('api/v1/orders/bulk/', views.OrderBulkCreate.as_view(), name='order-bulk-create'),  # Place several orders at once
+    path('api/v1/orders/transition/', views.OrderTransition.as_view(), name='order-transition'),  # Move many orders to one status
+    path('api/v1/orders/export/', views.OrderExport.as_view(), name='order-export'),  # Stream orders as NDJSON
     path('api/v1/orders/create/', views.OrderList.as_view(), name='create-order'), 
     path('api/v1/orders/update/<int:pk>/', views.OrderDetail.as_view(), name='update-order'), 
     path('api/v1/orders/delete/<int:pk>/', views.OrderDetail.as_view(), name='delete-order'),  
 
+    # ================== API - Cart ==================
+    path('api/v1/cart/holds/', views.CartHoldList.as_view(), name='cart-hold-list'),  # Hold stock for a cart
+    path('api/v1/cart/holds/<int:pk>/', views.CartHoldDetail.as_view(), name='cart-hold-detail'),  # Give a hold back
+    path('api/v1/cart/checkout/', views.CartCheckout.as_view(), name='cart-checkout'),  # Turn held items into orders
+
+    # ================== API - Analytics ==================
+    path('api/v1/analytics/', views.AnalyticsSummary.as_view(), name='analytics-summary'),  # Sales and stock rollups, admin only
+
     # ================== Frontend - Authentication and Views ==================
     path('', views.home, name='home'),
-    path('products/', views.product_list, name='product-list'),  
-    path('product/<int:id>/', views.product_details, name='product-details'),
+    path('products/', product_list_page, name='product-list'),  
+    path('product/<int:pk>/', product_detail_page, name='product-details'),
     path('signup/', views.signup_view, name='signup'), 
     path('login/', views.login_view, name='login'),  
     path('logout/', views.logout_view, name='logout'), 
@@ -2,16 +2,41 @@ from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib import messages
 from django.views.decorators.http import require_POST
 from django.contrib.auth.forms import AuthenticationForm
-from django.contrib.auth import login, authenticate, logout
-from .models import CustomUser, Product, Order  # Import the Order model from models.py
-from rest_framework import generics, filters
+from django.contrib.auth import login, logout
+from .models import CustomUser, Product, ProductListing, Order, StockHold  # Import the Order model from models.py
+from rest_framework import generics, serializers
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.pagination import PageNumberPagination
-from .serializers import UserSerializer, ProductSerializer, OrderSerializer
+from rest_framework.pagination import PageNumberPagination, CursorPagination
+from rest_framework.utils.encoders import JSONEncoder
+from django.core.paginator import Paginator
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.db import transaction
+import json
+from .serializers import (
+    UserSerializer, ProductSerializer, ProductListingSerializer, OrderSerializer, BulkOrderSerializer, ValuesListSerializer,
+    AnalyticsSummarySerializer, StockHoldSerializer, CheckoutSerializer, OrderTransitionSerializer, TokenSerializer,
+)
+from .renderers import FastJSONRenderer
 from django.contrib.auth.decorators import login_required
 from .forms import CustomUserCreationForm, OrderForm 
-from django.db.models.signals import pre_save
-from django.dispatch import receiver
+from django.core.exceptions import PermissionDenied, ValidationError
+from .stock import place_order, place_orders
+from .holds import checkout, place_hold, release_holds
+from .transitions import transition
+from .search import ProductSearchFilter
+from . import cache as product_cache
+from . import analytics
+from . import fragments
+from .conditional import ConditionalDetailMixin, ConditionalListMixin
+from .routers import read_from_replica
+from .importing import ProductImporter, read_feed
+from .permissions import OrderAdminPermissions, OrderPermissions, ProductPermissions, has_any_perm
+from .authentication import TOKEN_MAX_AGE, issue_token
+from rest_framework.views import APIView
+from rest_framework.permissions import SAFE_METHODS, IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.renderers import BrowsableAPIRenderer
 
 # Custom pagination class for product views
 class ProductPagination(PageNumberPagination):
@@ -19,50 +44,305 @@ class ProductPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+# The order and user listings page the same way as products
+class OrderPagination(ProductPagination):
+    pass
+
+class UserPagination(ProductPagination):
+    pass
+
+# Keyset pagination: each page seeks past the last row seen instead of using OFFSET,
+# so deep pages cost the same as the first one
+class ProductCursorPagination(CursorPagination):
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_date', '-id')
+
+class OrderCursorPagination(ProductCursorPagination):
+    ordering = ('-order_date', '-id')
+
+class CursorPaginationMixin:
+    """Use cursor_pagination_class instead of pagination_class when the request has a ?cursor= parameter
+
+    An empty ?cursor= returns the first page; the next/previous links carry the cursor from there.
+    """
+    cursor_pagination_class = None
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            use_cursor = self.cursor_pagination_class is not None and 'cursor' in self.request.query_params
+            pagination_class = self.cursor_pagination_class if use_cursor else self.pagination_class
+            self._paginator = pagination_class() if pagination_class is not None else None
+        return self._paginator
+
+class NDJSONExportMixin:
+    """Stream the filtered queryset as newline-delimited JSON without loading it all into memory
+
+    Overrides list(), so the view's get() mixins (replica reads, validators) still apply.
+    """
+    http_method_names = ['get', 'head', 'options']
+    export_chunk_size = 2000
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        # The rows are read after get() has returned, so pin the database picked for this request
+        queryset = queryset.using(queryset.db)
+        serializer = self.get_serializer()
+
+        def rows():
+            for obj in queryset.iterator(chunk_size=self.export_chunk_size):
+                yield json.dumps(serializer.to_representation(obj), cls=JSONEncoder) + '\n'
+
+        return StreamingHttpResponse(rows(), content_type='application/x-ndjson')
+
+class FastListMixin:
+    """Serve list pages from .values() rows through ValuesListSerializer
+
+    The JSON is byte-identical to the ModelSerializer path but skips building model
+    instances and the per-field serializer walk.
+    """
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def list(self, request, *args, **kwargs):
+        fast = ValuesListSerializer(self.get_serializer_class(), self.get_serializer_context())
+        queryset = fast.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(fast.to_representation(page))
+        return Response(fast.to_representation(queryset))
+
 # ================== API Views ==================
 
 # User API Views
 class UserList(generics.ListCreateAPIView):
-    queryset = CustomUser.objects.all()
+    throttle_scope = 'users'
+    queryset = CustomUser.objects.order_by('id')
     serializer_class = UserSerializer
+    pagination_class = UserPagination
 
 class UserDetail(generics.RetrieveUpdateDestroyAPIView):
+    throttle_scope = 'users'
     queryset = CustomUser.objects.all()
     serializer_class = UserSerializer
 
 class UserCreate(generics.CreateAPIView):
+    throttle_scope = 'users'
     queryset = CustomUser.objects.all()
     serializer_class = UserSerializer
 
+# Bearer tokens for API clients; no session is created
+class TokenCreate(generics.GenericAPIView):
+    throttle_scope = 'tokens'
+    serializer_class = TokenSerializer
+    authentication_classes = []
+    permission_classes = []
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        return Response({'token': issue_token(user), 'expires_in': TOKEN_MAX_AGE, 'user': user.pk})
+
+class ReplicaReadMixin:
+    """Serve GETs from the read replica when one is configured, see products/routers.py"""
+
+    def get(self, request, *args, **kwargs):
+        with read_from_replica():
+            return super().get(request, *args, **kwargs)
+
 # Product API Views with search and filtering
-class ProductList(generics.ListCreateAPIView):
-    queryset = Product.objects.all()
+class ProductList(ReplicaReadMixin, ConditionalListMixin, CursorPaginationMixin, FastListMixin, generics.ListCreateAPIView):
+    throttle_scope = 'products'
+    permission_classes = [ProductPermissions]
+    # Reads page through the catalog read model (see products/listings.py); creates go to Product
+    queryset = ProductListing.objects.order_by('-created_date', '-id')
     serializer_class = ProductSerializer
     pagination_class = ProductPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    cursor_pagination_class = ProductCursorPagination
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter]
     filterset_fields = ['category', 'price']
-    search_fields = ['name']
+
+    def get_serializer_class(self):
+        return ProductListingSerializer if self.request.method in SAFE_METHODS else ProductSerializer
 
     def get_queryset(self):
         queryset = super().get_queryset()
         in_stock = self.request.query_params.get('in_stock')
         if in_stock is not None:
-            queryset = queryset.filter(stock_quantity__gt=0 if in_stock.lower() == 'true' else 0)
+            # stock_quantity is already net of cart holds, so the flag stays a plain indexed filter
+            queryset = queryset.filter(in_stock=in_stock.lower() == 'true')
         return queryset
 
-class ProductDetail(generics.RetrieveUpdateDestroyAPIView):
+    def get_validator_state(self, for_update=False):
+        key = product_cache.list_key(self.request) + ':validators'
+        state = product_cache.get_payload(key)
+        if state is None:
+            state = super().get_validator_state()
+            product_cache.set_payload(key, state)
+        return state
+
+    def list(self, request, *args, **kwargs):
+        # Pages are cached per normalized query string, see products/cache.py
+        key = product_cache.list_key(request)
+        data = product_cache.get_payload(key)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            product_cache.set_payload(key, data)
+        return Response(data)
+
+# Streams every product matching the ProductList filters
+class ProductExport(NDJSONExportMixin, ProductList):
+    throttle_scope = 'exports'
+
+# Bulk catalog upsert from a CSV or NDJSON request body, streamed in chunks
+class ProductImport(APIView):
+    permission_classes = [ProductPermissions]
+    feed_formats = {'text/csv': 'csv', 'application/x-ndjson': 'ndjson'}
+
+    def post(self, request, *args, **kwargs):
+        format = self.feed_formats.get(request.content_type.split(';')[0].strip())
+        if format is None:
+            return Response({'detail': 'Send text/csv or application/x-ndjson.'}, status=415)
+        summary = ProductImporter().run(read_feed(request.stream or [], format))
+        return Response(summary, status=200)
+
+class ProductDetail(ReplicaReadMixin, ConditionalDetailMixin, generics.RetrieveUpdateDestroyAPIView):
+    throttle_scope = 'products'
+    permission_classes = [ProductPermissions]
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
+    def get_validator_state(self, for_update=False):
+        # Writes check preconditions against the locked row, never the cache
+        if for_update:
+            return super().get_validator_state(for_update=True)
+        key = product_cache.validators_key(self.kwargs['pk'])
+        state = product_cache.get_payload(key)
+        if state is None:
+            state = super().get_validator_state()
+            if state is not None:
+                product_cache.set_payload(key, state)
+        return state
+
+    def retrieve(self, request, *args, **kwargs):
+        data = product_cache.get_detail(request, kwargs['pk'])
+        if data is None:
+            data = super().retrieve(request, *args, **kwargs).data
+            product_cache.set_detail(request, kwargs['pk'], data)
+        return Response(data)
+
 # Order API Views
-class OrderList(generics.ListCreateAPIView):
-    queryset = Order.objects.all()
+class OrderList(ConditionalListMixin, CursorPaginationMixin, FastListMixin, generics.ListCreateAPIView):
+    throttle_scope = 'orders'
+    queryset = Order.objects.select_related('user', 'product')
     serializer_class = OrderSerializer
-
-class OrderDetail(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Order.objects.all()
+    pagination_class = OrderPagination
+    cursor_pagination_class = OrderCursorPagination
+
+    def perform_create(self, serializer):
+        # Stock is decremented in the same transaction as the order insert
+        try:
+            serializer.instance = place_order(**serializer.validated_data)
+        except ValidationError as e:
+            raise serializers.ValidationError({'quantity': e.messages})
+
+class OrderExport(NDJSONExportMixin, OrderList):
+    throttle_scope = 'exports'
+
+# Places every line of the logged-in user's cart in one transaction and reports each line's outcome
+class OrderBulkCreate(generics.GenericAPIView):
+    throttle_scope = 'orders'
+    permission_classes = [IsAuthenticated]
+    serializer_class = BulkOrderSerializer
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lines = [(line['product'], line['quantity']) for line in serializer.validated_data['lines']]
+        try:
+            results = place_orders(request.user, lines)
+        except ValidationError as e:
+            raise serializers.ValidationError({'lines': e.messages})
+        created = any(result['status'] == 'created' for result in results)
+        return Response({'results': results}, status=201 if created else 400)
+
+class OrderDetail(ConditionalDetailMixin, generics.RetrieveUpdateDestroyAPIView):
+    throttle_scope = 'orders'
+    permission_classes = [OrderPermissions]
+    queryset = Order.objects.select_related('user', 'product')
     serializer_class = OrderSerializer
 
+# Moves many orders to one status at once, for fulfillment jobs (see products/transitions.py)
+class OrderTransition(generics.GenericAPIView):
+    serializer_class = OrderTransitionSerializer
+    permission_classes = [OrderAdminPermissions]
+    throttle_scope = 'orders'
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        order_ids = set(serializer.validated_data['orders'])
+        updated = transition(order_ids, serializer.validated_data['status'])
+        return Response({'updated': updated, 'skipped': len(order_ids) - updated})
+
+# Cart holds: stock set aside for a while, then checked out or given back (see products/holds.py).
+# Every cart view acts on the logged-in user's own holds
+class CartHoldList(generics.ListCreateAPIView):
+    throttle_scope = 'cart'
+    permission_classes = [IsAuthenticated]
+    serializer_class = StockHoldSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['product']
+
+    def get_queryset(self):
+        return StockHold.objects.filter(user=self.request.user, expires_at__gt=timezone.now()).order_by('pk')
+
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        try:
+            serializer.instance = place_hold(self.request.user, data['product'].pk, data['quantity'])
+        except ValidationError as e:
+            raise serializers.ValidationError({'quantity': e.messages})
+
+class CartHoldDetail(generics.RetrieveDestroyAPIView):
+    throttle_scope = 'cart'
+    permission_classes = [IsAuthenticated]
+    serializer_class = StockHoldSerializer
+
+    def get_queryset(self):
+        return StockHold.objects.filter(user=self.request.user)
+
+    def perform_destroy(self, instance):
+        release_holds(instance.user, [instance.pk])
+
+# Turns the user's held items into orders in one transaction
+class CartCheckout(generics.GenericAPIView):
+    throttle_scope = 'cart'
+    permission_classes = [IsAuthenticated]
+    serializer_class = CheckoutSerializer
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            orders = checkout(request.user, serializer.validated_data.get('holds'))
+        except ValidationError as e:
+            raise serializers.ValidationError({'holds': e.messages})
+        return Response({'orders': OrderSerializer(orders, many=True).data}, status=201)
+
+# Sales and inventory numbers for the admin dashboard, read from the analytics rollups
+class AnalyticsSummary(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            days = min(max(int(request.query_params.get('days', analytics.SUMMARY_DAYS)), 1), 366)
+        except ValueError:
+            raise serializers.ValidationError({'days': 'A whole number of days is required.'})
+        return Response(AnalyticsSummarySerializer(analytics.summary(days)).data)
+
 # ================== Template Views ==================
 
 # User Signup View (Form-based)
@@ -81,18 +361,14 @@ def signup_view(request):
 # User Login View
 def login_view(request):
     if request.method == 'POST':
-        form = AuthenticationForm(data=request.POST)
+        form = AuthenticationForm(request, data=request.POST)
         if form.is_valid():
-            username = form.cleaned_data.get('username')
-            password = form.cleaned_data.get('password')
-            user = authenticate(request, username=username, password=password)
-            if user is not None:
-                login(request, user)
-                messages.success(request, 'Login successful!')
-                # Redirect to the appropriate dashboard based on user role
-                return redirect('admin-dashboard' if getattr(user, 'role', None) == 'admin' else 'user-dashboard')
-            else:
-                messages.error(request, 'Invalid username or password')
+            # The form has already authenticated the user; checking the password again costs a second hash
+            user = form.get_user()
+            login(request, user)
+            messages.success(request, 'Login successful!')
+            # Redirect to the appropriate dashboard based on user role
+            return redirect('admin-dashboard' if getattr(user, 'role', None) == 'admin' else 'user-dashboard')
     else:
         form = AuthenticationForm()
 
@@ -106,24 +382,32 @@ def logout_view(request):
     return redirect('home')
 
 # User Dashboard
+DASHBOARD_PAGE_SIZE = 12
+
 @login_required
 def user_dashboard(request):
-    orders = Order.objects.filter(user=request.user)
-    products = Product.objects.all()
+    # The template reads each order's product, so fetch them in the same query
+    orders = Order.objects.filter(user=request.user).select_related('product')
+    products = ProductListing.objects.order_by('-created_date', '-id')
+    orders_page = Paginator(orders, DASHBOARD_PAGE_SIZE).get_page(request.GET.get('orders_page'))
     context = {
-        'orders': orders,
-        'products': products,
+        'orders': orders_page,
+        # The orders section is cached per user; its rows are only fetched on a miss
+        'orders_fragment': fragments.orders_fragment_key(request, orders_page.number),
+        'products': Paginator(products, DASHBOARD_PAGE_SIZE).get_page(request.GET.get('page')),
     }
     return render(request, 'user-dashboard.html', context)
 
 # Admin Dashboard
 @login_required
 def admin_dashboard(request):
-    return render(request, 'admin-dashboard.html')  # Admin dashboard template needs to be created
+    if not (request.user.is_staff or request.user.role == 'admin'):
+        return redirect('user-dashboard')
+    return render(request, 'admin-dashboard.html', {'summary': analytics.summary()})
 
 # Product Detail View (Template-based)
 def product_detail(request, pk):
-    product = get_object_or_404(Product, pk=pk)
+    product = product_cache.get_product(pk)
     return render(request, 'product-detail.html', {'product': product})
 
 # Make Order View
@@ -134,31 +418,41 @@ def make_order(request):
     quantity = int(request.POST.get('quantity'))
     product = get_object_or_404(Product, pk=product_id)
 
-    if quantity > product.stock_quantity:
-        messages.error(request, "Not enough stock available.")
+    # Create order and update stock atomically
+    try:
+        place_order(request.user, product, quantity)
+    except ValidationError as e:
+        messages.error(request, e.messages[0])
         return redirect('product-detail', pk=product_id)
+    messages.success(request, "Order placed successfully.")
 
-    # Create order and update stock
-    try:
-        order = Order.objects.create(user=request.user, product=product, quantity=quantity)
-        product.stock_quantity -= quantity
-        product.save()
-        messages.success(request, "Order placed successfully.")
-    except Exception as e:
-        messages.error(request, f"Error placing order: {str(e)}")
-    
     return redirect('user-dashboard')
 
 # Order Edit View (Form-based)
 @login_required
 def edit_order(request, order_id):
     order = get_object_or_404(Order, id=order_id)
+    # Owners edit their own orders; anyone else needs an order permission, as in the API
+    if order.user_id != request.user.pk and not has_any_perm(request.user, OrderPermissions.perms_map['PATCH']):
+        raise PermissionDenied
+    previous_status = order.status
     if request.method == 'POST':
         form = OrderForm(request.POST, instance=order)
         if form.is_valid():
-            form.save()
-            messages.success(request, 'Order updated successfully.')
-            return redirect('user-dashboard')
+            status, order.status = order.status, previous_status
+            try:
+                with transaction.atomic():
+                    order.save(update_fields=['product', 'quantity', 'updated_date'])
+                    # Status changes take the same path as the transition API: checked under
+                    # the row lock, with their outbox event (and restock) in this transaction
+                    if status != previous_status and not transition([order.pk], status):
+                        raise ValidationError(f'The order is no longer {previous_status}.')
+            except ValidationError as e:
+                order.status = previous_status
+                form.add_error('status', e)
+            else:
+                messages.success(request, 'Order updated successfully.')
+                return redirect('user-dashboard')
     else:
         form = OrderForm(instance=order)
     return render(request, 'edit-order.html', {'form': form, 'order': order})
@@ -178,24 +472,9 @@ def home(request):
     return render(request, 'home.html')
 
 # Product List View (Template-based)
-def product_list(request):
-    products = Product.objects.all()
-    return render(request, 'product-list.html', {'products': products})
-
-
-@receiver(pre_save, sender=Order)
-def calculate_total_price(sender, instance, **kwargs):
-    instance.total_price = instance.quantity * instance.product.price
-
-def product_details(request, id):
-    product = get_object_or_404(Product, id=id)
-    return render(request, 'products/product-details.html', {'product': product})
-
-
+PRODUCT_LIST_PAGE_SIZE = 12
 
 def product_list(request):
-    products = Product.objects.all()
+    paginator = Paginator(ProductListing.objects.order_by('-created_date', '-id'), PRODUCT_LIST_PAGE_SIZE)
+    products = paginator.get_page(request.GET.get('page'))
     return render(request, 'product-list.html', {'products': products})
-
-
-